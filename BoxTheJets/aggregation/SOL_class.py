@@ -4,11 +4,13 @@ from IPython.display import Image, display
 from dateutil.parser import parse
 import matplotlib.animation as animation
 from .workflow import Jet
-from .workflow import get_subject_image, get_box_edges
+from .workflow import get_subject_image, get_box_edges, prefetch_subjects
 from shapely.geometry import Polygon
+import os
 import json
 import tqdm
 from .meta_file_handler import MetaFile
+from solarjets_common.gif_writer import GifStreamWriter, render_gifs
 
 
 class NpEncoder(json.JSONEncoder):
@@ -192,6 +194,52 @@ def json_import_list(input_file):
     return clusters
 
 
+def create_gifs(clusters, outdir='.', processes=None, cache_dir='frame_cache', overwrite=False, dpi=250, fps=5):
+    '''
+        Create the gifs (see `JetCluster.create_gif`) for a list of JetCluster
+        objects on a pool of worker processes. Each gif is saved as
+        `<cluster ID>.gif` in `outdir`, and gifs that are up to date are skipped
+        Inputs
+            ------
+            clusters : list or str
+                list of JetCluster objects, or path to the json file with
+                the JetCluster objects (see `json_import_list`). In that case,
+                only the gifs which are older than the json file are created again
+            outdir : str
+                directory where the gifs are saved
+            processes : int
+                number of worker processes (default: number of CPUs). Each worker
+                keeps its own in-memory frame cache (up to `FRAME_CACHE_BYTES`),
+                so the total memory used grows with the number of processes
+            cache_dir : str
+                directory where the subject frames and metadata are cached, shared by the workers
+            overwrite : bool
+                create all the gifs, even if they exist
+            dpi : int
+                resolution of the gifs
+            fps : float
+                frames per second of the gifs
+        Outputs
+            ------
+            times : dict
+                time taken (in seconds) for each created gif
+            errors : dict
+                exception raised for each gif that failed
+            skipped : list
+                gifs which were already up to date
+    '''
+    sources = []
+    if isinstance(clusters, str):
+        sources = [clusters]
+        clusters = json_import_list(clusters)
+
+    os.makedirs(outdir, exist_ok=True)
+    outputs = [os.path.join(outdir, f'{cluster.ID}.gif') for cluster in clusters]
+
+    return render_gifs(JetCluster.create_gif, clusters, outputs, processes=processes, cache_dir=cache_dir,
+                       sources=sources, overwrite=overwrite, dpi=dpi, fps=fps, progress=False)
+
+
 class SOL:
     '''
         Single data class to handle all function related to a HEK/SOL_event
@@ -278,23 +326,57 @@ class SOL:
 
         return obs_time
 
-    def plot_subjects(self, SOL_event):
+    def iter_subjects(self, SOL_event, frames=range(15), nprefetch=4, store=None):
         '''
-        Plot all the subjects with aggregation data of a given SOL event
+        Iterate over the subjects of a given SOL event, while the frames of the
+        next subjects are fetched in the background (see `prefetch_subjects`)
         Inputs
         ------
             SOL_event: str
                 name of the SOL event used in Zooniverse
+            frames: list
+                frames of each subject to fetch (default: all)
+            nprefetch: int
+                number of subjects to fetch ahead of the current one
+            store: `FrameStore`
+                frame store to save the subjects to (default: None, the
+                frames are only kept in memory)
+
+        Outputs
+        -------
+            result : tuple
+                generator of (subject, images, error) tuples
         '''
-        subjects = self.get_subjects(SOL_event)
+        return prefetch_subjects(self.get_subjects(SOL_event), frames, nprefetch, store)
 
-        for subject in subjects:
+    def plot_subjects(self, SOL_event, nprefetch=4, store=None):
+        '''
+        Plot all the subjects with aggregation data of a given SOL event.
+        The image of the next subjects is fetched while the current one is plotted
+        Inputs
+        ------
+            SOL_event: str
+                name of the SOL event used in Zooniverse
+            nprefetch: int
+                number of subjects to fetch ahead of the current one
+            store: `FrameStore`
+                frame store to save the subjects to (default: None, the
+                frames are only kept in memory)
+        '''
+        subjects = []
+        for subject in self.get_subjects(SOL_event):
             # check to make sure that these subjects had classification
             subject_rows = self.aggregator.points_data[:
                                                        ][self.aggregator.points_data['subject_id'] == subject]
             nsubjects = len(subject_rows['data.frame0.T1_tool0_points_x'])
             if nsubjects > 0:
-                self.aggregator.plot_frame_info(subject, task='T1')
+                subjects.append(subject)
+
+        # only the middle frame is plotted, so it is the only one fetched
+        for subject, _, error in prefetch_subjects(subjects, [7], nprefetch, store):
+            if error is not None:
+                raise error
+            self.aggregator.plot_frame_info(subject, task='T1')
 
     def get_start_end_time(self, SOL_event):
         '''
@@ -546,44 +628,90 @@ class JetCluster:
         '''
         setattr(self, name_attr, value_attr)
 
-    def create_gif(self, output):
+    def create_gif(self, output, dpi=250, fps=5, progress=True, nprefetch=2, store=None):
         '''
             Create a gif of the jet objects showing the
-            image and the plots from the `Jet.plot()` method
+            image and the plots from the `Jet.plot()` method.
+            The image and the jet plots are drawn once and updated
+            for each frame, and the frames are encoded as they are drawn
         Inputs
         ------
             output: str
                 name of the exported gif
+            dpi: int
+                resolution of the figure
+            fps: float
+                frames per second of the gif
+            progress: bool
+                show a progress bar
+            nprefetch: int
+                number of subjects whose frames are fetched in the background
+                ahead of the one being drawn
+            store: `FrameStore`
+                frame store to save the subjects to (default: None, the
+                frames are only kept in memory)
         '''
-        fig, ax = plt.subplots(1, 1, dpi=250)
+        fig, ax = plt.subplots(1, 1, dpi=dpi)
 
         # create a temp plot so that we can get a size estimate
         subject0 = self.jets[0].subject
 
-        ax.imshow(get_subject_image(subject0, 0))
+        im1 = ax.imshow(get_subject_image(subject0, 0, store=store))
         ax.axis('off')
         fig.tight_layout(pad=0)
 
-        # loop through the frames and plot
-        ims = []
-        for jet in tqdm.tqdm(self.jets):
-            subject = jet.subject
-            for i in range(15):
-                img = get_subject_image(subject, i)
-
-                # first, plot the image
-                im1 = ax.imshow(img)
+        # the jet whose details are currently plotted
+        plotted = {'jet': None, 'artists': []}
 
-                # for each jet, plot all the details
-                # and add each plot artist to the list
-                jetims = jet.plot(ax, plot_sigma=False)
-
-                # combine all the plot artists together
-                ims.append([im1, *jetims])
+        def frames():
+            # the frames of the next jets are fetched while the current one
+            # is drawn, and `get_subject_image` reads them from the frame cache
+            subjects = prefetch_subjects([jet.subject for jet in self.jets], range(15), nprefetch, store)
+            fetched = set()
+            try:
+                for jet in self.jets:
+                    # several jets can share a subject, which is only fetched once
+                    while int(jet.subject) not in fetched:
+                        subject, _, error = next(subjects)
+                        if error is not None:
+                            raise error
+                        fetched.add(subject)
+                    for i in range(15):
+                        yield jet, i
+            finally:
+                subjects.close()
+
+        def init():
+            return [im1]
+
+        def animate(frame):
+            jet, i = frame
+
+            if jet is not plotted['jet']:
+                # replace the plot of the previous jet with the details of this jet
+                for artist in plotted['artists']:
+                    artist.remove()
+                plotted['jet'] = jet
+                plotted['artists'] = jet.plot(ax, plot_sigma=False)
+
+            # update the image in place
+            img = get_subject_image(jet.subject, i, store=store)
+            if img.shape[:2] != im1.get_array().shape[:2]:
+                im1.set_extent((-0.5, img.shape[1] - 0.5, img.shape[0] - 0.5, -0.5))
+            im1.set_data(img)
+
+            return [im1, *plotted['artists']]
+
+        nframes = 15 * len(self.jets)
+        ani = animation.FuncAnimation(fig, animate, frames=frames, init_func=init, interval=1000 / fps,
+                                      blit=True, save_count=nframes, cache_frame_data=False)
 
         # save the animation as a gif
-        ani = animation.ArtistAnimation(fig, ims)
-        ani.save(output, writer='imagemagick')
+        with tqdm.tqdm(total=nframes, disable=not progress) as pbar:
+            ani.save(output, writer=GifStreamWriter(fps=fps), dpi=dpi,
+                     progress_callback=lambda i, n: pbar.update(1))
+
+        plt.close(fig)
 
     def json_export(self, output):
         '''
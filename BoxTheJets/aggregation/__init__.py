@@ -3,3 +3,12 @@ from .workflow import *
 from .SOL_class import *
 from .image_handler import *
 from .meta_file_handler import *
+from .classification_reader import *
+from solarjets_common.fetcher import *
+from .frame_store import *
+from solarjets_common.gif_writer import *
+from solarjets_common.instrumentation import *
+
+# time the modules of this package too when the instrumentation is enabled
+register_package(__name__)
+enable_from_environment()
@@ -0,0 +1,200 @@
+import csv
+import sys
+import json
+import re
+import numpy as np
+from astropy.table import Table
+
+# the JSON blobs in the classification export can be larger than the default
+# field size limit of the csv module
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+# matches the `subject_data` of subjects that were not retired
+# at the time of classification
+RETIRED_NULL = re.compile(r'"retired"\s*:\s*null')
+
+
+def parse_zooniverse_time(timestring):
+    '''
+        Convert a timestamp from the Zooniverse exports
+        (e.g. '2022-03-08T18:26:22.102Z' or '2022-03-08 18:26:22 UTC')
+        to a `numpy.datetime64`
+
+        Inputs
+        ------
+        timestring : str
+            Timestamp in UTC
+
+        Outputs
+        -------
+        time : numpy.datetime64
+            The corresponding time, or NaT if `timestring` is None
+    '''
+    if timestring is None:
+        return np.datetime64('NaT')
+
+    timestring = timestring.replace(' UTC', '').rstrip('Z').replace(' ', 'T')
+
+    return np.datetime64(timestring)
+
+
+class ClassificationRecord:
+    '''
+        Single row of the Zooniverse classification export. The plain columns are
+        available as strings through indexing (e.g. `record['user_name']`), while the
+        JSON columns (`metadata`, `annotations` and `subject_data`) are only decoded
+        when they are first accessed through the corresponding attribute.
+    '''
+
+    def __init__(self, row):
+        '''
+            Inputs
+            ------
+            row : dict
+                Row of the classification export (column name -> string value)
+        '''
+        self.row = row
+        self.parsed_json = {}
+
+    def __getitem__(self, key):
+        return self.row[key]
+
+    def get_json(self, key):
+        '''
+            Decode (and cache) the JSON column `key`
+        '''
+        if key not in self.parsed_json:
+            self.parsed_json[key] = json.loads(self.row[key])
+        return self.parsed_json[key]
+
+    @property
+    def metadata(self):
+        return self.get_json('metadata')
+
+    @property
+    def annotations(self):
+        return self.get_json('annotations')
+
+    @property
+    def subject_data(self):
+        return self.get_json('subject_data')
+
+    @property
+    def subject_id(self):
+        return int(self.row['subject_ids'].split(';')[0])
+
+    @property
+    def user(self):
+        '''
+            Unique identifier for the volunteer. Uses the user ID for logged in
+            volunteers and the user name (which contains a hash of the IP address)
+            for those who were not logged in
+        '''
+        if self.row.get('user_id'):
+            return self.row['user_id']
+        return self.row['user_name']
+
+    def get_retirement(self):
+        '''
+            Get the retirement information of the subject at the time of
+            this classification. The `subject_data` JSON is only decoded if the
+            subject has been retired
+
+            Outputs
+            -------
+            retired : bool
+                Whether the subject was retired
+            retired_at : numpy.datetime64
+                Retirement time (NaT if not retired or not available)
+        '''
+        if RETIRED_NULL.search(self.row['subject_data']) is not None:
+            return False, np.datetime64('NaT')
+
+        retired = self.subject_data[f'{self.subject_id}']['retired']
+        if retired is None:
+            return False, np.datetime64('NaT')
+
+        retired_at = retired.get('retired_at') if isinstance(retired, dict) else None
+
+        return True, parse_zooniverse_time(retired_at)
+
+
+def iter_classifications(classification_file='box-the-jets-classifications.csv', chunk_size=10000):
+    '''
+        Stream the classification export in chunks, without loading the full file
+
+        Inputs
+        ------
+        classification_file : str
+            path to the classification file (in Zooniverse format)
+        chunk_size : int
+            Number of classifications in each chunk
+
+        Outputs
+        -------
+        chunk : list
+            Generator of lists of `ClassificationRecord` objects with (at most)
+            `chunk_size` elements each
+    '''
+    assert chunk_size > 0, "chunk_size must be positive"
+
+    with open(classification_file, 'r', newline='') as infile:
+        reader = csv.DictReader(infile)
+
+        chunk = []
+        for row in reader:
+            chunk.append(ClassificationRecord(row))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+
+        if len(chunk) > 0:
+            yield chunk
+
+
+def get_classification_stats(classification_file='box-the-jets-classifications.csv', chunk_size=10000):
+    '''
+        Compute per-subject statistics from the classification export by
+        streaming through the file in chunks
+
+        Inputs
+        ------
+        classification_file : str
+            path to the classification file (in Zooniverse format)
+        chunk_size : int
+            Number of classifications read into memory at once
+
+        Outputs
+        -------
+        stats : astropy.table.Table
+            Table with the columns `subject_id`, `classification_count`,
+            `user_count` (number of unique volunteers), `retired` and `retired_at`
+            (ISO format string, empty if not retired) for each subject
+    '''
+    counts = {}
+    users = {}
+    retired_at = {}
+
+    for chunk in iter_classifications(classification_file, chunk_size):
+        for record in chunk:
+            subject = record.subject_id
+
+            counts[subject] = counts.get(subject, 0) + 1
+            users.setdefault(subject, set()).add(record.user)
+
+            if subject not in retired_at:
+                retired, time = record.get_retirement()
+                if retired:
+                    retired_at[subject] = time
+
+    subjects = np.asarray(sorted(counts.keys()), dtype=int)
+
+    stats = Table()
+    stats['subject_id'] = subjects
+    stats['classification_count'] = np.asarray([counts[s] for s in subjects], dtype=int)
+    stats['user_count'] = np.asarray([len(users[s]) for s in subjects], dtype=int)
+    stats['retired'] = np.asarray([s in retired_at for s in subjects], dtype=bool)
+    stats['retired_at'] = np.asarray([str(retired_at[s]) if s in retired_at else ''
+                                      for s in subjects], dtype=str)
+
+    return stats
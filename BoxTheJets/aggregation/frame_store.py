@@ -0,0 +1,222 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+import tqdm
+from io import BytesIO
+from skimage import io
+from solarjets_common.fetcher import default_fetcher, get_subject_metadata, get_frame_url
+from solarjets_common.image_utils import resize_image, to_rgb_uint8
+from solarjets_common.instrumentation import add_count, record_cache
+
+
+class FrameStore:
+    '''
+        Local store of the subject images. All 15 frames of a subject are saved
+        as one (15, height, width, 3) uint8 array in `<path>/<subject>.npy`, which
+        is memory-mapped when read, so that the frames are only downloaded once
+        and are read without copying
+    '''
+
+    def __init__(self, path='frame_store', max_open=32):
+        '''
+            Inputs
+            ------
+            path : str
+                Directory of the store
+            max_open : int
+                Number of memory-mapped subjects that are kept open. The least
+                recently used ones are closed once the arrays that were
+                returned for them are no longer referenced
+        '''
+        self.path = path
+        self.max_open = max_open
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_file(self, subject):
+        '''
+            Get the path of the file with the frames of a subject
+        '''
+        return os.path.join(self.path, f'{int(subject)}.npy')
+
+    def __contains__(self, subject):
+        return os.path.exists(self.get_file(subject))
+
+    def add_subject(self, subject, fetcher=None, overwrite=False):
+        '''
+            Download the frames of a subject into the store. The frames are resized
+            to the size given in the subject metadata and written one by one to the
+            (memory-mapped) file, which is moved into place once it is complete
+
+            Inputs
+            ------
+            subject : int
+                Zooniverse subject ID
+            fetcher : `Fetcher`
+                Fetcher used for the requests (default: `default_fetcher`)
+            overwrite : bool
+                Download the frames again if the subject is already in the store
+        '''
+        subject = int(subject)
+        if not overwrite and subject in self:
+            return
+
+        if fetcher is None:
+            fetcher = default_fetcher
+
+        raw = get_subject_metadata(subject, fetcher)
+        shape = (round(float(raw['metadata']['#height'])), round(float(raw['metadata']['#width'])))
+
+        os.makedirs(self.path, exist_ok=True)
+        fd, partial = tempfile.mkstemp(dir=self.path, suffix='.npy')
+        os.close(fd)
+        try:
+            frames = np.lib.format.open_memmap(partial, mode='w+', dtype=np.uint8, shape=(15, *shape, 3))
+            for frame in range(15):
+                img = to_rgb_uint8(io.imread(BytesIO(fetcher.get(get_frame_url(raw, frame)))))
+                if img.shape[:2] != shape:
+                    img = resize_image(img, shape)
+                frames[frame] = img
+            frames.flush()
+            del frames
+
+            with self.lock:
+                os.replace(partial, self.get_file(subject))
+                self.frames.pop(subject, None)
+            add_count('frame_store_subjects_added')
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def get_subject_frames(self, subject, fetch=True):
+        '''
+            Get all the frames of a subject
+
+            Inputs
+            ------
+            subject : int
+                Zooniverse subject ID
+            fetch : bool
+                Add the subject to the store if it is not there yet. If False,
+                a KeyError is raised instead
+
+            Outputs
+            -------
+            frames : numpy.memmap
+                Read-only (15, height, width, 3) uint8 array mapped from the store
+        '''
+        subject = int(subject)
+        with self.lock:
+            if subject in self.frames:
+                record_cache('frame_store', True)
+                self.frames.move_to_end(subject)
+                return self.frames[subject]
+
+        if subject not in self:
+            if not fetch:
+                raise KeyError(f"Subject {subject} is not in the frame store {self.path}")
+            record_cache('frame_store', False)
+            self.add_subject(subject)
+        else:
+            record_cache('frame_store', True)
+
+        frames = np.load(self.get_file(subject), mmap_mode='r')
+        with self.lock:
+            self.frames[subject] = frames
+            while len(self.frames) > self.max_open:
+                self.frames.popitem(last=False)
+
+        return frames
+
+    def populate(self, subjects, fetcher=None, overwrite=False):
+        '''
+            Add a list of subjects to the store, downloading several subjects
+            concurrently. Subjects that are already in the store are skipped
+
+            Inputs
+            ------
+            subjects : list
+                List of Zooniverse subject IDs
+            fetcher : `Fetcher`
+                Fetcher used for the requests (default: `default_fetcher`)
+            overwrite : bool
+                Download the subjects that are already in the store again
+
+            Outputs
+            -------
+            added : list
+                List of subjects that were added to the store
+            errors : dict
+                Dictionary of subject ID -> exception for the subjects that failed
+        '''
+        if fetcher is None:
+            fetcher = default_fetcher
+
+        subjects = [int(subject) for subject in subjects]
+        pending = [subject for subject in dict.fromkeys(subjects) if overwrite or subject not in self]
+
+        added = []
+        errors = {}
+        r = tqdm.tqdm(fetcher.imap(lambda subject: self.add_subject(subject, fetcher, overwrite=True),
+                                   pending, retry=False), total=len(pending))
+        for subject, _, error in r:
+            if error is None:
+                added.append(subject)
+            else:
+                errors[subject] = error
+            r.set_postfix({'errors': len(errors)})
+
+        return added, errors
+
+    def populate_sol(self, sol_standards, metafile, fetcher=None, overwrite=False):
+        '''
+            Add all the subjects of a list of SOL events to the store
+
+            Inputs
+            ------
+            sol_standards : list
+                List of SOL events (format: 'SOLyyyy-mm-ddThh:mm:ssL000C000')
+            metafile : `MetaFile`
+                Subject metadata used to find the subjects of each event
+            fetcher : `Fetcher`
+                Fetcher used for the requests (default: `default_fetcher`)
+            overwrite : bool
+                Download the subjects that are already in the store again
+
+            Outputs
+            -------
+            added : list
+                List of subjects that were added to the store
+            errors : dict
+                Dictionary of subject ID -> exception for the subjects that failed
+        '''
+        subjects = []
+        for sol_standard in sol_standards:
+            subjects.extend(metafile.get_subjectid_by_solstandard(sol_standard))
+
+        return self.populate(subjects, fetcher, overwrite)
+
+
+def get_subject_frames(subject, store='frame_store'):
+    '''
+        Get all the frames of a subject from a frame store (see `FrameStore.get_subject_frames`).
+        The subject is downloaded into the store if it is not there yet
+
+        Inputs
+        ------
+        subject : int
+            Zooniverse subject ID
+        store : `FrameStore` or str
+            Frame store to read from, or the directory of the store
+
+        Outputs
+        -------
+        frames : numpy.memmap
+            Read-only (15, height, width, 3) uint8 array mapped from the store
+    '''
+    if isinstance(store, str):
+        store = FrameStore(store)
+
+    return store.get_subject_frames(subject)
@@ -1,10 +1,150 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import datetime
-from panoptes_client import Panoptes, Subject, Workflow
-from dateutil.parser import parse
+from panoptes_client import Panoptes, Workflow
 from astropy.io import ascii
+from astropy.table import Table
 import csv
+from .meta_file_handler import convert_fileNames_to_datetime64, get_subject_metadata_lookup
+from solarjets_common.fetcher import fetch_subjects_metadata
+
+def read_question_data(path_to_csv):
+    '''
+        Read the question reducer csv-file, or copy the table if
+        it is already an astropy Table
+    '''
+    if isinstance(path_to_csv, Table):
+        return path_to_csv.copy()
+    return ascii.read(path_to_csv, format='csv')
+
+
+def find_jet_sequences(Ans, times, groups=None, short_duration=np.timedelta64(6, 'm')):
+    '''
+        Find the jet sequences (runs of consecutive 'y' answers) using a run-length
+        encoding of the answers. When `groups` is given, the sequences of all the
+        groups (e.g. SOL events) are found in one call, and the runs do not continue
+        across groups. The rows of a group do not need to be contiguous.
+
+        Inputs
+        ------
+        Ans : np.array
+            answers of the subjects ('y' or 'n'), in time order within each group
+        times : np.array
+            starting times of the subjects
+        groups : np.array
+            group label of each subject (default: all subjects in one group)
+        short_duration : np.timedelta64
+            sequences that end within this time of their start are flagged as short
+
+        Outputs
+        -------
+        sequences : np.array
+            structured array with one row per jet sequence with the fields
+            `group` (index into `np.unique(groups)`), `start_index`, `end_index`
+            (index of the first non-jet subject after the sequence, -1 if the
+            sequence lasts until the end of the group), `start_time`, `end_time`
+            (NaT if the sequence does not end), `length` (number of subjects) and `short`
+        flags : np.array
+            structured array with one row per flagged subject with the fields
+            `group`, `index`, `time`, `short` (end of a short sequence) and
+            `flip_flop` (the answer switched on the previous subject as well, e.g. 'yny')
+    '''
+    Ans = np.asarray(Ans)
+    times = np.asarray(times, dtype='datetime64[us]')
+
+    if groups is None:
+        inverse = np.zeros(len(Ans), dtype=int)
+    else:
+        inverse = np.unique(np.asarray(groups), return_inverse=True)[1].ravel()
+
+    # sort the subjects by group, keeping their order within the group
+    order = np.argsort(inverse, kind='stable')
+    group = inverse[order]
+    is_jet = Ans[order] == 'y'
+    t = times[order]
+
+    # every group starts with a 'n' before its first subject
+    prev = np.zeros(len(is_jet), dtype=bool)
+    prev[1:] = is_jet[:-1]
+    prev[1:][group[1:] != group[:-1]] = False
+    transition = is_jet != prev
+
+    start_pos = np.flatnonzero(transition & is_jet)
+    end_pos = np.flatnonzero(transition & ~is_jet)
+
+    # every end closes the last sequence that started before it
+    closed = np.zeros(len(start_pos), dtype=bool)
+    closing = np.searchsorted(start_pos, end_pos, side='right') - 1
+    closed[closing] = True
+
+    stop_pos = np.searchsorted(group, group[start_pos], side='right')
+    stop_pos[closing] = end_pos
+
+    sequences = np.zeros(len(start_pos), dtype=[('group', int), ('start_index', int), ('end_index', int),
+                                                ('start_time', 'datetime64[us]'), ('end_time', 'datetime64[us]'),
+                                                ('length', int), ('short', bool)])
+    sequences['group'] = group[start_pos]
+    sequences['start_index'] = order[start_pos]
+    sequences['end_index'] = -1
+    sequences['end_index'][closing] = order[end_pos]
+    sequences['start_time'] = t[start_pos]
+    sequences['end_time'] = np.datetime64('NaT')
+    sequences['end_time'][closing] = t[end_pos]
+    sequences['length'] = stop_pos - start_pos
+    sequences['short'] = closed & (np.abs(sequences['end_time'] - sequences['start_time']) < short_duration)
+
+    # consecutive answer switches (e.g. 'yny') are flagged on every second switch
+    switch_pos = np.flatnonzero(transition)
+    new_block = np.ones(len(switch_pos), dtype=bool)
+    new_block[1:] = (np.diff(switch_pos) != 1) | (group[switch_pos[1:]] != group[switch_pos[:-1]])
+    block_start = np.maximum.accumulate(np.where(new_block, np.arange(len(switch_pos)), 0))
+    flip_flop_pos = switch_pos[(np.arange(len(switch_pos)) - block_start) % 2 == 1]
+
+    short_pos = end_pos[sequences['short'][closing]]
+    flag_pos = np.union1d(short_pos, flip_flop_pos).astype(int)
+
+    flags = np.zeros(len(flag_pos), dtype=[('group', int), ('index', int), ('time', 'datetime64[us]'),
+                                           ('short', bool), ('flip_flop', bool)])
+    flags['group'] = group[flag_pos]
+    flags['index'] = order[flag_pos]
+    flags['time'] = t[flag_pos]
+    flags['short'] = np.isin(flag_pos, short_pos)
+    flags['flip_flop'] = np.isin(flag_pos, flip_flop_pos)
+
+    return sequences, flags
+
+
+def format_jet_sequences(sequences, flags, t):
+    '''
+        Convert the output of `find_jet_sequences` to the space separated strings
+        used in the SOL csv-file (see `QuestionResult.count_jets`)
+
+        Inputs
+        ------
+        sequences, flags : np.array
+            jet sequences and flags of one group
+        t : np.array
+            starting times of the subjects, as they should be printed
+
+        Output
+        ------
+            tel : int
+                count of how many jet events (sequential jet subjects)
+            L : str
+                string of flagging per jet event seperated by ' '
+            start : str
+                string of starting times jet event seperated by ' '
+            end : str
+                string of end times jet event seperated by ' '
+    '''
+    closed = sequences['end_index'] >= 0
+
+    start = ''.join(str(t[i]) + ' ' for i in sequences['start_index'])
+    end = ''.join(str(t[i]) + ' ' for i in sequences['end_index'][closed])
+    L = ''.join(' ' + str(int(f1)) + str(int(f2)) + ' ' + str(t[i])
+                for i, f1, f2 in zip(flags['index'], flags['short'], flags['flip_flop']))
+
+    return len(sequences), L, start, end
+
 
 class QuestionResult:
     '''
@@ -17,15 +157,16 @@ class QuestionResult:
             path_to_csv : path to csv-file
                     Rows contain the question_reducer_jet_or_not.csv
                     with columns data.yes and data.no for each subject 
+                    Can also be an astropy Table with the same columns
 
         '''
         try:
-            data = ascii.read(path_to_csv, format='csv')
+            data = read_question_data(path_to_csv)
             data['data.yes'].fill_value = 0
             data['data.no'].fill_value = 0
 
         except KeyError:
-            data = ascii.read(path_to_csv, format='csv')
+            data = read_question_data(path_to_csv)
             data.rename_column('data.no-there-are-no-jets-in-this-image-sequence', 'data.no')
             data.rename_column('data.yes-there-is-at-least-one-jet-in-this-image-sequence', 'data.yes')
             data['data.yes'].fill_value = 0
@@ -39,16 +180,116 @@ class QuestionResult:
 
         self.data = data.filled()
         self.subjects = np.asarray(data['subject_id'])
+        self.build_index()
         
+    def build_index(self):
+        '''
+        Build the sorted subject index used to look up the rows of subjects
+        '''
+        # a stable sort keeps rows of the same subject in their original order
+        self.sort_index = np.argsort(self.subjects, kind='stable')
+        self.sorted_subjects = self.subjects[self.sort_index]
+
+    def find_rows(self, list_subjects):
+        '''
+        Find the (first) row of each of the subjects in the data
+        Inputs
+        ------
+            list_subjects : np.array
+                list of Zooniverse subject ids
+        Output
+        ------
+            rows : np.array
+                row index in data for each subject (only valid where found is True)
+            found : np.array
+                boolean mask for the subjects that are in the data
+        '''
+        list_subjects = np.atleast_1d(np.asarray(list_subjects))
+        if len(self.sorted_subjects) == 0:
+            return np.zeros(len(list_subjects), dtype=int), np.zeros(len(list_subjects), dtype=bool)
+
+        pos = np.searchsorted(self.sorted_subjects, list_subjects)
+        pos[pos == len(self.sorted_subjects)] = 0
+        found = self.sorted_subjects[pos] == list_subjects
+
+        return self.sort_index[pos], found
+
     def get_data_by_id(self,subjectid):
-        subject_data=self.data[self.subjects==subjectid]
+        '''
+        Get all the rows of a subject (an empty table if it is not in the data)
+        '''
+        start = np.searchsorted(self.sorted_subjects, subjectid, side='left')
+        end = np.searchsorted(self.sorted_subjects, subjectid, side='right')
+        subject_data=self.data[np.sort(self.sort_index[start:end])]
         return subject_data
-    
-    def get_data_by_idlist(self,list_subjects):
-        index=[np.where(self.subjects==x)[0][0] for x in list_subjects]
+
+    def get_data_by_idlist(self,list_subjects, ignore_missing=False):
+        '''
+        Get the (first) row of each of the subjects in list_subjects
+        Inputs
+        ------
+            list_subjects : np.array
+                list of Zooniverse subject ids
+            ignore_missing : bool
+                skip subjects that are not in the data instead of raising an IndexError
+        '''
+        index, found = self.find_rows(list_subjects)
+        if not found.all():
+            missing = np.atleast_1d(np.asarray(list_subjects))[~found]
+            if not ignore_missing:
+                raise IndexError(f'Subjects {missing} not found in the question results')
+            index = index[found]
         subjects_data=self.data[index]
         return subjects_data
 
+    def combine(self, other, task_filter=None, combined_task='Tc'):
+        '''
+        Combine the yes/no counts of another QuestionResult (e.g. the T3 question
+        of the Box the Jets workflow) with this one, by matching the subject ids
+        of the two tables. Subjects that are only in `other` are ignored.
+
+        Inputs
+        ------
+            other : QuestionResult
+                question results to add to these results
+            task_filter : str
+                only use the rows of `other` for this task (e.g. 'T3').
+                Default None uses all the rows
+            combined_task : str
+                task name given to the subjects that have answers in both results
+
+        Output
+        ------
+            combined : QuestionResult
+                copy of these results with the counts of `other` added
+            only_self : np.array
+                subjects that are only in these results
+            only_other : np.array
+                subjects that are only in `other` (and were ignored)
+        '''
+        other_data = other.data
+        if task_filter is not None:
+            other_data = other_data[other_data['task'] == task_filter]
+
+        combined_data = self.data.copy()
+
+        # find the row of each of the other subjects in the sorted index
+        other_subjects = np.asarray(other_data['subject_id'])
+        rows, found = self.find_rows(other_subjects)
+        rows = rows[found]
+
+        # add the counts of the matched subjects in one go
+        for key in ['data.yes', 'data.no']:
+            counts = np.asarray(combined_data[key]).copy()
+            np.add.at(counts, rows, np.asarray(other_data[key])[found])
+            combined_data[key] = counts
+        combined_data['task'][rows] = combined_task
+
+        only_self = np.setdiff1d(self.subjects, other_subjects)
+        only_other = np.unique(other_subjects[~found])
+
+        return QuestionResult(combined_data), only_self, only_other
+
     def Agr_mask(self,data):
         '''
         Find the agreement between the volunteers for the Jet or Not question
@@ -86,10 +327,21 @@ class QuestionResult:
         return agreement,jet_mask,non_jet_mask,Ans
         
         
-    def obs_time(self):
+    def obs_time(self, metadata=None, fetcher=None):
         '''
-        Connect to the Zooniverse to get the observation starting time, SOL event, 
-        filenames of 1st image of the subject and the end_time of the subjects.
+        Get the observation starting time, SOL event, filenames of 1st image of the
+        subject and the end_time of the subjects. The metadata is read from a local
+        metadata source if given, and from the Zooniverse for the subjects that are not
+        available locally.
+        Input
+        -----
+            metadata : MetaFile or str
+                MetaFile object, path to the metadata json file (Meta_data_subjects.json)
+                or to the Zooniverse subjects export (solar-jet-hunter-subjects.csv).
+                Default None gets all the metadata from the Zooniverse
+            fetcher : Fetcher
+                Fetcher used to get the metadata from the Zooniverse concurrently
+                (default: default_fetcher)
         Output
         -----
             obs_time : np.array(dtype=str)
@@ -101,33 +353,39 @@ class QuestionResult:
             end_time : np.array(dtype=str)
                 time of the last image of the subject
         '''
-        
-        obs_time = np.array([])
-        SOL = np.array([])
-        filenames= np.array([])
-        end_time = np.array([])
-
-        for i, subject in enumerate(self.data['subject_id']):
-            print("\r [%-40s] %d/%d"%(int(i/len(self.data['subject_id'])*40)*'=', i+1, len(self.data['subject_id'])), end='')
-            panoptes_subject = Subject(subject)
-
-            # get the obsdate from the filename (format ssw_cutout_YYYYMMDD_HHMMSS_*.png). we'll strip out the 
-            # extras and just get the date in ISO format and parse it into a datetime array
-            filenames= np.append(filenames,panoptes_subject.metadata['#file_name_0'])
-            obs_datestring = panoptes_subject.metadata['#file_name_0'].split('_')[2:4]
-            obs_time=np.append(obs_time,parse(f'{obs_datestring[0]}T{obs_datestring[1]}'))
-            end_datestring = panoptes_subject.metadata['#file_name_14'].split('_')[2:4]
-            end_time=np.append(end_time,parse(f'{end_datestring[0]}T{end_datestring[1]}'))
-            SOL=np.append(SOL,panoptes_subject.metadata['#sol_standard'])
+        keys = ['#file_name_0', '#file_name_14', '#sol_standard']
+        subjects = np.asarray(self.data['subject_id'], dtype=int)
+
+        lookup = {}
+        if metadata is not None:
+            lookup = get_subject_metadata_lookup(metadata, subjects, keys)
+
+        # connect to the Zooniverse for the subjects that are not in the metadata
+        missing = [subject for subject in np.unique(subjects) if subject not in lookup]
+        if len(missing) > 0:
+            print(f'Getting the metadata of {len(missing)} subjects from the Zooniverse')
+            raw, errors = fetch_subjects_metadata(missing, fetcher)
+            if len(errors) > 0:
+                raise RuntimeError(f'Could not get the metadata for subjects {list(errors.keys())}') \
+                    from list(errors.values())[0]
+            for subject in missing:
+                lookup[subject] = {key: raw[subject]['metadata'][key] for key in keys}
+
+        filenames = np.asarray([lookup[subject]['#file_name_0'] for subject in subjects], dtype=str)
+        end_filenames = np.asarray([lookup[subject]['#file_name_14'] for subject in subjects], dtype=str)
+        SOL = np.asarray([lookup[subject]['#sol_standard'] for subject in subjects], dtype=str)
+
+        # get the obsdate from the filename (format ssw_cutout_YYYYMMDD_HHMMSS_*.png)
+        # for all the subjects at once and convert to datetime objects
+        obs_time = convert_fileNames_to_datetime64(filenames).astype(object)
+        end_time = convert_fileNames_to_datetime64(end_filenames).astype(object)
 
         return obs_time,SOL,filenames,end_time
-        
-        
-        
-        
+
     def count_jets(self,A,t):
         '''
-        Get properties of the SOL event by looping over the various subjects
+        Get properties of the SOL event from the sequences of jet subjects
+        (see `find_jet_sequences`)
         Inputs
         ------
         A : np.array
@@ -146,38 +404,9 @@ class QuestionResult:
             end : str
                 string of end times jet event seperated by ' '
         '''
-    
-        L=''
-        start=''
-        end=''
-        tel=0
-        prev='n'
-        switch=0
-        for i in range(len(A)):  
-            f1='0'
-            f2='0'
-            a=A[i]
-            if prev != a:
-                if a=='y':
-                    tel+=1 #
-                    start+=str(t[i])+' '#
-                    s=i #start index
-                else:
-                    end+=str(t[i])+' '#
-                    if np.abs(t[i]-t[s])<datetime.timedelta(minutes = 6):
-                        f1='1'
-                switch+=1
-                prev = a
-            else:
-                switch=0
-
-            if switch>1: #Flagging jets where we have ynyn or nyny so jets inclosed in 
-                f2='1'
-                switch=0
-            if f1+f2!='00':
-                L=L+' '+f1+f2+' '+str(t[i])
-
-        return tel,L,start,end
+        sequences, flags = find_jet_sequences(A, t)
+
+        return format_jet_sequences(sequences, flags, np.asarray(t))
         
         
         
@@ -190,35 +419,50 @@ class QuestionResult:
         -----
         SOL, obs_time, Ans, agreement, jet_mask, non_jet_mask, task,filenames, end_time : str format
         Properties of the subjects to be saved in a csv file
+
+        The subjects are grouped by SOL event in a single pass, so the rows of an
+        event do not need to be contiguous. Events are written in the order of their
+        first appearance, with the subjects of each event kept in their original order
         '''
-    
-        open('subjects_{}.csv'.format(task),'w')
-        start_i=0
-        f = open('SOL_{}_stats.csv'.format(task), 'w') #PUT in Box the jet
-        writer = csv.writer(f)
-        writer.writerow(['#SOL-event','subjects in event','filename0','times subjects','number of jet clusters','start event', 'end event','Flagged jets'])
-        SOL_small=np.array([])
-        Num=np.array([])
-        #total 122 figures SOL events
-        while start_i<len(SOL):
-            I=SOL==SOL[start_i]
-            C,N,start,end=self.count_jets(Ans[I],obs_time[I])
-            SOL_small=np.append(SOL_small,SOL[start_i])
-            Num=np.append(Num,C)
-            S=np.array(self.data['subject_id'][I],dtype=str)
-            S2=' '.join(S)
-            T=obs_time[I]
-            T2=' '.join(np.asarray(T,dtype=str))
-            F=filenames[I]
-            F2=' '.join(np.asarray(F,dtype=str))
-            E=end_time[I]
-            A=Ans[I]
-            Ag=agreement[I]
-            sol_event=SOL[I]
-            ## Make list with all subjects
-            with open('subjects_{}.csv'.format(task),'a') as csvfile:
+        SOL = np.asarray(SOL)
+        obs_time = np.asarray(obs_time)
+        Ans = np.asarray(Ans)
+        agreement = np.asarray(agreement)
+        filenames = np.asarray(filenames)
+        end_time = np.asarray(end_time)
+        subjects = np.asarray(self.data['subject_id'], dtype=str)
+
+        # group the rows by event: order lists the row indices event by event
+        unique_SOL, first, inverse = np.unique(SOL, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        counts = np.bincount(inverse, minlength=len(unique_SOL))
+        ends = np.cumsum(counts)
+        starts = ends - counts
+
+        # jet sequences of all the events at once
+        sequences, flags = find_jet_sequences(Ans, obs_time, SOL)
+        seq_bounds = np.searchsorted(sequences['group'], np.arange(len(unique_SOL) + 1))
+        flag_bounds = np.searchsorted(flags['group'], np.arange(len(unique_SOL) + 1))
+
+        with open('SOL_{}_stats.csv'.format(task), 'w') as f, open('subjects_{}.csv'.format(task), 'w') as csvfile: #PUT in Box the jet
+            writer = csv.writer(f)
+            writer.writerow(['#SOL-event','subjects in event','filename0','times subjects','number of jet clusters','start event', 'end event','Flagged jets'])
+            for g in np.argsort(first):
+                I=order[starts[g]:ends[g]]
+                C,N,start,end=format_jet_sequences(sequences[seq_bounds[g]:seq_bounds[g + 1]],
+                                                   flags[flag_bounds[g]:flag_bounds[g + 1]], obs_time)
+                S=subjects[I]
+                S2=' '.join(S)
+                T=obs_time[I]
+                T2=' '.join(np.asarray(T,dtype=str))
+                F=filenames[I]
+                F2=' '.join(np.asarray(F,dtype=str))
+                E=end_time[I]
+                A=Ans[I]
+                Ag=agreement[I]
+                sol_event=SOL[I]
+                ## Make list with all subjects
                 np.savetxt(csvfile, np.column_stack((S,T,E,A,Ag,F,sol_event)), delimiter=",",newline='\n',fmt='%s')
-            ##
-            writer.writerow([SOL[start_i],S2,F2,T2,C,start,end,N])
-            start_i=np.max(np.where(I==True))+1
-        f.close()
\ No newline at end of file
+                ##
+                writer.writerow([unique_SOL[g],S2,F2,T2,C,start,end,N])
\ No newline at end of file
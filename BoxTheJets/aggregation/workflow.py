@@ -1,12 +1,29 @@
 import numpy as np
 from astropy.io import ascii
+from astropy.table import Table, Column, MaskedColumn
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba_array
 import ast
-from panoptes_client import Panoptes, Subject
-from skimage import io, transform
+from panoptes_client import Panoptes
+from skimage import io
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import itertools
 import getpass
+import os
+import json
+import hashlib
+import shapely
 from shapely.geometry import Polygon, Point
+from io import BytesIO
+from solarjets_common.fetcher import default_fetcher, get_subject_metadata, get_frame_url
+from solarjets_common.image_utils import resize_image, to_rgb_uint8
+from solarjets_common.gif_writer import GifStreamWriter
+from .classification_reader import RETIRED_NULL, parse_zooniverse_time, iter_classifications
+from solarjets_common.instrumentation import record_cache
 
 
 def connect_panoptes():
@@ -59,7 +76,108 @@ def get_box_edges(x, y, w, h, a):
     return corners
 
 
-def get_subject_image(subject, frame=7):
+def get_box_edges_array(x, y, w, h, a):
+    '''
+        Return the corners of several boxes at once. Same as `get_box_edges`,
+        but each input is an array with one entry per box
+
+        Inputs
+        ------
+        x, y, w, h, a : numpy.ndarray
+            Box left bottom edge coordinates, width, height and rotation angle
+
+        Outputs
+        --------
+        corners : numpy.ndarray
+            (N, 5, 2) array with the coordinates of the edges of each box
+            (the first point is repeated to close the loop)
+    '''
+    x, y, w, h, a = [np.asarray(val, dtype=float).reshape(-1, 1) for val in (x, y, w, h, a)]
+
+    # offset of each corner from the centre before rotation
+    dx = np.array([-0.5, 0.5, 0.5, -0.5, -0.5]) * w
+    dy = np.array([-0.5, -0.5, 0.5, 0.5, -0.5]) * h
+
+    cos = np.cos(a)
+    sin = np.sin(a)
+    corners = np.empty((len(x), 5, 2))
+    corners[:, :, 0] = dx * cos - dy * sin + x + w / 2
+    corners[:, :, 1] = dx * sin + dy * cos + y + h / 2
+    return corners
+
+
+def get_box_iou(boxes1, boxes2):
+    '''
+        Get the intersection over union of pairs of boxes in bulk
+
+        Inputs
+        ------
+        boxes1 : numpy.ndarray
+            Array of `shapely.Polygon` objects (or a single polygon)
+        boxes2 : numpy.ndarray
+            Array of `shapely.Polygon` objects (or a single polygon)
+            to compare each of `boxes1` with
+
+        Outputs
+        -------
+        iou : numpy.ndarray
+            Intersection over union for each pair
+    '''
+    return shapely.area(shapely.intersection(boxes1, boxes2)) / shapely.area(shapely.union(boxes1, boxes2))
+
+
+# size (in bytes) of the frames kept in memory by `get_subject_image` (and
+# filled ahead of time by `prefetch_subjects`), so that each subject/frame is
+# only fetched and resized once. This is about the 15 frames of one full-size
+# subject. Each process has its own cache, so the gifs rendered on a pool of
+# worker processes (see `create_gifs`) use up to this much memory per worker
+FRAME_CACHE_BYTES = 128 * 2**20
+frame_cache = OrderedDict()
+frame_cache_lock = threading.Lock()
+
+
+def fetch_frame(raw, frame, fetcher, scale=1., resize_mode='fast'):
+    '''
+        Fetch one frame of a subject, resize it to the size given in the
+        subject metadata and add it to the frame cache
+
+        Inputs
+        ------
+        raw : dict
+            Raw subject data (see `get_subject_metadata`)
+        frame : int
+            Frame to fetch (between 0-14)
+        fetcher : `Fetcher`
+            Fetcher used for the requests
+        scale, resize_mode :
+            See `get_subject_image`
+
+        Outputs
+        -------
+        img : numpy.ndarray
+            Read-only RGB uint8 image
+    '''
+    # grayscale/RGBA frames are converted to RGB uint8, the same as the frames in the store
+    img = to_rgb_uint8(io.imread(BytesIO(fetcher.get(get_frame_url(raw, frame)))))
+
+    # the images are resized to the size given in the metadata
+    # (for subjects that have an odd size, or a scaled preview)
+    shape = (round(float(raw['metadata']['#height']) * scale), round(float(raw['metadata']['#width']) * scale))
+    if img.shape[:2] != shape:
+        img = to_rgb_uint8(resize_image(img, shape, resize_mode))
+    img.setflags(write=False)
+
+    with frame_cache_lock:
+        frame_cache[(int(raw['id']), frame, scale, resize_mode)] = img
+        # the least recently used frames are dropped (but at least the new one is kept)
+        nbytes = sum(cached.nbytes for cached in frame_cache.values())
+        while nbytes > FRAME_CACHE_BYTES and len(frame_cache) > 1:
+            nbytes -= frame_cache.popitem(last=False)[1].nbytes
+
+    return img
+
+
+def get_subject_image(subject, frame=7, fetcher=None, scale=1., resize_mode='fast', store=None):
     '''
         Fetch the subject image from Panoptes (Zooniverse database)
 
@@ -69,28 +187,138 @@ def get_subject_image(subject, frame=7):
             Zooniverse subject ID
         frame : int
             Frame to extract (between 0-14, default 7)
+        fetcher : `Fetcher`
+            Fetcher used for the requests (default: `default_fetcher`)
+        scale : float
+            Scale of the output image with respect to the full size
+            (e.g. 0.25 for a quick preview)
+        resize_mode : str
+            How odd-sized (or scaled) images are resized (see `resize_image`)
+        store : `FrameStore`
+            Frame store to read the frame from if the subject is in
+            there (default: None, the frame is fetched from Panoptes)
 
         Outputs
         -------
         img : numpy.ndarray
-            RGB image corresponding to `frame`
+            RGB uint8 image corresponding to `frame`. The frames are
+            cached, and are returned as read-only arrays
     '''
+    # read the frame from the local frame store (without a copy)
+    # if the subject has been added to it
+    if store is not None and scale == 1. and resize_mode == 'fast' and subject in store:
+        return store.get_subject_frames(subject)[frame]
+
+    key = (int(subject), frame, scale, resize_mode)
+    with frame_cache_lock:
+        if key in frame_cache:
+            record_cache('frame_cache', True)
+            frame_cache.move_to_end(key)
+            return frame_cache[key]
+
+    record_cache('frame_cache', False)
+    if fetcher is None:
+        fetcher = default_fetcher
+
     # get the subject metadata from Panoptes
-    subjecti = Subject(int(subject))
+    raw = get_subject_metadata(subject, fetcher)
+
+    return fetch_frame(raw, frame, fetcher, scale, resize_mode)
+
+
+def prefetch_subjects(subjects, frames=range(15), nprefetch=4, store=None, fetcher=None):
+    '''
+        Iterate over a list of subjects, while the `frames` of the next `nprefetch`
+        subjects are fetched by a background thread pool. At most `nprefetch`
+        subjects are fetched ahead of the current one, so the downloads never run
+        far ahead of the loop. Repeated subjects are only fetched (and yielded) once.
+
+        By default only the requested frames are fetched, into the in-memory
+        frame cache that `get_subject_image` reads from. The number of subjects
+        fetched ahead is then reduced (once the size of the frames is known from
+        the previous subject) if their frames would not fit in the cache. If a `store`
+        is given, all the frames of each subject are added to that frame store
+        on disk instead, and the frames are read from there
+
+        Inputs
+        ------
+        subjects : list
+            List of Zooniverse subject IDs
+        frames : list
+            Frames of each subject that are used (between 0-14, default: all)
+        nprefetch : int
+            Number of subjects to fetch ahead (and number of threads)
+        store : `FrameStore`
+            Frame store to add the subjects to (default: None, the frames
+            are only kept in memory)
+        fetcher : `Fetcher`
+            Fetcher used for the requests (default: `default_fetcher`)
+
+        Outputs
+        -------
+        result : tuple
+            Generator of (subject, images, error) tuples in the order of `subjects`,
+            where `images` is the list of images for `frames` and `error` is
+            the exception raised while fetching the subject (None on success)
+    '''
+    frames = list(frames)
+    if fetcher is None:
+        fetcher = default_fetcher
+    def fetch(subject):
+        if store is not None:
+            # the memory-mapped frames are read from the store by `get_subject_image`
+            store.add_subject(subject, fetcher)
+            cube = store.get_subject_frames(subject, fetch=False)
+            return [cube[frame] for frame in frames]
+
+        with frame_cache_lock:
+            cached = {frame: frame_cache.get((subject, frame, 1., 'fast')) for frame in frames}
+
+        raw = None
+        for frame in frames:
+            if cached[frame] is None:
+                if raw is None:
+                    raw = get_subject_metadata(subject, fetcher)
+                cached[frame] = fetch_frame(raw, frame, fetcher)
+
+        return [cached[frame] for frame in frames]
+
+    def unique(subjects):
+        seen = set()
+        for subject in subjects:
+            subject = int(subject)
+            if subject not in seen:
+                seen.add(subject)
+                yield subject
+
+    subjects = unique(subjects)
+    pool = ThreadPoolExecutor(max_workers=max(nprefetch, 1))
     try:
-        frame0_url = subjecti.raw['locations'][frame]['image/png']
-    except KeyError:
-        frame0_url = subjecti.raw['locations'][frame]['image/jpeg']
+        # queue of the subjects being fetched, which holds the
+        # current subject and up to nprefetch subjects after it
+        # (without a store, only the first subject is fetched until the size of its frames is known)
+        ahead = nprefetch if store is not None else 0
+        pending = deque((subject, pool.submit(fetch, subject)) for subject in itertools.islice(subjects, ahead + 1))
 
-    img = io.imread(frame0_url)
+        while len(pending) > 0:
+            subject, future = pending.popleft()
+            try:
+                images, error = future.result(), None
+            except Exception as e:
+                images, error = None, e
 
-    # for subjects that have an odd size, resize them
-    if img.shape[0] != 1920:
-        meta_width=float(subjecti.raw['metadata']['#width'])
-        meta_height=float(subjecti.raw['metadata']['#height'])
-        img = transform.resize(img, (meta_height, meta_width))
+            if store is None and error is None:
+                nbytes = max(sum(img.nbytes for img in images), 1)
+                ahead = max(min(nprefetch, FRAME_CACHE_BYTES // nbytes - 1), 0)
 
-    return img
+            yield subject, images, error
+
+            # the current subject is done, so start fetching the next ones
+            for subject in itertools.islice(subjects, max(ahead + 1 - len(pending), 0)):
+                pending.append((subject, pool.submit(fetch, subject)))
+    finally:
+        # stop the queued downloads if the loop is interrupted
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 def get_point_distance(x0, y0, x1, y1):
@@ -167,30 +395,27 @@ def create_gif(jets):
 
     # create a temp plot so that we can get a size estimate
     fig, ax = plt.subplots(1, 1, dpi=150)
-    ax.imshow(get_subject_image(subject, 0))
+    im1 = ax.imshow(get_subject_image(subject, 0))
     ax.axis('off')
     fig.tight_layout()
 
-    # loop through the frames and plot
-    ims = []
-    for i in range(15):
-        img = get_subject_image(subject, i)
-
-        # first, plot the image
-        im1 = ax.imshow(img)
+    # the jets are the same in every frame, so they are only plotted once
+    jetims = []
+    for jet in jets:
+        jetims.extend(jet.plot(ax, plot_sigma=False))
 
-        # for each jet, plot all the details
-        # and add each plot artist to the list
-        jetims = []
-        for jet in jets:
-            jetims.extend(jet.plot(ax, plot_sigma=False))
+    # loop through the frames and update the image
+    def animate(i):
+        im1.set_data(get_subject_image(subject, i))
 
         # combine all the plot artists together
-        ims.append([im1, *jetims])
+        return [im1, *jetims]
 
     # save the animation as a gif
-    ani = animation.ArtistAnimation(fig, ims)
-    ani.save(f'{subject}.gif', writer='imagemagick')
+    ani = animation.FuncAnimation(fig, animate, frames=15, interval=200, blit=True)
+    ani.save(f'{subject}.gif', writer=GifStreamWriter(fps=5))
+
+    plt.close(fig)
 
 
 def scale_shape(params, gamma):
@@ -251,6 +476,187 @@ def sigma_shape(params, sigma):
     return plus_sigma, minus_sigma
 
 
+def build_row_index(table):
+    '''
+        Build a lookup from (subject_id, task) to the row number in a
+        reduction table. Only the first row is kept for duplicate keys.
+
+        Inputs
+        ------
+        table : astropy.table.Table
+            Reduced data table with `subject_id` and `task` columns
+
+        Outputs
+        -------
+        index : dict
+            Dictionary mapping (subject_id, task) to the row number
+    '''
+    index = {}
+    for i, (subject, task) in enumerate(zip(table['subject_id'], table['task'])):
+        index.setdefault((int(subject), str(task)), i)
+    return index
+
+
+def parse_flat_list_column(column, mask):
+    '''
+        Fast path for `parse_list_column` for columns of flat lists of numbers:
+        the list entries are split out of the strings and converted in bulk.
+        Returns (None, None) if any row is not a flat list of numbers
+    '''
+    if column.dtype.kind not in 'US':
+        return None, None
+
+    rows = []
+    for masked, entry in zip(mask, column):
+        if masked:
+            rows.append('')
+            continue
+        entry = str(entry).strip()
+        if entry[:1] != '[' or entry[-1:] != ']':
+            return None, None
+        rows.append(entry[1:-1].strip().rstrip(','))
+
+    counts = np.asarray([row.count(',') + 1 if row else 0 for row in rows], dtype=np.int64)
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+
+    tokens = np.asarray(','.join(row for row in rows if row).split(',') if offsets[-1] > 0 else [], dtype=str)
+    if np.any(np.char.find(tokens, '[') >= 0) or np.any(np.char.find(tokens, '(') >= 0):
+        return None, None
+
+    # a column of empty lists is a float array, the same as `np.asarray([])`
+    if len(tokens) == 0:
+        return tokens.astype(np.float64), offsets
+
+    try:
+        return tokens.astype(np.int64), offsets
+    except (ValueError, OverflowError):
+        pass
+
+    try:
+        values = tokens.astype(np.float64)
+    except ValueError:
+        return None, None
+
+    # nan/inf are not valid Python literals
+    if not np.all(np.isfinite(values)):
+        return None, None
+
+    return values, offsets
+
+
+def parse_list_column(column):
+    '''
+        Parse a column of stringified lists (e.g. '[1.0, 2.0]') into a single
+        flat array of values and the offsets of each row in that array,
+        so that row i is `values[offsets[i]:offsets[i + 1]]`. Masked entries
+        are treated as empty lists.
+
+        Inputs
+        ------
+        column : astropy.table.Column
+            Column with the string representation of a list in each row
+
+        Outputs
+        -------
+        values : numpy.ndarray
+            Flattened values for all the rows (int64 if every value is an
+            integer, float64 otherwise, including if there are no values).
+            None if the column could not be parsed
+        offsets : numpy.ndarray
+            Length N+1 array with the start of each row in `values`
+    '''
+    mask = np.ma.getmaskarray(column)
+    column = np.ma.getdata(column)
+
+    values, offsets = parse_flat_list_column(column, mask)
+    if values is not None:
+        return values, offsets
+
+    rows = []
+    for masked, entry in zip(mask, column):
+        if masked:
+            rows.append([])
+            continue
+        try:
+            entry = ast.literal_eval(str(entry))
+        except (ValueError, SyntaxError):
+            return None, None
+        if not isinstance(entry, (list, tuple)):
+            return None, None
+        rows.append(entry)
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(row) for row in rows])
+
+    flat = [val for row in rows for val in row]
+    if len(flat) > 0 and all(isinstance(val, int) and not isinstance(val, bool) for val in flat):
+        values = np.asarray(flat, dtype=np.int64)
+    else:
+        try:
+            values = np.asarray(flat, dtype=np.float64)
+        except (TypeError, ValueError):
+            return None, None
+
+    return values, offsets
+
+
+def read_extract_table(filename):
+    '''
+        Read an extractor CSV file. The frame data are lists stored as strings,
+        but a column which is empty in every row (e.g. no end points were drawn in
+        the first frame) is read as an integer column, so replace those with masked
+        string columns
+
+        Inputs
+        ------
+        filename : str
+            Path to the extractor CSV file
+
+        Outputs
+        -------
+        table : astropy.table.Table
+            Table with the extracts
+    '''
+    table = ascii.read(filename, delimiter=',')
+
+    for name in table.colnames:
+        if name.startswith('data.') and table[name].dtype.kind != 'U':
+            table[name] = MaskedColumn(np.full(len(table), 'None'), mask=np.ones(len(table), dtype=bool), name=name)
+
+    return table
+
+
+def get_file_signature(filename, checksum=False):
+    '''
+        Get the size, modification time (and optionally SHA-256 hash) of a file
+        so that cached data derived from it can be checked for staleness
+
+        Inputs
+        ------
+        filename : str
+            path to the file
+        checksum : bool
+            Also hash the file contents (slow for large files)
+
+        Outputs
+        -------
+        signature : dict
+            Dictionary with the `size`, `mtime` and (optionally) `sha256` of the file
+    '''
+    stat = os.stat(filename)
+    signature = {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    if checksum:
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(1 << 20), b''):
+                sha.update(chunk)
+        signature['sha256'] = sha.hexdigest()
+
+    return signature
+
+
 class Aggregator:
     '''
         Single data class to handle different aggregation requirements
@@ -277,6 +683,205 @@ class Aggregator:
         for col in self.points_data.colnames:
             self.points_data[col].fill_value = '[]'
 
+        self.build_index()
+
+    def build_index(self):
+        '''
+            Create the (subject_id, task) -> row lookup for the reduced
+            points and box tables, and reset the pre-parsed column data
+        '''
+        self.points_index = build_row_index(self.points_data)
+        self.box_index = build_row_index(self.box_data)
+
+        # pre-parsed list columns (filled in by `save_snapshot`/`from_snapshot`)
+        # keyed by column name with (values, offsets) as the value
+        self.points_parsed = {}
+        self.box_parsed = {}
+
+    def get_column_values(self, table, subject, task, column):
+        '''
+            Get the list stored in a given column of the reduced data for a
+            subject and task. Uses the pre-parsed data if the aggregator was
+            loaded from a snapshot, and parses the string otherwise.
+
+            Inputs
+            ------
+            table : string
+                Either 'points' or 'box' for the point or box reducer data
+            subject : int
+                Zooniverse subject ID
+            task : string
+                Either 'T1' or 'T5' for the first jet or second jet
+            column : string
+                Column name in the reducer data
+
+            Outputs
+            -------
+            values : numpy.ndarray
+                Values in the column for the subject/task
+        '''
+        index = getattr(self, f'{table}_index')
+        try:
+            row = index[(int(subject), task)]
+        except KeyError:
+            raise IndexError(f"No {table} data found for subject {subject} and task {task}")
+
+        parsed = getattr(self, f'{table}_parsed')
+        if column in parsed:
+            values, offsets = parsed[column]
+            values = np.asarray(values[offsets[row]:offsets[row + 1]])
+            # an empty list is a float array, the same as `np.asarray([])` below
+            if len(values) == 0:
+                return values.astype(np.float64)
+            return values
+
+        entry = getattr(self, f'{table}_data')[column][row]
+        if entry is np.ma.masked:
+            entry = '[]'
+
+        return np.asarray(ast.literal_eval(entry))
+
+    def save_snapshot(self, path, checksum=False):
+        '''
+            Save the parsed reduction (and extractor, if loaded) data to a directory
+            of numpy arrays which can be memory-mapped by `Aggregator.from_snapshot`.
+            The list columns in the reduced data are stored pre-parsed, so that
+            they do not need to be evaluated again on load.
+
+            Inputs
+            ------
+            path : str
+                directory to save the snapshot to (will be created if it does not exist)
+            checksum : bool
+                Store the SHA-256 hash of the source files in addition to their
+                size and modification time. Slower to save and validate, but does not
+                depend on the file timestamps.
+        '''
+        os.makedirs(path, exist_ok=True)
+
+        # list of (table attribute, source file attribute)
+        tables = [('points_data', 'points_file'), ('box_data', 'box_file')]
+        if hasattr(self, 'point_extracts'):
+            tables.extend([('point_extracts', 'point_extract_file'),
+                           ('box_extracts', 'box_extract_file')])
+
+        manifest = {'tables': {}}
+        for table_name, file_attr in tables:
+            table = getattr(self, table_name)
+            table_dir = os.path.join(path, table_name)
+            os.makedirs(table_dir, exist_ok=True)
+
+            source = getattr(self, file_attr)
+            table_info = {'source': source,
+                          'source_path': os.path.abspath(source),
+                          'signature': get_file_signature(source, checksum),
+                          'columns': []}
+
+            for i, colname in enumerate(table.colnames):
+                column = table[colname]
+                colinfo = {'name': colname, 'masked': False, 'parsed': False}
+
+                data = np.ma.getdata(column)
+                if data.dtype.kind == 'O':
+                    data = data.astype(str)
+                np.save(os.path.join(table_dir, f'col{i}.npy'), data)
+
+                mask = np.ma.getmaskarray(column)
+                if mask.any():
+                    np.save(os.path.join(table_dir, f'col{i}.mask.npy'), mask)
+                    colinfo['masked'] = True
+
+                # parse the list columns of the reduced data
+                if table_name in ['points_data', 'box_data'] and colname.startswith('data.'):
+                    values, offsets = parse_list_column(column)
+                    if values is not None:
+                        np.save(os.path.join(table_dir, f'col{i}.values.npy'), values)
+                        np.save(os.path.join(table_dir, f'col{i}.offsets.npy'), offsets)
+                        colinfo['parsed'] = True
+
+                table_info['columns'].append(colinfo)
+
+            manifest['tables'][table_name] = table_info
+
+        with open(os.path.join(path, 'manifest.json'), 'w') as outfile:
+            json.dump(manifest, outfile, indent=2)
+
+    @classmethod
+    def from_snapshot(cls, path, validate=True, mmap_mode='r'):
+        '''
+            Load an aggregator from a snapshot created with `save_snapshot`.
+            The arrays are memory-mapped by default, so that loading is fast and
+            multiple processes reading the same snapshot share memory.
+
+            Inputs
+            ------
+            path : str
+                directory containing the snapshot
+            validate : bool
+                Check that the source CSV files have not changed since the snapshot
+                was created (compares the size and modification time, and the SHA-256
+                hash if it was saved). Raises a `ValueError` if the snapshot is stale.
+            mmap_mode : str
+                `mmap_mode` passed to `numpy.load`. Use None to load the arrays into memory.
+
+            Outputs
+            -------
+            aggregator : `Aggregator`
+                The aggregator with the reduced (and extractor) data loaded
+        '''
+        with open(os.path.join(path, 'manifest.json'), 'r') as infile:
+            manifest = json.load(infile)
+
+        if validate:
+            for table_name, table_info in manifest['tables'].items():
+                source = table_info['source_path']
+                saved = table_info['signature']
+                if not os.path.exists(source):
+                    raise ValueError(f"Source file {source} for {table_name} not found. "
+                                     "Use validate=False to load the snapshot anyway")
+                current = get_file_signature(source, 'sha256' in saved)
+                if 'sha256' in saved:
+                    stale = (current['sha256'] != saved['sha256'])
+                else:
+                    stale = (current['size'] != saved['size']) or (current['mtime'] != saved['mtime'])
+                if stale:
+                    raise ValueError(f"Snapshot is out of date: {source} has changed since it was created")
+
+        aggregator = cls.__new__(cls)
+
+        file_attrs = {'points_data': 'points_file', 'box_data': 'box_file',
+                      'point_extracts': 'point_extract_file', 'box_extracts': 'box_extract_file'}
+
+        parsed = {'points_data': {}, 'box_data': {}}
+        for table_name, table_info in manifest['tables'].items():
+            table_dir = os.path.join(path, table_name)
+            columns = []
+            for i, colinfo in enumerate(table_info['columns']):
+                data = np.load(os.path.join(table_dir, f'col{i}.npy'), mmap_mode=mmap_mode)
+                if colinfo['masked']:
+                    mask = np.load(os.path.join(table_dir, f'col{i}.mask.npy'))
+                    columns.append(MaskedColumn(data=data, mask=mask, name=colinfo['name'], copy=False))
+                else:
+                    columns.append(Column(data=data, name=colinfo['name'], copy=False))
+
+                if colinfo['parsed']:
+                    values = np.load(os.path.join(table_dir, f'col{i}.values.npy'), mmap_mode=mmap_mode)
+                    offsets = np.load(os.path.join(table_dir, f'col{i}.offsets.npy'), mmap_mode=mmap_mode)
+                    parsed[table_name][colinfo['name']] = (values, offsets)
+
+            setattr(aggregator, table_name, Table(columns, copy=False))
+            setattr(aggregator, file_attrs[table_name], table_info['source'])
+
+        for table_name in ['points_data', 'box_data']:
+            for col in getattr(aggregator, table_name).colnames:
+                getattr(aggregator, table_name)[col].fill_value = '[]'
+
+        aggregator.build_index()
+        aggregator.points_parsed = parsed['points_data']
+        aggregator.box_parsed = parsed['box_data']
+
+        return aggregator
+
     def get_subjects(self):
         '''
             Return a list of known subjects in the reduction data
@@ -311,40 +916,35 @@ class Aggregator:
                 Cluster shape (x, y) for start and end and probabilities and labels of the
                 data points
         '''
-        points_data = self.points_data[:][(self.points_data['subject_id'] == subject) & (
-            self.points_data['task'] == task)]
-
-        points_data = points_data.filled()
-
         data = {}
 
-        data['x_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_points_x'][0]))
-        data['y_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_points_y'][0]))
-        data['x_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_points_x'][0]))
-        data['y_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_points_y'][0]))
+        data['x_start'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool0_points_x')
+        data['y_start'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool0_points_y')
+        data['x_end'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool1_points_x')
+        data['y_end'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool1_points_y')
 
         clusters = {}
-        clusters['x_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_clusters_x'][0]))
-        clusters['y_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_clusters_y'][0]))
-        clusters['x_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_clusters_x'][0]))
-        clusters['y_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_clusters_y'][0]))
-
-        clusters['prob_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_cluster_probabilities'][0]))
-        clusters['labels_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_cluster_labels'][0]))
-        clusters['prob_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_cluster_probabilities'][0]))
-        clusters['labels_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_cluster_labels'][0]))
+        clusters['x_start'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool0_clusters_x')
+        clusters['y_start'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool0_clusters_y')
+        clusters['x_end'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool1_clusters_x')
+        clusters['y_end'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool1_clusters_y')
+
+        clusters['prob_start'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool0_cluster_probabilities')
+        clusters['labels_start'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool0_cluster_labels')
+        clusters['prob_end'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool1_cluster_probabilities')
+        clusters['labels_end'] = self.get_column_values(
+            'points', subject, task, f'data.frame0.{task}_tool1_cluster_labels')
 
         return data, clusters
 
@@ -368,62 +968,53 @@ class Aggregator:
                 Cluster shape (x, y, width, height and angle) and probabilities and labels of the
                 data points
         '''
-        box_data = self.box_data[:][(self.box_data['subject_id'] == subject) & (
-            self.box_data['task'] == task)]
-
-        box_data = box_data.filled()
-
         data = {}
 
-        data['x'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_x'][0]))
-        data['y'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_y'][0]))
-        data['w'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_width'][0]))
-        data['h'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_height'][0]))
-        data['a'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_angle'][0]))
+        data['x'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_rotateRectangle_x')
+        data['y'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_rotateRectangle_y')
+        data['w'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_rotateRectangle_width')
+        data['h'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_rotateRectangle_height')
+        data['a'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_rotateRectangle_angle')
 
         clusters = {}
 
-        clusters['x'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_x'][0]))
-        clusters['y'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_y'][0]))
-        clusters['w'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_width'][0]))
-        clusters['h'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_height'][0]))
-        clusters['a'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_angle'][0]))
-
-        clusters['sigma'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_sigma'][0]))
-        clusters['labels'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_cluster_labels'][0]))
+        clusters['x'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_clusters_x')
+        clusters['y'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_clusters_y')
+        clusters['w'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_clusters_width')
+        clusters['h'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_clusters_height')
+        clusters['a'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_clusters_angle')
+
+        clusters['sigma'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_clusters_sigma')
+        clusters['labels'] = self.get_column_values(
+            'box', subject, task, f'data.frame0.{task}_tool2_cluster_labels')
 
         try:
-            clusters['prob'] = np.asarray(ast.literal_eval(
-                box_data[f'data.frame0.{task}_tool2_cluster_probabilities'][0]))
+            clusters['prob'] = self.get_column_values(
+                'box', subject, task, f'data.frame0.{task}_tool2_cluster_probabilities')
         except KeyError:
             # OPTICS cluster doesn't have probabilities
+            # so use the overlap with the cluster box instead
             probs = np.zeros(len(data['x']))
-            for i in range(len(data['x'])):
-                labeli = clusters['labels'][i]
-                if labeli == -1:
-                    probs[i] = 0
-                else:
-                    boxi_data = Polygon(get_box_edges(data['x'][i], data['y'][i],
-                                                      data['w'][i], data['h'][i],
-                                                      np.radians(data['a'][i]))[:4])
-                    boxi_clust = Polygon(get_box_edges(clusters['x'][labeli], clusters['y'][labeli],
-                                                       clusters['w'][labeli], clusters['h'][labeli],
-                                                       np.radians(clusters['a'][labeli]))[:4])
-
-                    probs[i] = boxi_data.intersection(
-                        boxi_clust).area/boxi_data.union(boxi_clust).area
+            labels = np.asarray(clusters['labels'], dtype=int)
+            clustered = np.where(labels != -1)[0]
+            if len(clustered) > 0:
+                boxes_data = shapely.polygons(get_box_edges_array(data['x'], data['y'], data['w'], data['h'],
+                                                                  np.radians(data['a'])))
+                boxes_clust = shapely.polygons(get_box_edges_array(clusters['x'], clusters['y'], clusters['w'],
+                                                                   clusters['h'], np.radians(clusters['a'])))
+
+                probs[clustered] = get_box_iou(boxes_data[clustered], boxes_clust[labels[clustered]])
             clusters['prob'] = probs
 
         return data, clusters
@@ -516,35 +1107,27 @@ class Aggregator:
         ax.scatter(cx1_i, cy1_i, 10.0, marker='x', color='yellow')
 
         # plot the raw boxes with a gray line
-        for j in range(len(x_i)):
-            points = get_box_edges(
-                x_i[j], y_i[j], w_i[j], h_i[j], np.radians(a_i[j]))
-            linewidthi = 0.2*pb_i[j]+0.1
-            ax.plot(points[:, 0], points[:, 1], '-',
-                    color='limegreen', linewidth=linewidthi)
+        points = get_box_edges_array(x_i, y_i, w_i, h_i, np.radians(a_i))
+        linewidthi = 0.2*np.asarray(pb_i)+0.1
+        ax.add_collection(LineCollection(points, colors='limegreen', linewidths=linewidthi))
 
         # plot the clustered box in blue
-        for j in range(len(cx_i)):
-            clust = get_box_edges(
-                cx_i[j], cy_i[j], cw_i[j], ch_i[j], np.radians(ca_i[j]))
+        clust = get_box_edges_array(cx_i, cy_i, cw_i, ch_i, np.radians(ca_i))
 
-            # calculate the bounding box for the cluster confidence
-            plus_sigma, minus_sigma = sigma_shape(
-                [cx_i[j], cy_i[j], cw_i[j], ch_i[j], np.radians(ca_i[j])], sg_i[j])
+        # calculate the bounding box for the cluster confidence
+        plus_sigma, minus_sigma = sigma_shape(
+            [np.asarray(cx_i), np.asarray(cy_i), np.asarray(cw_i), np.asarray(ch_i), np.radians(ca_i)],
+            np.asarray(sg_i))
 
-            # get the boxes edges
-            plus_sigma_box = get_box_edges(*plus_sigma)
-            minus_sigma_box = get_box_edges(*minus_sigma)
+        # get the boxes edges
+        plus_sigma_box = get_box_edges_array(*plus_sigma)
+        minus_sigma_box = get_box_edges_array(*minus_sigma)
 
-            # create a fill between the - and + sigma boxes
-            x_p = plus_sigma_box[:, 0]
-            y_p = plus_sigma_box[:, 1]
-            x_m = minus_sigma_box[:, 0]
-            y_m = minus_sigma_box[:, 1]
-            ax.fill(
-                np.append(x_p, x_m[::-1]), np.append(y_p, y_m[::-1]), color='white', alpha=0.3)
+        # create a fill between the - and + sigma boxes
+        bands = np.concatenate((plus_sigma_box, minus_sigma_box[:, ::-1]), axis=1)
+        ax.add_collection(PolyCollection(bands, color='white', alpha=0.3))
 
-            ax.plot(clust[:, 0], clust[:, 1], '-', linewidth=0.85, color='white')
+        ax.add_collection(LineCollection(clust, linewidths=0.85, colors='white'))
 
         ax.axis('off')
 
@@ -557,7 +1140,9 @@ class Aggregator:
 
     def load_classification_data(self, classification_file='box-the-jets-classifications.csv'):
         '''
-            Load the classification data into the aggregator from the CSV file
+            Load the classification data into the aggregator from the CSV file.
+            For large exports, use `iter_classifications` or `get_classification_stats`
+            to stream through the file instead
 
             Inputs
             ------
@@ -568,40 +1153,65 @@ class Aggregator:
         self.classification_data = ascii.read(
             classification_file, delimiter=',')
 
-    def get_retired_subjects(self):
+    def get_retired_subjects(self, classification_file=None, chunk_size=10000):
         '''
-            Loop through each subject and find out whether it has been retired.
-            This is currently very slow since it queries each subject against the
-            Zooniverse backend. Not required if the workflow has been completed.
-            Retired subjects are added to the `retired_subjects` attribute.
+            Find the subjects that have been retired using the `subject_data` in the
+            classification export, in a single pass through the classifications.
+            Not required if the workflow has been completed.
+            Retired subjects are added to the `retired_subjects` attribute and their
+            retirement times to the `retirement_times` attribute.
+
+            Inputs
+            ------
+            classification_file : str
+                path to the classification file. If given, the file is streamed in chunks
+                instead of using the data from `load_classification_data`
+            chunk_size : int
+                number of classifications to read at once when streaming the file
+
+            Outputs
+            -------
+            retired_subjects : numpy.ndarray
+                Sorted array of retired subject IDs
+            retirement_times : dict
+                Dictionary of subject ID -> retirement time (`numpy.datetime64`, NaT
+                if the export does not include the time)
         '''
-        subjects = np.unique(
-            np.vstack((self.points_data['subject_id'][:], self.box_data['subject_id'][:])))
-        print(len(subjects))
+        if classification_file is not None:
+            rows = ((record.subject_id, record['subject_data'])
+                    for chunk in iter_classifications(classification_file, chunk_size)
+                    for record in chunk)
+        else:
+            assert hasattr(self, 'classification_data'), \
+                "Please load the classification data using load_classification_data"
+            rows = zip(self.classification_data['subject_ids'],
+                       self.classification_data['subject_data'])
+
+        subjects = set(np.unique(np.concatenate(
+            (self.points_data['subject_id'][:], self.box_data['subject_id'][:]))).tolist())
+
+        self.retirement_times = {}
 
-        self.retired_subjects = []
+        for subject, metak in rows:
+            subject = int(subject)
 
-        assert hasattr(self, 'classification_data'), \
-            "Please load the classification data using load_classification_data"
+            # skip subjects we already know are retired and those not in the reductions
+            if (subject in self.retirement_times) or (subject not in subjects):
+                continue
 
-        for i, subject in enumerate(subjects):
-            print("\r [%-20s] %d/%d" %
-                  (int(i/len(subjects)*20)*'=', i+1, len(subjects)), end='')
+            # most classifications are made before the subject is retired,
+            # so skip those without decoding the JSON
+            if RETIRED_NULL.search(metak) is not None:
+                continue
 
-            # find the list of classifications for this subject
-            subject_classifications = self.classification_data[:][
-                self.classification_data['subject_ids'][:] == subject]
+            retired = json.loads(metak)[f"{subject}"]['retired']
+            if retired is not None:
+                retired_at = retired.get('retired_at') if isinstance(retired, dict) else None
+                self.retirement_times[subject] = parse_zooniverse_time(retired_at)
 
-            subject_metadata = subject_classifications['subject_data']
+        self.retired_subjects = np.asarray(sorted(self.retirement_times.keys()), dtype=int)
 
-            for k, metak in enumerate(subject_metadata):
-                metak = json.loads(metak)
-                retired_at = metak[f"{subject}"]['retired']
-                if retired_at is not None:
-                    # if this subject was retired, add it to the list
-                    # and continue to the next subject
-                    self.retired_subjects.append(subject)
-                    break
+        return self.retired_subjects, self.retirement_times
 
     def load_extractor_data(self, point_extractor_file='point_extractor_by_frame_box_the_jets.csv',
                             box_extractor_file='shape_extractor_rotateRectangle_box_the_jets.csv'):
@@ -610,10 +1220,10 @@ class Aggregator:
             together) and adds the table to the class
         '''
         self.point_extract_file = point_extractor_file
-        self.point_extracts = ascii.read(point_extractor_file, delimiter=',')
+        self.point_extracts = read_extract_table(point_extractor_file)
 
         self.box_extract_file = box_extractor_file
-        self.box_extracts = ascii.read(box_extractor_file, delimiter=',')
+        self.box_extracts = read_extract_table(box_extractor_file)
 
     def get_frame_time_base(self, subject, task='T1'):
         '''
@@ -1404,7 +2014,10 @@ class Aggregator:
             --------
             jets : list
                 List of `Jet` objects that are unique per subject (i.e.,
-                they do not share overlap with other jets in the subject)
+                they do not share overlap with other jets in the subject).
+                Empty if no box, start or end point cluster was found
+                (e.g. for subjects without jets, where only a few
+                volunteers drew a box)
         '''
         # get the box data and clusters for the two tasks
         data_T1, _ = self.get_box_data(subject, 'T1')
@@ -1417,6 +2030,11 @@ class Aggregator:
         unique_jets = self.find_unique_jets(subject)
         unique_starts, unique_ends = self.find_unique_jet_points(subject)
 
+        # without clusters there is no jet to build, and
+        # no jet to add the raw classifications to
+        if len(unique_jets['box']) == 0 or len(unique_starts) == 0 or len(unique_ends) == 0:
+            return []
+
         # combine the T1 and T5 raw data
         combined_boxes = {}
         for key in data_T1.keys():
@@ -1679,11 +2297,15 @@ class Jet:
             start_ext[:, 0], start_ext[:, 1], 'k.', markersize=1.)
         endextplot, = ax.plot(
             end_ext[:, 0], end_ext[:, 1], 'k.', markersize=1.)
-        boxextplots = []
-        for box in self.get_extract_boxes():
-            iou = box.intersection(self.box).area/box.union(self.box).area
-            boxextplots.append(
-                ax.plot(*box.exterior.xy, '-', color='limegreen', linewidth=0.5, alpha=0.65*iou+0.05)[0])
+
+        # plot the extract boxes as one collection, with the alpha
+        # of each box given by its overlap with the clustered box
+        box_edges = get_box_edges_array(self.box_extracts['x'], self.box_extracts['y'],
+                                        self.box_extracts['w'], self.box_extracts['h'],
+                                        np.radians(self.box_extracts['a']))
+        iou = get_box_iou(shapely.polygons(box_edges), self.box)
+        boxextplot = ax.add_collection(LineCollection(box_edges, colors=to_rgba_array('limegreen', alpha=0.65*iou+0.05),
+                                                      linewidths=0.5))
 
         # find the center of the box, so we can draw a vector through it
         center = np.mean(np.asarray(self.box.exterior.xy)[:, :4], axis=1)
@@ -1722,7 +2344,7 @@ class Jet:
                 ax.fill(
                     np.append(x_p, x_m[::-1]), np.append(y_p, y_m[::-1]), color='white', alpha=0.3)
 
-        return [boxplot, startplot, endplot, startextplot, endextplot, *boxextplots, arrowplot]
+        return [boxplot, startplot, endplot, startextplot, endextplot, boxextplot, arrowplot]
 
     def autorotate(self):
         '''
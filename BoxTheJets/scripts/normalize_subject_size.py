@@ -1,71 +1,122 @@
-from panoptes_client import Workflow, SubjectSet, Subject
+from panoptes_client import Workflow
 from astropy.io import ascii
-from astropy.table import Table
-from skimage import io
+from astropy.table import Table, MaskedColumn
 import numpy as np
 import os
-from multiprocessing import Pool
+import sys
+import csv
 import tqdm
-import signal
-import time
 import ast
+from contextlib import nullcontext
+
+sys.path.append('.')  # assumes you're running this code from BoxTheJets/
+from solarjets_common.fetcher import Fetcher, default_fetcher, get_subject_metadata, get_frame_url, get_image_size, is_transient
+from aggregation.workflow import parse_list_column
 
 FETCH_FROM_PANOPTES = False
 
 
-def initializer():
+def get_subject_scale(subject_id, fetcher=None):
     '''
-        Ignore CTRL+C in the worker process
+        Get the scale for all frames for a given subject.
+        Loads the subject from Panoptes and gets the image 
+        sizes from the image headers (only the first few kB of each
+        image are downloaded). Failed requests are
+        retried by the fetcher, and the final error is raised.
     '''
-    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if fetcher is None:
+        fetcher = default_fetcher
+
+    # get the subject metadata
+    raw = get_subject_metadata(subject_id, fetcher)
+    widths = np.zeros(15)
+    heights = np.zeros(15)
+
+    # loop through the frames
+    for frame in range(15):
+        # get the image URL on panoptes
+        frame_url = get_frame_url(raw, frame)
+
+        # read the image size from the header
+        # (falls back to reading the full image)
+        nx, ny = get_image_size(frame_url, fetcher)
 
+        widths[frame] = nx
+        heights[frame] = ny
 
-def get_subject_scale(subject_id):
+    # the standard size is 1920x1440 so
+    # we will scale everything else to that size
+    meta_width = float(raw['metadata']['#width'])
+    scale = widths / meta_width
+
+    # add this info to the table
+    data = [int(raw['id']), *scale]
+
+    return data
+
+
+def read_checkpoint(checkpoint, ncols):
     '''
-        Get the scale for all frames for a given subject.
-        Loads the subject from Panoptes and gets the image 
-        sizes by directly opening the image
+        Read the scales saved by an interrupted run. Rows that were not
+        fully written (e.g. if the run was killed mid-write) are skipped
     '''
-    try:
-        # create the subject object
-        subject = Subject(subject_id)
-        widths = np.zeros(15)
-        heights = np.zeros(15)
-
-        # loop through the frames
-        for frame in range(15):
-            # get the image URL on panoptes
+    rows = {}
+    if not os.path.exists(checkpoint):
+        return rows
+
+    with open(checkpoint, 'r', newline='') as infile:
+        reader = csv.reader(infile)
+        next(reader, None)
+        for row in reader:
+            if len(row) != ncols:
+                continue
             try:
-                frame_url = subject.raw['locations'][frame]['image/png']
-            except KeyError:
-                frame_url = subject.raw['locations'][frame]['image/jpeg']
+                rows[int(row[0])] = [int(row[0]), *[float(val) for val in row[1:]]]
+            except ValueError:
+                continue
 
-            # read the image from the url
-            img = io.imread(frame_url)
-            # and get its shape
-            ny, nx, _ = img.shape
+    return rows
 
-            widths[frame] = nx
-            heights[frame] = ny
 
-        # the standard size is 1920x1440 so
-        # we will scale everything else to that size
-        meta_width = float(subject.raw['metadata']['#width'])
-        scale = widths / meta_width
+def open_checkpoint(checkpoint, names):
+    '''
+        Open the checkpoint file to append the scales to, writing
+        the header if it is a new file
+    '''
+    new_checkpoint = not os.path.exists(checkpoint) or os.path.getsize(checkpoint) == 0
+    if not new_checkpoint:
+        # terminate a partially written last row before appending to it
+        with open(checkpoint, 'rb') as infile:
+            infile.seek(-1, os.SEEK_END)
+            partial_row = infile.read(1) not in b'\r\n'
 
-        # add this info to the table
-        data = [int(subject.id), *scale]
+    outfile = open(checkpoint, 'a', newline='')
+    if new_checkpoint:
+        csv.writer(outfile).writerow(names)
+    elif partial_row:
+        outfile.write('\r\n')
 
-        return data
-    except Exception as e:
-        return None
+    return outfile
 
 
-def get_scales_set(save=True):
+def get_scales_set(save=True, max_workers=8, max_attempts=3,
+                   checkpoint='configs/subject_scales_checkpoint.csv'):
     '''
         Process data for all subjects in the subject set
         and retrieve the corresponding scale wrt. the 1920x1440
-        standard
+        standard. Each scale is appended to the `checkpoint` file as soon
+        as it is retrieved, so that an interrupted run resumes where it
+        stopped. Subjects that fail with a transient error are retried in
+        later passes, up to `max_attempts` times.
+
+        Returns the table of scales and a dictionary of subject -> error
+        for the subjects that failed permanently. The table is only saved to
+        configs/subject_scales.csv (and the checkpoint removed) if all subjects
+        succeeded, so rerunning retries only the failed subjects.
+
+        With `save=False` the scales are only returned: the checkpoint is neither
+        read nor written, so the run starts from scratch and does not leave
+        rows behind for the next (saved) run to resume from.
     '''
     # create the column names and associated datatypes
     names = ['subject_id']
@@ -74,161 +125,143 @@ def get_scales_set(save=True):
         names.append(f'frame_{i}_scale')
         dtypes.append('f4')
 
-    # and initialize the empty table so we can add
-    # rows later on
-    table = Table(names=names, dtype=dtypes)
-
     if FETCH_FROM_PANOPTES:
         workflow = Workflow(19650)
         subject_set = workflow.links.subject_sets[0]
 
         subjects = []
         for subject in subject_set:
-            subjects.append(subject.id)
+            subjects.append(int(subject.id))
     else:
         subject_data = ascii.read('extracts/point_extractor_by_frame_box_the_jets.csv')
-        subjects = list(np.unique(subject_data['subject_id']))
-
-    # run this process in parallel since there is a lot of
-    # waiting for the API callback
-    run = 0
-    with Pool(initializer=initializer) as pool:
-        print(f"Running with {pool._processes} threads")
-        while len(subjects) > 0:
-            print(f"Pass {run+1}")
-            try:
-                r = tqdm.tqdm(pool.imap_unordered(get_subject_scale, subjects), total=len(subjects))
-
-                nfailed = 0
-                for result in r:
-                    # add the result to the table
-                    if result is not None:
-                        # the subject was downloaded successfully
-                        # so we can extract the scales
-                        table.add_row(result)
-
-                        # remove this subject from the queue
-                        subjects.remove(result[0])
-                    else:
-                        # there was an issue with the download
-                        # we will queue this subject to try again
-                        nfailed += 1
-                    r.set_postfix({'errors': nfailed})
-
-            except KeyboardInterrupt:
-                pool.close()
-                pool.terminate()
-                pool.join()
-            except Exception:
-                raise
+        subjects = [int(subject) for subject in np.unique(subject_data['subject_id'])]
+
+    # resume from the checkpoint of a previous run
+    rows = read_checkpoint(checkpoint, len(names)) if save else {}
+    pending = [subject for subject in subjects if subject not in rows]
+    if len(rows) > 0:
+        print(f"Resuming from {checkpoint}: {len(rows)} subjects done, {len(pending)} remaining")
+
+    # run this process concurrently since there is a lot of
+    # waiting for the API callback. each request is retried
+    # with a backoff by the fetcher
+    fetcher = Fetcher(max_workers=max_workers)
+    print(f"Running with {fetcher.max_workers} threads")
+
+    attempts = {}
+    failed = {}
+
+    with open_checkpoint(checkpoint, names) if save else nullcontext() as outfile:
+        writer = csv.writer(outfile) if save else None
+
+        while len(pending) > 0:
+            errors = {}
+            r = tqdm.tqdm(fetcher.imap(lambda subject: get_subject_scale(subject, fetcher), pending, retry=False),
+                          total=len(pending))
+            for subject, result, error in r:
+                if error is None:
+                    # the subject was downloaded successfully
+                    # so we can save the scales
+                    rows[subject] = result
+                    if writer is not None:
+                        writer.writerow(result)
+                        outfile.flush()
+                else:
+                    attempts[subject] = attempts.get(subject, 0) + 1
+                    errors[subject] = error
+                r.set_postfix({'errors': len(errors)})
+
+            # retry the subjects that failed with a transient error and have not
+            # reached the attempt limit (e.g. a missing subject is not retried)
+            pending = [subject for subject in errors if attempts[subject] < max_attempts and is_transient(errors[subject])]
+            failed.update({subject: errors[subject] for subject in errors if subject not in pending})
+
+    table = Table(rows=[rows[subject] for subject in subjects if subject in rows], names=names, dtype=dtypes)
+
+    if len(failed) > 0:
+        print(f"Could not get the scales for {len(failed)} subjects after {max_attempts} attempts:")
+        for subject, error in failed.items():
+            print(f"    {subject}: {error!r}")
+        if save:
+            print(f"Progress is saved in {checkpoint}. Rerun to retry the failed subjects")
+    elif save:
+        table.write('configs/subject_scales.csv', format='csv', overwrite=True)
+        os.remove(checkpoint)
 
-            run += 1
+    return table, failed
 
-        pool.close()
-        pool.join()
 
-    if save:
-        table.write('configs/subject_scales.csv', format='csv', overwrite=True)
+def rescale_extracts(data, table, tools, keys):
+    '''
+        Divide the extracts in `data` by the scale of the corresponding subject
+        and frame. Every column is parsed in bulk and divided by the per-row
+        scale, and the rows of subjects that are not in `table` are left as is
+    '''
+    data_sc = data.copy()
+    if len(table) == 0:
+        return data_sc
 
-    return table
+    # join the scale table to the extracts on the subject ID
+    sort_index = np.argsort(np.asarray(table['subject_id']), kind='stable')
+    scale_subjects = np.asarray(table['subject_id'])[sort_index]
+    scales = np.asarray([table[f'frame_{frame}_scale'] for frame in range(15)], dtype=np.float64).T[sort_index]
 
+    subjects = np.asarray(data['subject_id'])
+    pos = np.clip(np.searchsorted(scale_subjects, subjects), 0, len(table) - 1)
+    has_scale = scale_subjects[pos] == subjects
+    row_scales = scales[pos]
 
-def modify_extracts(table, point_extracts='extracts/point_extractor_by_frame_box_the_jets.csv',
-                    box_extracts='extracts/shape_extractor_rotateRectangle_box_the_jets.csv'):
-    points_data = ascii.read(point_extracts, delimiter=',')
-    points_data_sc = points_data.copy()
+    tasks = np.asarray(data['task'], dtype=str)
 
-    # increase the string length so that
-    # we don't get string truncation
     for task in ['T1', 'T5']:
+        rows = has_scale & (tasks == task)
         for frame in range(15):
-            for tool in ['tool0', 'tool1']:
-                for key in ['x', 'y']:
+            for tool in tools:
+                for key in keys:
                     col = f'data.frame{frame}.{task}_{tool}_{key}'
-                    points_data_sc[col] = points_data_sc[col].astype('<U40')
-
-    # loop through all the subjects
-    for row in tqdm.tqdm(table, desc='Processing points'):
-        subject = row['subject_id']
-
-        # find the relevant subjects in the point extractor
-        mask = np.where(points_data['subject_id'] == subject)[0]
-
-        # for each extract
-        for row_ind in mask:
-            task = points_data['task'][row_ind]
-
-            # for each frame, tool and data value (x,y)
-            for frame in range(15):
-                scale = row[f'frame_{frame}_scale']
-                for tool in ['tool0', 'tool1']:
-                    for key in ['x', 'y']:
+                    if col not in data.colnames:
+                        continue
+
+                    column = data[col]
+                    mask = np.ma.getmaskarray(column)
+                    # only the rows with data are rewritten
+                    update = np.where(rows & ~mask)[0]
+                    if len(update) == 0:
+                        continue
+
+                    column_sc = np.asarray(np.ma.getdata(column), dtype=object)
+
+                    values, offsets = parse_list_column(column)
+                    if values is not None:
+                        # divide each value by the scale of its row
+                        value_rows = np.repeat(np.arange(len(data)), np.diff(offsets))
+                        scaled = (values / row_scales[value_rows, frame]).tolist()
+
+                        for row_ind in update:
+                            column_sc[row_ind] = str(scaled[offsets[row_ind]:offsets[row_ind + 1]])
+                    else:
+                        # parse the rows one by one and skip the invalid entries
+                        for row_ind in update:
+                            try:
+                                entry = ast.literal_eval(str(column_sc[row_ind]))
+                                column_sc[row_ind] = str([float(val) / float(row_scales[row_ind, frame]) for val in entry])
+                            except (ValueError, SyntaxError, TypeError):
+                                continue
 
-                        # get the extract
-                        col = f'data.frame{frame}.{task}_{tool}_{key}'
-                        data = points_data[col][row_ind]
+                    data_sc[col] = MaskedColumn(column_sc.astype(str), mask=mask)
 
-                        # check if the entry has data
-                        try:
-                            # convert to list
-                            data = ast.literal_eval(data)
+    return data_sc
 
-                            # apply the scaling
-                            data_scaled = [val / scale for val in data]
 
-                            # and save it back to the scaled table
-                            points_data_sc[col][row_ind] = str(data_scaled)
-                        except ValueError:
-                            continue
+def modify_extracts(table, point_extracts='extracts/point_extractor_by_frame_box_the_jets.csv',
+                    box_extracts='extracts/shape_extractor_rotateRectangle_box_the_jets.csv'):
+    points_data = ascii.read(point_extracts, delimiter=',')
+    points_data_sc = rescale_extracts(points_data, table, ['tool0', 'tool1'], ['x', 'y'])
     points_data_sc.write(point_extracts.replace('.csv', '_scaled.csv'), delimiter=',', overwrite=True)
 
-    # repeat for the box data
+    # repeat for the box data (the angle is not scaled)
     box_data = ascii.read(box_extracts, delimiter=',')
-    box_data_sc = box_data.copy()
-
-    # increase the string length so that
-    # we don't get string truncation
-    for task in ['T1', 'T5']:
-        for frame in range(15):
-            for tool in ['tool2']:
-                for key in ['x', 'y', 'width', 'height', 'angle']:
-                    col = f'data.frame{frame}.{task}_{tool}_{key}'
-                    box_data_sc[col] = box_data_sc[col].astype('<U40')
-
-    # loop through all the subjects
-    for row in tqdm.tqdm(table, desc='Processing box'):
-        subject = row['subject_id']
-
-        # find the relevant subjects in the point extractor
-        mask = np.where(box_data['subject_id'] == subject)[0]
-
-        # for each extract
-        for row_ind in mask:
-            task = box_data['task'][row_ind]
-
-            # for each frame, tool and data value (x,y)
-            for frame in range(15):
-                scale = row[f'frame_{frame}_scale']
-                for tool in ['tool2']:
-                    for key in ['x', 'y', 'width', 'height']:
-
-                        # get the extract
-                        col = f'data.frame{frame}.{task}_{tool}_{key}'
-                        data = box_data_sc[col][row_ind]
-
-                        # check if the entry has data
-                        try:
-                            # convert to list
-                            data = ast.literal_eval(data)
-
-                            # apply the scaling
-                            data_scaled = [val / scale for val in data]
-
-                            # and save it back to the original array
-                            box_data_sc[col][row_ind] = str(data_scaled)
-                        except ValueError:
-                            continue
-
+    box_data_sc = rescale_extracts(box_data, table, ['tool2'], ['x', 'y', 'width', 'height'])
     box_data_sc.write(box_extracts.replace('.csv', '_scaled.csv'), format='csv', overwrite=True)
 
 
@@ -236,5 +269,7 @@ if __name__ == '__main__':
     if os.path.exists('configs/subject_scales.csv'):
         table = ascii.read('configs/subject_scales.csv')
     else:
-        table = get_scales_set(save=True)
+        table, failed = get_scales_set(save=True)
+        if len(failed) > 0:
+            sys.exit(1)
     modify_extracts(table)
@@ -0,0 +1,40 @@
+import sys
+import argparse
+
+sys.path.append('.')  # assumes you're running this code from BoxTheJets/
+from solarjets_common.fetcher import Fetcher
+from aggregation.frame_store import FrameStore
+from aggregation.meta_file_handler import MetaFile
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download the subject frames into the local frame store')
+    parser.add_argument('--subjects', nargs='+', type=int, default=[], metavar='SUBJECT',
+                        help='Zooniverse subject IDs to add')
+    parser.add_argument('--sol', nargs='+', default=[], metavar='SOL',
+                        help='add all the subjects of these SOL events (e.g. SOL2011-01-01T00:00:00L000C000)')
+    parser.add_argument('--metafile', default='../Meta_data_subjects.json',
+                        help='subject metadata file, used to find the subjects of the SOL events')
+    parser.add_argument('--store', default='frame_store', help='directory of the frame store')
+    parser.add_argument('--threads', type=int, default=8, help='number of subjects to download at once')
+    parser.add_argument('--overwrite', action='store_true', help='download the subjects already in the store again')
+    args = parser.parse_args()
+
+    if len(args.subjects) == 0 and len(args.sol) == 0:
+        parser.error('no subjects or SOL events given')
+
+    store = FrameStore(args.store)
+    fetcher = Fetcher(max_workers=args.threads)
+
+    added, errors = store.populate(args.subjects, fetcher, args.overwrite)
+    if len(args.sol) > 0:
+        added_sol, errors_sol = store.populate_sol(args.sol, MetaFile(args.metafile), fetcher, args.overwrite)
+        added.extend(added_sol)
+        errors.update(errors_sol)
+
+    print(f"Added {len(added)} subjects to {args.store}")
+    if len(errors) > 0:
+        print(f"Could not add {len(errors)} subjects:")
+        for subject, error in errors.items():
+            print(f"    {subject}: {error!r}")
+        sys.exit(1)
@@ -1,132 +1,159 @@
 import numpy as np
 from astropy.io import ascii
+from astropy.table import MaskedColumn
 import ast
 
-## point extractor
-file = 'extracts/point_extractor_by_frame_box_the_jets_scaled.csv'
 
-data = ascii.read(file, delimiter=',')
+def get_column_data(column):
+    '''
+        Get the values (as an object array, so that strings of any length
+        can be stored) and the mask of a table column
+    '''
+    values = np.asarray(np.ma.getdata(column), dtype=object).copy()
+    mask = np.ma.getmaskarray(column).copy()
 
-# fixing FixedWidth errors
-for col in data.itercols():
-    data.replace_column(col.name, col.astype('object'))
+    return values, mask
 
-colnames = data.colnames
-# get the col names for each variable in frame0
-col0 = sorted([i for i in colnames if 'frame0' in i])
 
-for k, col0k in enumerate(col0):
-    for j in range(1,15):
-        # we can modify the frame0 tag to frame[n]
-        coltype = col0k.replace('frame0', 'frame%d'%j)
-        data[coltype].fill_value = 'N/A'
+def squash_frames(data, empty_value='N/A'):
+    '''
+        Move the extracts from all the frames to the frame0 columns, so that
+        they are reduced together. The extract in the last frame with data wins
+        if a row has data in more than one frame, and the moved
+        entries are replaced with an empty string
 
-        # find the rows where there is data
-        mask = np.asarray(data[coltype][:].filled()) != 'N/A'
+        Inputs
+        ------
+        data : astropy.table.Table
+            extractor table (points or shapes)
+        empty_value : str
+            entries with this value are treated as empty
+
+        Outputs
+        -------
+        squashed : astropy.table.Table
+            copy of the table with the extracts moved to frame0
+    '''
+    squashed = data.copy()
+
+    # get the col names for each variable in frame0
+    col0 = sorted([col for col in data.colnames if 'frame0' in col])
+
+    for col0k in col0:
+        values0, mask0 = get_column_data(data[col0k])
 
-        # move those rows to frame0
-        data[col0[k]][mask] = data[coltype][mask]
+        for j in range(1, 15):
+            # we can modify the frame0 tag to frame[n]
+            coltype = col0k.replace('frame0', f'frame{j}')
+            values, mask = get_column_data(data[coltype])
 
-        # and delete the other row
-        data[coltype][mask] = ''
+            # find the rows where there is data
+            has_data = ~mask & (values != empty_value)
+            if not np.any(has_data):
+                continue
 
-# get the col names for each variable in frame0 in T1
-col0 = sorted([i for i in colnames if 'frame0.T1' in i])
+            # move those rows to frame0
+            values0[has_data] = values[has_data]
+            mask0[has_data] = False
 
-data_merged = data.copy()
+            # and delete the other row
+            values[has_data] = ''
+            squashed[coltype] = MaskedColumn(values.astype(str), mask=mask)
 
-for k, col0k in enumerate(col0):
-    
-    # we can modify the frame0 tag to frame[n]
-    colT5 = col0k.replace('T1', 'T5')
-    data_merged[colT5].fill_value = 'N/A'
+        squashed[col0k] = MaskedColumn(values0.astype(str), mask=mask0)
 
-    print(col0k, colT5)
+    return squashed
 
-    # find the rows where there is data
-    mask = np.where(np.asarray(data_merged[colT5][:].filled()) != 'N/A')[0]
 
-    for row in mask:
-        classification_id = data_merged['classification_id'][row]
-        row_T1 = np.where((data_merged['classification_id'][:]==classification_id)&(data_merged['task'][:]=='T1'))[0][0]
-        try:
-            dataT1 = ast.literal_eval(data_merged[col0k][row_T1])
-        except ValueError:
-            dataT1 = []
+def merge_tasks(data, empty_value='N/A'):
+    '''
+        Merge the frame0 extracts of the second jet (T5) into the T1 row of
+        the same classification, so that both jets are reduced together. The T5
+        entries are replaced with an empty string
 
-        dataT5 = ast.literal_eval(data_merged[colT5][row])
+        Inputs
+        ------
+        data : astropy.table.Table
+            squashed extractor table (see `squash_frames`)
+        empty_value : str
+            entries with this value are treated as empty
 
-        # combine the T5 info with T1
-        outdata = []
-        outdata.extend(dataT1)
-        outdata.extend(dataT5)
+        Outputs
+        -------
+        merged : astropy.table.Table
+            copy of the table with the T5 extracts merged into T1
+    '''
+    merged = data.copy()
 
-        # move those rows to frame0
-        data_merged[col0[k]][row_T1] = str(outdata)
-        # print(row, outdata)
+    # find the T1 row for each classification
+    classification_ids = np.asarray(data['classification_id']).tolist()
+    tasks = np.asarray(data['task'], dtype=str)
+    rows_T1 = {}
+    for row in np.where(tasks == 'T1')[0]:
+        rows_T1.setdefault(classification_ids[row], row)
 
-        # and delete the other row
-        data_merged[colT5][row] = ''
+    # get the col names for each variable in frame0 in T1
+    col0 = sorted([col for col in data.colnames if 'frame0.T1' in col])
 
-ascii.write(data, file.replace('.csv', '_squashed.csv'), overwrite=True, delimiter=',')
-ascii.write(data_merged, file.replace('.csv', '_squashed_merged.csv'), overwrite=True, delimiter=',')
+    for col0k in col0:
+        colT5 = col0k.replace('T1', 'T5')
+
+        valuesT1, maskT1 = get_column_data(data[col0k])
+        valuesT5, maskT5 = get_column_data(data[colT5])
+
+        # find the rows where there is data
+        rows = np.where(~maskT5 & (valuesT5 != empty_value))[0]
+        if len(rows) == 0:
+            continue
 
-## shape extractor
-file = 'extracts/shape_extractor_rotateRectangle_box_the_jets_scaled.csv'
+        for row in rows:
+            row_T1 = rows_T1[classification_ids[row]]
+            try:
+                dataT1 = ast.literal_eval(valuesT1[row_T1]) if not maskT1[row_T1] else []
+            except ValueError:
+                dataT1 = []
 
-data = ascii.read(file, delimiter=',')
+            dataT5 = ast.literal_eval(valuesT5[row])
 
-# fixing FixedWidth errors
-for col in data.itercols():
-    data.replace_column(col.name, col.astype('object'))
+            # combine the T5 info with T1
+            valuesT1[row_T1] = str([*dataT1, *dataT5])
+            maskT1[row_T1] = False
 
-colnames = data.colnames
+            # and delete the other row
+            valuesT5[row] = ''
 
-col0 = sorted([i for i in colnames if 'frame0' in i])
+        merged[col0k] = MaskedColumn(valuesT1.astype(str), mask=maskT1)
+        merged[colT5] = MaskedColumn(valuesT5.astype(str), mask=maskT5)
 
-for k, col0k in enumerate(col0):
-    for j in range(1,15):
-        coltype = col0k.replace('frame0', 'frame%d'%j)
-        data[coltype].fill_value = 'None'
-        mask = np.asarray(data[coltype][:].filled()) == 'None'
-        data[col0[k]][~mask] = data[coltype][~mask]
-        data[coltype][~mask] = ''
+    return merged
 
-# get the col names for each variable in frame0 in T1
-data_merged = data.copy()
-col0 = sorted([i for i in colnames if 'frame0.T1' in i])
-for k, col0k in enumerate(col0):
-    
-    # we can modify the frame0 tag to frame[n]
-    colT5 = col0k.replace('T1', 'T5')
-    data_merged[colT5].fill_value = 'N/A'
 
-    print(col0k, colT5)
+def squash_extracts(file, empty_value='N/A'):
+    '''
+        Squash the frames of an extractor file and merge its T5 extracts into T1.
+        Writes the `_squashed.csv` and `_squashed_merged.csv` files next to the input
 
-    # find the rows where there is data
-    mask = np.where(np.asarray(data_merged[colT5][:].filled()) != 'N/A')[0]
+        Inputs
+        ------
+        file : str
+            path to the (scaled) extractor csv-file
+        empty_value : str
+            entries with this value are treated as empty
+    '''
+    data = ascii.read(file, delimiter=',')
 
-    for row in mask:
-        classification_id = data_merged['classification_id'][row]
-        row_T1 = np.where((data_merged['classification_id'][:]==classification_id)&(data_merged['task'][:]=='T1'))[0][0]
-        try:
-            dataT1 = ast.literal_eval(data_merged[col0k][row_T1])
-        except ValueError:
-            dataT1 = []
+    squashed = squash_frames(data, empty_value)
+    merged = merge_tasks(squashed)
 
-        dataT5 = ast.literal_eval(data_merged[colT5][row])
+    ascii.write(squashed, file.replace('.csv', '_squashed.csv'), overwrite=True, delimiter=',')
+    ascii.write(merged, file.replace('.csv', '_squashed_merged.csv'), overwrite=True, delimiter=',')
 
-        # combine the T5 info with T1
-        outdata = []
-        outdata.extend(dataT1)
-        outdata.extend(dataT5)
+    return squashed, merged
 
-        # move those rows to the T1 array
-        data_merged[col0[k]][row_T1] = str(outdata)
-        # print(row, outdata)
 
-        # and delete the other row
-        data_merged[colT5][row] = ''
+if __name__ == '__main__':
+    ## point extractor
+    squash_extracts('extracts/point_extractor_by_frame_box_the_jets_scaled.csv', empty_value='N/A')
 
-ascii.write(data, file.replace('.csv', '_squashed.csv'), overwrite=True, delimiter=',')
-ascii.write(data_merged, file.replace('.csv', '_squashed_merged.csv'), overwrite=True, delimiter=',')
+    ## shape extractor
+    squash_extracts('extracts/shape_extractor_rotateRectangle_box_the_jets_scaled.csv', empty_value='None')
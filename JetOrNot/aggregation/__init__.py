@@ -1,2 +1,9 @@
 from .questionresult import *
-from .meta_file_handler import *
\ No newline at end of file
+from .meta_file_handler import *
+from solarjets_common.fetcher import *
+from solarjets_common.gif_writer import *
+from solarjets_common.instrumentation import *
+
+# time the modules of this package too when the instrumentation is enabled
+register_package(__name__)
+enable_from_environment()
@@ -1,7 +1,11 @@
+import os
 import json
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import sys
 import datetime
 import numpy as np
-from dateutil.parser import parse
 
 # First three functions are to read out the Zooniverse subjects file and make the metafile
 # The class MetaFile is to read out the produced metafile
@@ -20,12 +24,143 @@ def convert_fileName_to_datetime(fileName: str):
             datetime format in UTC
     '''
 
-    try:
-        dateTimeComponents = fileName.split('_')[2:4]
-        return parse(f'{dateTimeComponents[0]}T{dateTimeComponents[1]}')
-    except:
+    time = convert_fileNames_to_datetime64([fileName])[0]
+    if np.isnat(time):
         print('dateTime could not be extracted')
         return ''
+    return time.astype(datetime.datetime)
+
+
+def convert_fileNames_to_datetime64(fileNames):
+    '''
+        Takes an array of Zooniverse filenames and converts them to datetime64 in one step.
+        The date and time digits are read from the filenames at their fixed offsets, and only
+        the filenames which do not follow the standard format are split one by one
+
+        Inputs
+        ------
+        fileNames: np.array
+            Filenames for the images in zooniverse format ssw_cutout_YYYYMMdd_hhmmss_aia_304_####.png
+        Outputs
+        ------
+        np.array(dtype='datetime64[s]')
+            times in UTC (NaT where the time could not be extracted)
+    '''
+    names = np.asarray(fileNames, dtype=str).ravel()
+    if len(names) == 0:
+        return np.asarray([], dtype='datetime64[s]')
+
+    # character codes of the filenames (at least 27 characters wide, so that
+    # the separator after the time can be checked)
+    width = max(names.dtype.itemsize // 4, 27)
+    codes = names.astype(f'<U{width}').view(np.uint32).reshape(len(names), width).astype(np.int64)
+
+    # YYYYMMdd is at characters 11-18 and hhmmss at 20-25 (ssw_cutout_YYYYMMdd_hhmmss_...)
+    digits = codes[:, np.r_[11:19, 20:26]] - ord('0')
+    underscore = ord('_')
+    standard = (np.all((digits >= 0) & (digits <= 9), axis=1) & (codes[:, 10] == underscore)
+                & (codes[:, 19] == underscore) & np.isin(codes[:, 26], [underscore, 0])
+                & (np.sum(codes[:, :10] == underscore, axis=1) == 1))
+
+    year = digits[:, 0:4] @ [1000, 100, 10, 1]
+    month = digits[:, 4:6] @ [10, 1]
+    day = digits[:, 6:8] @ [10, 1]
+    hour = digits[:, 8:10] @ [10, 1]
+    minute = digits[:, 10:12] @ [10, 1]
+    second = digits[:, 12:14] @ [10, 1]
+
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days_in_month = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(int)
+    standard &= ((month >= 1) & (month <= 12) & (day >= 1) & (day <= days_in_month)
+                 & (hour < 24) & (minute < 60) & (second < 60))
+
+    times = (months.astype('datetime64[D]') + (day - 1)).astype('datetime64[s]') + (hour * 3600 + minute * 60 + second)
+    times[~standard] = np.datetime64('NaT')
+
+    # the filenames that do not follow the standard format are split one by one
+    for i in np.where(~standard)[0]:
+        try:
+            date, time = str(names[i]).split('_')[2:4]
+        except ValueError:
+            continue
+        try:
+            times[i] = np.datetime64(f'{date[:4]}-{date[4:6]}-{date[6:8]}T{time[:2]}:{time[2:4]}:{time[4:6]}', 's')
+        except ValueError:
+            print(f'dateTime could not be extracted from {names[i]}')
+
+    return times
+
+
+def strings_to_datetime64(datetimestrings):
+    '''
+        Convert an array of 'YYYY-MM-dd hh:mm:ss' strings (e.g. the startDate/endDate
+        in the metadata file) to datetime64 in one step
+        Inputs
+        ------
+        datetimestrings: np.array
+            datetime strings (empty strings are converted to NaT)
+        Outputs
+        ------
+        np.array(dtype='datetime64[us]')
+    '''
+    datetimestrings = np.asarray(datetimestrings, dtype=str)
+    try:
+        return np.asarray(datetimestrings, dtype='datetime64[us]')
+    except ValueError:
+        times = np.full(len(datetimestrings), np.datetime64('NaT'), dtype='datetime64[us]')
+        for i, datetimestring in enumerate(datetimestrings):
+            try:
+                times[i] = np.datetime64(string_to_datetime(datetimestring), 'us')
+            except ValueError:
+                print(f'dateTime could not be extracted from {datetimestring}')
+        return times
+
+
+def get_subject_metadata_lookup(metadata, subjects, keys):
+    '''
+        Get a lookup of the metadata keys for a set of subjects from a local metadata source
+        Inputs
+        ------
+        metadata: MetaFile or str
+            MetaFile object, path to the metadata json file (e.g. Meta_data_subjects.json)
+            or path to the Zooniverse subjects export (e.g. solar-jet-hunter-subjects.csv)
+        subjects: np.array
+            Zooniverse subject IDs to look up
+        keys: list
+            metadata keys to get for each subject
+        Outputs
+        ------
+        lookup: dict
+            dictionary of subject ID -> {key: value}. Subjects which are not in the
+            metadata source or which do not have all the keys are left out
+    '''
+    subjects = set(int(subject) for subject in subjects)
+    lookup = {}
+
+    if isinstance(metadata, str) and metadata.endswith('.csv'):
+        # stream the subjects export, keeping the last row for each subject
+        csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+        with open(metadata, 'r', newline='') as infile:
+            for row in csv.DictReader(infile):
+                subject = int(row['subject_id'])
+                if subject not in subjects:
+                    continue
+                allData = json.loads(row['metadata'])
+                if all(key in allData for key in keys):
+                    lookup[subject] = {key: allData[key] for key in keys}
+                else:
+                    lookup.pop(subject, None)
+        return lookup
+
+    if isinstance(metadata, str):
+        metadata = MetaFile(metadata)
+
+    for x in metadata.data:
+        subject = int(x['subjectId'])
+        if subject in subjects and all(key in x['data'] for key in keys):
+            lookup[subject] = {key: x['data'][key] for key in keys}
+
+    return lookup
 
 
 def create_subjectinfo(subject, subjectsdata):
@@ -42,6 +177,51 @@ def create_subjectinfo(subject, subjectsdata):
         wantedDict: dict
             dictionary of the wanted metadata for the given subject
     '''
+    metadata = group_subjects_metadata(subjectsdata, [subject]).get(int(subject))
+
+    return get_subjectinfo(subject, metadata)
+
+
+def group_subjects_metadata(subjectsdata, subjects=None):
+    '''
+        Group the Zooniverse subjectsdata by subject ID in a single pass. If a subject
+        occurs more than once, the last row is kept
+        Inputs
+        ------
+        subjectsdata: astropy.table.table.Table
+            data Table with Zooniverse metadata keys ['subject_id','metadata']
+        subjects: np.array
+            subjects to keep (default: all)
+        Outputs
+        ------
+        metadata: dict
+            dictionary of subject ID -> metadata JSON string
+    '''
+    wanted = None if subjects is None else set(int(subject) for subject in subjects)
+
+    metadata = {}
+    for subject, subject_metadata in zip(np.asarray(subjectsdata['subject_id']).tolist(), subjectsdata['metadata']):
+        if wanted is None or subject in wanted:
+            metadata[subject] = str(subject_metadata)
+
+    return metadata
+
+
+def get_subjectinfo(subject, metadata):
+    '''
+        Makes a reduced meta dictionary containing chosen keys only from the metadata of a subject
+        Inputs
+        ------
+        subject: int
+            Zooniverse subject ID
+        metadata: str
+            metadata JSON string of the subject from the Zooniverse subjects export
+            (None if the subject is not in the export)
+        Outputs
+        ------
+        wantedDict: dict
+            dictionary of the wanted metadata for the given subject
+    '''
 
     # Select keys we want to write to json file
     keysToImport = [
@@ -67,7 +247,7 @@ def create_subjectinfo(subject, subjectsdata):
         '#im_ur_y'  # Horizontal distance in pixels between bottom left corner and end solar image
     ]
     try:
-        allData = json.loads(subjectsdata[subjectsdata['subject_id'] == subject][-1]['metadata'])
+        allData = json.loads(metadata)
         wantedDict = {key: allData[key] for key in keysToImport}
         wantedDict['startDate'] = str(convert_fileName_to_datetime(wantedDict['#file_name_0']))
         wantedDict['endDate'] = str(convert_fileName_to_datetime(wantedDict['#file_name_14']))
@@ -80,8 +260,7 @@ def create_subjectinfo(subject, subjectsdata):
         print(
             f"Not all metadata available for subject {subject} atempting to gather minimal information")
         try:
-            allData = json.loads(
-                subjectsdata[subjectsdata['subject_id'] == subject][-1]['metadata'])
+            allData = json.loads(metadata)
             reducedwantedDict = {key: allData[key] for key in [
                 "#file_name_0", "#file_name_14", "#sol_standard"]}
             reducedwantedDict['startDate'] = str(
@@ -142,7 +321,15 @@ def create_allmetadata_subjectinfo(subject, subjectsdata):
             return {}
 
 
-def create_metadata_jsonfile(filename: str, subjectstoloop: np.array, subjectsdata):
+def get_subject_entries(chunk):
+    '''
+        Get the metafile entries for a chunk of (subject, metadata) pairs
+        (run in the worker processes of `create_metadata_jsonfile`)
+    '''
+    return [{'subjectId': int(subject), 'data': get_subjectinfo(subject, metadata)} for subject, metadata in chunk]
+
+
+def create_metadata_jsonfile(filename: str, subjectstoloop: np.array, subjectsdata, processes=None, chunk_size=1000):
     '''
         Write out the metadata file for a given set of subjectstoloop to filename
         Inputs
@@ -153,21 +340,39 @@ def create_metadata_jsonfile(filename: str, subjectstoloop: np.array, subjectsda
             List of subjects for which the metadata should be gathered
         subjectsdata: astropy.table.table.Table
             data Table with Zooniverse metadata keys ['subject_id','metadata']
+        processes: int
+            Number of worker processes used to parse the metadata (default: number of CPUs).
+            Set to 1 to parse in the main process
+        chunk_size: int
+            Number of subjects sent to a worker at once
 
+        The subjectsdata is grouped by subject once, the metadata is parsed in chunks by
+        the workers and the (compact) JSON is written out in order as the chunks finish
     '''
-    file = open(filename, 'w')
-    file.write('[')
-    for i, subject in enumerate(subjectstoloop):
-        print("\r [%-40s] %d/%d" %
-              (int(i/len(subjectstoloop)*40)*'=', i+1, len(subjectstoloop)), end='')
-        subjectDict = {}
-        subjectDict['subjectId'] = int(subject)
-        subjectDict['data'] = create_metadata_jsonfile(subject, subjectsdata)
-        if i != len(subjectstoloop) - 1:
-            file.write(json.dumps(subjectDict, indent=3) + ',')
+    metadata = group_subjects_metadata(subjectsdata, subjectstoloop)
+    items = [(int(subject), metadata.get(int(subject))) for subject in subjectstoloop]
+    chunks = [items[k:k + chunk_size] for k in range(0, len(items), chunk_size)]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(chunks))
+
+    with ExitStack() as stack:
+        if processes > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=processes))
+            results = (entry for entries in pool.map(get_subject_entries, chunks) for entry in entries)
         else:
-            file.write(json.dumps(subjectDict, indent=3) + ']')
-    file.close()
+            results = (entry for chunk in chunks for entry in get_subject_entries(chunk))
+
+        file = stack.enter_context(open(filename, 'w'))
+        file.write('[')
+        for i, subjectDict in enumerate(results):
+            print("\r [%-40s] %d/%d" %
+                  (int(i/len(subjectstoloop)*40)*'=', i+1, len(subjectstoloop)), end='')
+            if i > 0:
+                file.write(',')
+            json.dump(subjectDict, file, separators=(',', ':'))
+        file.write(']')
     print(' ')
     print("succesfully wrote subject information to file " + filename)
 
@@ -199,7 +404,34 @@ class MetaFile:
         self.file_name = file_name
         self.data = data
         self.subjects = np.asarray([x['subjectId'] for x in data])
-        self.SOL_unique = np.unique([x['data']['#sol_standard'] for x in data])
+        self.sol_standards = np.asarray([x['data']['#sol_standard'] for x in data])
+        self.SOL_unique = np.unique(self.sol_standards)
+
+        # row of each subject (the first one if a subject occurs more than once)
+        self.subject_index = {}
+        for i, subject in enumerate(self.subjects.tolist()):
+            self.subject_index.setdefault(subject, i)
+
+        # parse the dates once, so that they are not re-parsed on every query
+        self.dates = {key: strings_to_datetime64([x['data'].get(key, '') for x in data])
+                      for key in ['startDate', 'endDate']}
+
+    def get_subject_index(self, subject: int):
+        '''
+            Get the row of a subject in the metadata
+            Inputs
+            ------
+            subject: int
+                Zooniverse subject ID
+            Outputs
+            ------
+            int
+                index of the subject in self.data
+        '''
+        try:
+            return self.subject_index[int(subject)]
+        except KeyError:
+            raise IndexError(f'subjectId {subject} not found in {self.file_name}')
 
     def get_subjectid_by_solstandard(self, sol_standard: str):
         '''
@@ -264,7 +496,7 @@ class MetaFile:
         '''
         try:
             if key == 'startDate' or key == 'endDate':
-                return np.asarray([string_to_datetime(x['data'][key]) for x in self.data if x['data']['#sol_standard'] == sol_standard], dtype='datetime64')
+                return self.dates[key][self.sol_standards == sol_standard]
             else:
                 return np.asarray([x['data'][key] for x in self.data if x['data']['#sol_standard'] == sol_standard])
         except KeyError:
@@ -291,8 +523,9 @@ class MetaFile:
         '''
 
         try:
-            S, E = string_to_datetime(start_date), string_to_datetime(end_date)
-            return np.asarray([x['subjectId'] for x in self.data if S < string_to_datetime(x['data']['startDate']) < E])
+            S, E = np.datetime64(string_to_datetime(start_date)), np.datetime64(string_to_datetime(end_date))
+            startDate = self.dates['startDate']
+            return self.subjects[(S < startDate) & (startDate < E)]
         except ValueError:
             print('ERROR: the start_date and end_date should be in format \'YYY-MM-dd\' or \'YYYY-MM-dd\' hh:mm:ss')
         except:
@@ -342,7 +575,7 @@ class MetaFile:
         '''
         try:
             if key == 'startDate' or key == 'endDate':
-                return np.asarray([string_to_datetime(x['data'][key]) for x in self.data if x['subjectId'] == subject], dtype='datetime64')[0]
+                return self.dates[key][self.get_subject_index(subject)]
             else:
                 return np.asarray([x['data'][key] for x in self.data if x['subjectId'] == subject])[0]
         except KeyError:
@@ -370,7 +603,7 @@ class MetaFile:
         '''
         try:
             if key == 'startDate' or key == 'endDate':
-                return np.asarray([[string_to_datetime(x['data'][key]) for x in self.data if x['subjectId'] == subjectId][0] for subjectId in subjectidlist], dtype='datetime64')
+                return self.dates[key][[self.get_subject_index(subjectId) for subjectId in subjectidlist]]
             else:
                 return np.asarray([[x['data'][key] for x in self.data if x['subjectId'] == subjectId][0] for subjectId in subjectidlist])
         except KeyError:
@@ -1,10 +1,24 @@
+import os
 import matplotlib.pyplot as plt
-from panoptes_client import Subject
-from skimage import transform, io
+from skimage import io
+from collections import OrderedDict
+import threading
 from matplotlib import animation
+from io import BytesIO
+from solarjets_common.fetcher import default_fetcher, get_subject_metadata, get_frame_url
+from solarjets_common.image_utils import resize_image, to_rgb_uint8
+from solarjets_common.gif_writer import GifStreamWriter, render_gifs
+from solarjets_common.instrumentation import record_cache
 
 
-def get_subject_image(subject, frame=7):
+# number of resized frames kept in memory by `get_subject_image`,
+# so that each subject/frame is only resized once
+RESIZE_CACHE_SIZE = 64
+resized_images = OrderedDict()
+resized_images_lock = threading.Lock()
+
+
+def get_subject_image(subject, frame=7, fetcher=None, scale=1., resize_mode='fast'):
     '''
         Fetch the subject image from Panoptes (Zooniverse database)
 
@@ -14,24 +28,51 @@ def get_subject_image(subject, frame=7):
             Zooniverse subject ID
         frame : int
             Frame to extract (between 0-14, default 7)
+        fetcher : `Fetcher`
+            Fetcher used for the requests (default: `default_fetcher`)
+        scale : float
+            Scale of the output image with respect to the full size
+            (e.g. 0.25 for a quick preview)
+        resize_mode : str
+            How odd-sized (or scaled) images are resized (see `resize_image`)
 
         Outputs
         -------
         img : numpy.ndarray
-            RGB image corresponding to `frame`
+            RGB uint8 image corresponding to `frame`. Resized images are
+            cached, and are returned as read-only arrays
     '''
+    key = (int(subject), frame, scale, resize_mode)
+    with resized_images_lock:
+        if key in resized_images:
+            record_cache('resized_images', True)
+            resized_images.move_to_end(key)
+            return resized_images[key]
+
+    if fetcher is None:
+        fetcher = default_fetcher
+
     # get the subject metadata from Panoptes
-    subjecti = Subject(int(subject))
-    try:
-        frame0_url = subjecti.raw['locations'][frame]['image/png']
-    except KeyError:
-        frame0_url = subjecti.raw['locations'][frame]['image/jpeg']
+    raw = get_subject_metadata(subject, fetcher)
+    frame0_url = get_frame_url(raw, frame)
+
+    # grayscale/RGBA frames are converted to RGB uint8, the same as the frames in the store
+    img = to_rgb_uint8(io.imread(BytesIO(fetcher.get(frame0_url))))
 
-    img = io.imread(frame0_url)
+    # the images are resized to the standard 1920x1440 size
+    shape = (round(1440 * scale), round(1920 * scale))
+    if img.shape[:2] == shape:
+        return img
 
     # for subjects that have an odd size, resize them
-    if img.shape[0] != 1920:
-        img = transform.resize(img, (1440, 1920))
+    record_cache('resized_images', False)
+    img = to_rgb_uint8(resize_image(img, shape, resize_mode))
+    img.setflags(write=False)
+
+    with resized_images_lock:
+        resized_images[key] = img
+        while len(resized_images) > RESIZE_CACHE_SIZE:
+            resized_images.popitem(last=False)
 
     return img
 
@@ -65,7 +106,41 @@ def create_gif(subject, outfile):
 
     # save the animation as a gif
     ani = animation.FuncAnimation(fig, animate, frames=15, interval=200, blit=True)
-    ani.save(outfile, writer='imagemagick')
+    ani.save(outfile, writer=GifStreamWriter(fps=5))
 
     plt.clf()
     plt.close('all')
+
+
+def create_gifs(subjects, outdir='.', processes=None, cache_dir='frame_cache', overwrite=False):
+    '''
+        Create the gifs (see `create_gif`) for a list of subjects on a
+        pool of worker processes. Gifs that already exist are skipped
+
+        Inputs
+        ------
+        subjects : list
+            List of Zooniverse subject IDs
+        outdir : str
+            Directory where the gifs are saved (as `<subject>.gif`)
+        processes : int
+            Number of worker processes (default: number of CPUs)
+        cache_dir : str
+            Directory where the subject frames and metadata are cached, shared by the workers
+        overwrite : bool
+            Create all the gifs, even if they exist
+
+        Outputs
+        -------
+        times : dict
+            Time taken (in seconds) for each created gif
+        errors : dict
+            Exception raised for each gif that failed
+        skipped : list
+            Gifs which already existed
+    '''
+    os.makedirs(outdir, exist_ok=True)
+    subjects = [int(subject) for subject in subjects]
+    outputs = [os.path.join(outdir, f'{subject}.gif') for subject in subjects]
+
+    return render_gifs(create_gif, subjects, outputs, processes=processes, cache_dir=cache_dir, overwrite=overwrite)
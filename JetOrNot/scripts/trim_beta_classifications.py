@@ -1,21 +1,161 @@
-import numpy as np
+import csv
+import sys
 import datetime
+import argparse
 from dateutil.parser import parse
-import sys
 
-fname = sys.argv[1]
+# the JSON fields in the classification export can be larger than the default
+# field size limit of the csv module
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+# classifications before this date are from the beta/charlie tests
+LAUNCH_DATE = '2021-12-07 00:00:00 UTC'
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def normalize_time(timestring):
+    '''
+        Convert a timestamp to a 'YYYY-MM-DD HH:MM:SS' string in UTC, which
+        can be compared directly with other normalized timestamps. The
+        Zooniverse format ('2021-12-07 00:00:00 UTC') is handled without parsing,
+        and anything else is parsed with dateutil (naive times are assumed to be UTC)
+    '''
+    if (len(timestring) == 23 and timestring.endswith(' UTC') and timestring[4] == '-'
+            and timestring[7] == '-' and timestring[10] == ' ' and timestring[13] == ':'
+            and timestring[16] == ':'):
+        return timestring[:19]
+
+    time = parse(timestring)
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return time.strftime(TIME_FORMAT)
+
+
+class LineRecorder:
+    '''
+        Iterate over the lines of a file while keeping the lines that were read
+        since the last call to `pop`, so that the raw text of each csv record
+        (which may span several lines) can be written out unchanged
+    '''
+
+    def __init__(self, infile):
+        self.infile = infile
+        self.lines = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.infile)
+        self.lines.append(line)
+        return line
+
+    def pop(self):
+        text = ''.join(self.lines)
+        self.lines = []
+        return text
+
 
-assert not fname is None, "Please provide a filename"
+def in_windows(time, windows):
+    '''
+        Check whether a normalized timestamp is in any of the (start, end)
+        windows. The start is inclusive and the end exclusive; None means
+        the window is open on that side
+    '''
+    for start, end in windows:
+        if (start is None or time >= start) and (end is None or time < end):
+            return True
+    return False
 
-with open(fname, 'r') as infile:
-    lines = infile.readlines()
 
-launch_date = parse('2021-12-07 00:00:00 UTC')
+def matches_version(version, workflow_versions):
+    '''
+        Check whether a workflow version (e.g. '5.19') matches any of the requested
+        versions, either exactly or as a major version (e.g. '5')
+    '''
+    for requested in workflow_versions:
+        if version == requested or version.startswith(requested + '.'):
+            return True
+    return False
+
+
+def trim_classifications(fname, outname, windows=((LAUNCH_DATE, None),), workflow_versions=None):
+    '''
+        Stream through a classification (or extract) csv-file and keep only
+        the rows created inside the given date windows (and with the given
+        workflow versions). Rows are copied to the output unchanged as they are read
+
+        Inputs
+        ------
+        fname : str
+            path to the input csv-file (must have a `created_at` column)
+        outname : str
+            path to the output csv-file
+        windows : list
+            list of (start, end) timestamps. Rows within any of the windows are kept
+        workflow_versions : list
+            list of workflow versions to keep (requires a `workflow_version` column).
+            All versions are kept if None
+
+        Outputs
+        -------
+        nkept : int
+            number of rows written out
+        ntotal : int
+            number of rows in the input
+    '''
+    windows = [(None if start is None else normalize_time(start), None if end is None else normalize_time(end))
+               for start, end in windows]
+
+    nkept = 0
+    ntotal = 0
+    with open(fname, 'r', newline='') as infile, open(outname, 'w', newline='') as outfile:
+        lines = LineRecorder(infile)
+        reader = csv.reader(lines)
+
+        # write out the header
+        header = next(reader)
+        outfile.write(lines.pop())
+
+        time_index = header.index('created_at')
+        if workflow_versions is not None:
+            if 'workflow_version' not in header:
+                raise ValueError(f"{fname} has no workflow_version column to filter on")
+            version_index = header.index('workflow_version')
+
+        for row in reader:
+            line = lines.pop()
+            ntotal += 1
+
+            if not in_windows(normalize_time(row[time_index]), windows):
+                continue
+
+            if workflow_versions is not None and not matches_version(row[version_index], workflow_versions):
+                continue
 
-with open('question_extractor_trimmed.csv', 'w') as outfile:
-    # write out the header
-    outfile.write(lines[0])
-    for line in lines[1:]:
-        datei = parse(line.split(',')[5])
-        if datei >= launch_date:
             outfile.write(line)
+            nkept += 1
+
+    return nkept, ntotal
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Remove the beta classifications from a classification or extract file')
+    parser.add_argument('fname', help='classification or extract csv-file')
+    parser.add_argument('-o', '--output', default='question_extractor_trimmed.csv', help='output csv-file')
+    parser.add_argument('--window', nargs=2, action='append', metavar=('START', 'END'),
+                        help='keep classifications created between START and END (use "none" for an open end). '
+                             f'Can be repeated [default: after {LAUNCH_DATE}]')
+    parser.add_argument('--workflow-version', action='append',
+                        help='keep only this workflow version (e.g. 5.19, or 5 for all 5.x versions). Can be repeated')
+    args = parser.parse_args()
+
+    if args.window is None:
+        windows = [(LAUNCH_DATE, None)]
+    else:
+        windows = [tuple(None if val.lower() == 'none' else val for val in window) for window in args.window]
+
+    nkept, ntotal = trim_classifications(args.fname, args.output, windows, args.workflow_version)
+    print(f"Kept {nkept} of {ntotal} classifications in {args.output}")
@@ -0,0 +1,69 @@
+import pytest
+import numpy as np
+import shapely
+from BoxTheJets.aggregation.workflow import get_box_edges, get_box_edges_array, get_box_iou
+
+pytest.importorskip('pytest_benchmark')
+
+
+def for_all_subjects(aggregator, func):
+    '''
+        Run `func(subject)` for every subject in the aggregator
+    '''
+    for subject in aggregator.get_subjects():
+        func(subject)
+
+
+@pytest.mark.parametrize('task', ['T1', 'T5'])
+def bench_get_points_data(benchmark, aggregator, task):
+    benchmark(for_all_subjects, aggregator, lambda subject: aggregator.get_points_data(subject, task))
+
+
+@pytest.mark.parametrize('task', ['T1', 'T5'])
+def bench_get_box_data(benchmark, aggregator, task):
+    benchmark(for_all_subjects, aggregator, lambda subject: aggregator.get_box_data(subject, task))
+
+
+def bench_get_box_edges(benchmark, aggregator):
+    boxes = [aggregator.get_box_data(subject, 'T1')[0] for subject in aggregator.get_subjects()]
+
+    def get_edges():
+        for box in boxes:
+            for x, y, w, h, a in zip(box['x'], box['y'], box['w'], box['h'], np.radians(box['a'])):
+                get_box_edges(x, y, w, h, a)
+
+    benchmark(get_edges)
+
+
+def bench_get_box_edges_array(benchmark, aggregator):
+    boxes = [aggregator.get_box_data(subject, 'T1')[0] for subject in aggregator.get_subjects()]
+
+    benchmark(lambda: [get_box_edges_array(box['x'], box['y'], box['w'], box['h'], np.radians(box['a'])) for box in boxes])
+
+
+def bench_get_box_iou(benchmark, aggregator):
+    # IoU of all the pairs of boxes drawn on each subject
+    boxes = []
+    for subject in aggregator.get_subjects():
+        box = aggregator.get_box_data(subject, 'T1')[0]
+        boxes.append(shapely.polygons(get_box_edges_array(box['x'], box['y'], box['w'], box['h'], np.radians(box['a']))))
+
+    benchmark(lambda: [get_box_iou(polygons[:, np.newaxis], polygons[np.newaxis, :]) for polygons in boxes])
+
+
+@pytest.mark.parametrize('task', ['T1', 'T5'])
+def bench_get_cluster_confidence(benchmark, aggregator, task):
+    benchmark.pedantic(for_all_subjects, args=(aggregator, lambda subject: aggregator.get_cluster_confidence(subject, task)),
+                       rounds=3, iterations=1)
+
+
+def bench_find_unique_jets(benchmark, aggregator):
+    benchmark.pedantic(for_all_subjects, args=(aggregator, aggregator.find_unique_jets), rounds=3, iterations=1)
+
+
+def bench_find_unique_jet_points(benchmark, aggregator):
+    benchmark.pedantic(for_all_subjects, args=(aggregator, aggregator.find_unique_jet_points), rounds=3, iterations=1)
+
+
+def bench_filter_classifications(benchmark, aggregator):
+    benchmark.pedantic(for_all_subjects, args=(aggregator, aggregator.filter_classifications), rounds=3, iterations=1)
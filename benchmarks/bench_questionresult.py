@@ -0,0 +1,36 @@
+import pytest
+from BoxTheJets.aggregation.questionresult import QuestionResult
+
+pytest.importorskip('pytest_benchmark')
+
+
+def bench_load(benchmark, dataset):
+    benchmark(QuestionResult, dataset['question'])
+
+
+def bench_get_data_by_idlist(benchmark, question_result):
+    benchmark(question_result.get_data_by_idlist, question_result.subjects[::-1])
+
+
+def bench_agr_mask(benchmark, question_result):
+    benchmark(question_result.Agr_mask, question_result.data)
+
+
+def bench_obs_time(benchmark, question_result, metafile):
+    benchmark(question_result.obs_time, metafile)
+
+
+def bench_count_jets(benchmark, question_result, metafile):
+    obs_time, _, _, _ = question_result.obs_time(metafile)
+    _, _, _, Ans = question_result.Agr_mask(question_result.data)
+
+    benchmark(question_result.count_jets, Ans, obs_time)
+
+
+def bench_csv_SOL(benchmark, question_result, metafile, tmp_path, monkeypatch):
+    # csv_SOL writes to the working directory
+    monkeypatch.chdir(tmp_path)
+    obs_time, SOL, filenames, end_time = question_result.obs_time(metafile)
+    agreement, jet_mask, non_jet_mask, Ans = question_result.Agr_mask(question_result.data)
+
+    benchmark(question_result.csv_SOL, SOL, obs_time, Ans, agreement, jet_mask, non_jet_mask, 'T0', filenames, end_time)
@@ -0,0 +1,53 @@
+import pytest
+from BoxTheJets.aggregation.meta_file_handler import MetaFile
+from BoxTheJets.aggregation.image_handler import world_from_pixel
+
+pytest.importorskip('pytest_benchmark')
+
+
+def bench_filter_jet_clusters(benchmark, sol, metafile):
+    events = metafile.SOL_unique
+    benchmark.pedantic(lambda: [sol.filter_jet_clusters(event) for event in events], rounds=3, iterations=1)
+
+
+def bench_metafile_load(benchmark, dataset):
+    benchmark(MetaFile, dataset['metadata'])
+
+
+def bench_metafile_by_solstandard(benchmark, metafile):
+    events = metafile.SOL_unique
+
+    def query():
+        for event in events:
+            metafile.get_subjectid_by_solstandard(event)
+            metafile.get_subjectkeyvalue_by_solstandard(event, 'startDate')
+
+    benchmark(query)
+
+
+def bench_metafile_by_id(benchmark, metafile):
+    subjects = metafile.subjects
+
+    def query():
+        for subject in subjects:
+            metafile.get_subjectdata_by_id(subject)
+            metafile.get_subjectkeyvalue_by_id(subject, '#file_name_0')
+
+    benchmark(query)
+
+
+def bench_metafile_by_list(benchmark, metafile):
+    benchmark(metafile.get_subjectkeyvalue_by_list, metafile.subjects, 'startDate')
+
+
+def bench_metafile_by_dates(benchmark, metafile):
+    benchmark(metafile.get_subjectid_by_dates, '2012-01-01 00:00:00', '2012-06-01 00:00:00')
+
+
+def bench_world_from_pixel(benchmark, metafile):
+    # convert the start point of a jet on the first 10 subjects
+    subjects = metafile.subjects[:10]
+    metadata = [metafile.get_subjectdata_by_id(subject) for subject in subjects]
+
+    benchmark.pedantic(lambda: [world_from_pixel(subject, 500., 600., meta) for subject, meta in zip(subjects, metadata)],
+                       rounds=3, iterations=1)
@@ -0,0 +1,54 @@
+import os
+import sys
+import shutil
+import pytest
+from astropy.io import ascii
+
+pytest.importorskip('pytest_benchmark')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BoxTheJets', 'scripts'))
+
+from squash_frames import squash_frames, merge_tasks, squash_extracts  # noqa: E402
+from tests.test_squash_frames import squash_script  # noqa: E402
+
+# the extractor files and the value of their empty entries
+EXTRACTS = [('point_extracts', 'N/A'), ('box_extracts', 'None')]
+
+
+@pytest.fixture(params=EXTRACTS, ids=[key for key, _ in EXTRACTS])
+def extracts(request, dataset, tmp_path):
+    '''
+        Copy of an extractor file (so that the squashed files are not written
+        next to the dataset) and the value of its empty entries
+    '''
+    key, empty_value = request.param
+    file = str(tmp_path / os.path.basename(dataset[key]))
+    shutil.copy(dataset[key], file)
+    return file, empty_value
+
+
+def bench_squash_frames(benchmark, extracts):
+    file, empty_value = extracts
+    data = ascii.read(file, delimiter=',')
+
+    benchmark(squash_frames, data, empty_value)
+
+
+def bench_merge_tasks(benchmark, extracts):
+    file, empty_value = extracts
+    squashed = squash_frames(ascii.read(file, delimiter=','), empty_value)
+
+    benchmark(merge_tasks, squashed)
+
+
+def bench_squash_extracts(benchmark, extracts):
+    file, empty_value = extracts
+
+    benchmark.pedantic(squash_extracts, args=(file, empty_value), rounds=3, iterations=1)
+
+
+def bench_squash_script(benchmark, extracts):
+    # the original row-by-row script, for comparison with `squash_extracts`
+    file, empty_value = extracts
+
+    benchmark.pedantic(squash_script, args=(file, empty_value), rounds=1, iterations=1)
@@ -0,0 +1,60 @@
+import os
+import sys
+import pytest
+
+# the aggregation packages are imported from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import write_synthetic_data  # noqa: E402
+from BoxTheJets.aggregation.workflow import Aggregator  # noqa: E402
+from BoxTheJets.aggregation.meta_file_handler import MetaFile  # noqa: E402
+from BoxTheJets.aggregation.SOL_class import SOL  # noqa: E402
+from BoxTheJets.aggregation.questionresult import QuestionResult  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption('--subjects', default='10,100',
+                     help='comma separated list of the number of subjects in the synthetic datasets')
+    parser.addoption('--classifications', default='5,25',
+                     help='comma separated list of the number of classifications per subject')
+
+
+def pytest_generate_tests(metafunc):
+    if 'dataset_size' in metafunc.fixturenames:
+        subjects = [int(n) for n in metafunc.config.getoption('subjects').split(',')]
+        classifications = [int(n) for n in metafunc.config.getoption('classifications').split(',')]
+        sizes = [(nsubjects, nclassifications) for nsubjects in subjects for nclassifications in classifications]
+        metafunc.parametrize('dataset_size', sizes, scope='session',
+                             ids=[f'{n}subjects-{c}classifications' for n, c in sizes])
+
+
+@pytest.fixture(scope='session')
+def dataset(dataset_size, tmp_path_factory):
+    '''
+        Paths of the synthetic export files for one dataset size
+    '''
+    nsubjects, nclassifications = dataset_size
+    path = tmp_path_factory.mktemp(f'data_{nsubjects}_{nclassifications}')
+    return write_synthetic_data(str(path), nsubjects, nclassifications)
+
+
+@pytest.fixture(scope='session')
+def aggregator(dataset):
+    aggregator = Aggregator(dataset['points'], dataset['box'])
+    aggregator.load_extractor_data(dataset['point_extracts'], dataset['box_extracts'])
+    return aggregator
+
+
+@pytest.fixture(scope='session')
+def metafile(dataset):
+    return MetaFile(dataset['metadata'])
+
+
+@pytest.fixture(scope='session')
+def sol(dataset, aggregator):
+    return SOL(dataset['metadata'], aggregator)
+
+
+@pytest.fixture(scope='session')
+def question_result(dataset):
+    return QuestionResult(dataset['question'])
@@ -0,0 +1,621 @@
+'''
+    Generator for synthetic Zooniverse exports of the Solar Jet Hunter project, used to
+    benchmark and test the aggregation offline at any scale. The files are written in
+    the same layout as the real exports (relative to the root of the repository):
+
+        BoxTheJets/reductions/point_reducer_hdbscan_box_the_jets.csv
+        BoxTheJets/reductions/shape_reducer_dbscan_box_the_jets.csv
+        BoxTheJets/reductions/question_reducer_box_the_jets.csv
+        BoxTheJets/extracts/point_extractor_by_frame_box_the_jets_scaled.csv
+        BoxTheJets/extracts/shape_extractor_rotateRectangle_box_the_jets_scaled.csv
+        JetOrNot/reductions/question_reducer_jet_or_not.csv
+        Meta_data_subjects.json
+
+    Jets are planted in each SOL event, and the volunteers draw them (with some scatter)
+    in the frames where they are visible. The planted jets are saved to `ground_truth.json`,
+    so that the output of the aggregation can be checked with `score_jets`.
+
+    Usage
+    -----
+    python benchmarks/synthetic.py synthetic/ --subjects 10000 --classifications 25 --score 100
+'''
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import numpy as np
+import shapely
+
+# the aggregation packages are imported from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from BoxTheJets.aggregation.workflow import get_box_edges_array, get_box_iou  # noqa: E402
+
+# size of the subject images
+WIDTH = 1920
+HEIGHT = 1440
+
+# time between the frames of a subject, and between the first frames of consecutive subjects in an event
+FRAME_CADENCE = np.timedelta64(12, 's')
+SUBJECT_CADENCE = np.timedelta64(5 * 60 + 12, 's')
+
+# the first jet drawn by a volunteer goes in T1 and the second one in T5
+TASKS = ['T1', 'T5']
+
+BOX_KEYS = ['x', 'y', 'width', 'height', 'angle']
+
+# minimum number of volunteers needed to form a cluster (as in the reducer configs)
+MIN_CLUSTER_SIZE = 3
+
+BOX_THE_JETS_WORKFLOW = 19650
+JET_OR_NOT_WORKFLOW = 18563
+
+FILES = {
+    'points': os.path.join('BoxTheJets', 'reductions', 'point_reducer_hdbscan_box_the_jets.csv'),
+    'box': os.path.join('BoxTheJets', 'reductions', 'shape_reducer_dbscan_box_the_jets.csv'),
+    'box_question': os.path.join('BoxTheJets', 'reductions', 'question_reducer_box_the_jets.csv'),
+    'point_extracts': os.path.join('BoxTheJets', 'extracts', 'point_extractor_by_frame_box_the_jets_scaled.csv'),
+    'box_extracts': os.path.join('BoxTheJets', 'extracts', 'shape_extractor_rotateRectangle_box_the_jets_scaled.csv'),
+    'question': os.path.join('JetOrNot', 'reductions', 'question_reducer_jet_or_not.csv'),
+    'metadata': 'Meta_data_subjects.json',
+    'ground_truth': 'ground_truth.json',
+}
+
+
+def list_string(values):
+    '''
+        Format a list of numbers the way the panoptes aggregation CSVs do
+    '''
+    return str([float(val) for val in values])
+
+
+def int_list_string(values):
+    return str([int(val) for val in values])
+
+
+def time_string(time):
+    return str(time.astype('datetime64[s]')).replace('T', ' ')
+
+
+def get_box_from_base(base, width, height, angle):
+    '''
+        Get the box parameters (x, y, width, height, angle in degrees) of a jet,
+        so that the base of the jet is at the middle of the bottom edge of the box
+    '''
+    a = np.radians(angle)
+    cx = base[0] - 0.5 * height * np.sin(a)
+    cy = base[1] + 0.5 * height * np.cos(a)
+    return np.array([cx - 0.5 * width, cy - 0.5 * height, width, height, angle])
+
+
+def get_box_polygons(boxes):
+    '''
+        Get the `shapely.Polygon` of each row of (x, y, width, height, angle in degrees)
+    '''
+    boxes = np.atleast_2d(boxes)
+    return shapely.polygons(get_box_edges_array(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3],
+                                                np.radians(boxes[:, 4])))
+
+
+def make_event(rng, index, nsubjects, second_jet_fraction):
+    '''
+        Create a SOL event with its planted jets
+
+        Inputs
+        ------
+        rng : numpy.random.Generator
+            Random number generator
+        index : int
+            Index of the event
+        nsubjects : int
+            Number of subjects in the event
+        second_jet_fraction : float
+            Probability that the event has a second jet at a different place
+
+        Outputs
+        -------
+        event : dict
+            Dictionary with the SOL name, start time, pointing and the list of jets
+    '''
+    start = np.datetime64('2011-01-01T00:00:00') + np.timedelta64(index, 'D') + \
+        np.timedelta64(int(rng.integers(0, 7200)) * 12, 's')
+    longitude = int(rng.integers(0, 360))
+    colatitude = int(rng.integers(20, 160))
+    name = f"SOL{str(start.astype('datetime64[s]'))}L{longitude:03d}C{colatitude:03d}"
+
+    njets = 2 if (rng.uniform() < second_jet_fraction and nsubjects > 1) else 1
+
+    jets = []
+    for j in range(njets):
+        # keep the jets of an event apart, so that their boxes do not overlap
+        base = np.array([rng.uniform(300, 800) + j * 900, rng.uniform(200, 900)])
+        box = get_box_from_base(base, rng.uniform(60, 120), rng.uniform(150, 350), rng.uniform(-40, 40))
+
+        # the jet starts in one subject and lasts for up to 8 subjects
+        first = int(rng.integers(0, nsubjects))
+        last = min(first + int(rng.integers(1, 8)), nsubjects - 1)
+        start_frame = int(rng.integers(0, 10))
+        end_frame = int(rng.integers(start_frame + 3, 15)) if first == last else int(rng.integers(3, 15))
+
+        jets.append({'base': base, 'end': base + rng.normal(0, 5, 2), 'box': box,
+                     'first': first, 'last': last, 'start_frame': start_frame, 'end_frame': end_frame})
+
+    return {'name': name, 'start': start, 'crval': rng.uniform(-900, 900, 2), 'jets': jets}
+
+
+def get_metadata(subject, event, start_time):
+    '''
+        Create the `Meta_data_subjects.json` entry of a subject
+    '''
+    end_time = start_time + 14 * FRAME_CADENCE
+
+    def file_name(time):
+        stamp = str(time.astype('datetime64[s]')).replace('-', '').replace(':', '').replace('T', '_')
+        return f'ssw_cutout_{stamp}_aia_304_.png'
+
+    return {
+        'subjectId': int(subject),
+        'data': {
+            '#file_name_0': file_name(start_time),
+            '#file_name_14': file_name(end_time),
+            '#sol_standard': event['name'],
+            '#width': float(WIDTH),
+            '#height': float(HEIGHT),
+            '#naxis1': 1000,
+            '#naxis2': 750,
+            '#cunit1': 'arcsec',
+            '#cunit2': 'arcsec',
+            '#crval1': float(event['crval'][0]),
+            '#crval2': float(event['crval'][1]),
+            '#cdelt1': 0.6,
+            '#cdelt2': 0.6,
+            '#crpix1': 500.5,
+            '#crpix2': 375.5,
+            '#crota2': 0.,
+            '#im_ll_x': 0.125,
+            '#im_ll_y': 0.125,
+            '#im_ur_x': 0.875,
+            '#im_ur_y': 0.875,
+            'startDate': time_string(start_time),
+            'endDate': time_string(end_time),
+        }
+    }
+
+
+def draw_jet(rng, jet, frames, scatter):
+    '''
+        Draw a jet the way a volunteer would: the start point in the first frame
+        where the jet is visible, the end point in the last frame and the box in between
+
+        Inputs
+        ------
+        rng : numpy.random.Generator
+            Random number generator
+        jet : dict
+            Planted jet (see `make_event`). None draws a spurious jet at a random place
+        frames : tuple
+            First and last frame where the jet is visible in the subject
+        scatter : float
+            Scatter (in pixels) of the points and box drawn by the volunteers
+
+        Outputs
+        -------
+        drawing : dict
+            Start and end points, box parameters and the frame of each
+    '''
+    if jet is None:
+        base = rng.uniform([0, 0], [WIDTH, HEIGHT])
+        jet = {'base': base, 'end': base, 'box': get_box_from_base(base, rng.uniform(30, 200), rng.uniform(50, 400),
+                                                                    rng.uniform(-90, 90))}
+        frames = np.sort(rng.integers(0, 15, 2))
+
+    start_frame = int(np.clip(frames[0] + round(rng.normal(0, 0.7)), 0, 14))
+    end_frame = int(np.clip(frames[1] + round(rng.normal(0, 0.7)), start_frame, 14))
+
+    box = jet['box'] + rng.normal(0, 1, 5) * [0.6 * scatter, 0.6 * scatter, 0.05 * jet['box'][2],
+                                              0.05 * jet['box'][3], 3.]
+
+    return {'start': jet['base'] + rng.normal(0, scatter, 2), 'end': jet['end'] + rng.normal(0, scatter, 2),
+            'box': box, 'start_frame': start_frame, 'end_frame': end_frame,
+            'box_frame': int(rng.integers(start_frame, end_frame + 1))}
+
+
+def reduce_task(drawings, labels):
+    '''
+        Create the reduced points and box data for one task, in the same way as the
+        HDBSCAN point reducer and the DBSCAN (IoU metric) shape reducer
+
+        Inputs
+        ------
+        drawings : list
+            List of the volunteer drawings (see `draw_jet`)
+        labels : list
+            ID of the planted jet for each drawing (-1 for spurious jets)
+
+        Outputs
+        -------
+        points : dict
+            Reduced values for each of the point reducer columns (without the prefix)
+        box : dict
+            Reduced values for each of the shape reducer columns (without the prefix)
+    '''
+    if len(drawings) == 0:
+        return {}, {}
+
+    labels = np.asarray(labels)
+
+    # only the jets drawn by enough volunteers form a cluster
+    ids, counts = np.unique(labels[labels >= 0], return_counts=True)
+    ids = ids[counts >= MIN_CLUSTER_SIZE]
+    cluster_labels = np.full(len(labels), -1)
+    for c, jet_id in enumerate(ids):
+        cluster_labels[labels == jet_id] = c
+
+    points = {}
+    for tool, key in [('tool0', 'start'), ('tool1', 'end')]:
+        xy = np.asarray([drawing[key] for drawing in drawings])
+        probs = np.zeros(len(drawings))
+        clusters = []
+        for c in range(len(ids)):
+            members = cluster_labels == c
+            mean = xy[members].mean(axis=0)
+            clusters.append((mean, np.cov(xy[members].T), members.sum()))
+            dist = np.linalg.norm(xy[members] - mean, axis=1)
+            probs[members] = np.exp(-0.5 * (dist / (dist.std() + 1.e-6)) ** 2)
+
+        points[f'{tool}_points_x'] = list_string(xy[:, 0])
+        points[f'{tool}_points_y'] = list_string(xy[:, 1])
+        points[f'{tool}_cluster_labels'] = int_list_string(cluster_labels)
+        points[f'{tool}_cluster_probabilities'] = list_string(probs)
+        points[f'{tool}_clusters_count'] = int_list_string([count for _, _, count in clusters])
+        points[f'{tool}_clusters_x'] = list_string([mean[0] for mean, _, _ in clusters])
+        points[f'{tool}_clusters_y'] = list_string([mean[1] for mean, _, _ in clusters])
+        points[f'{tool}_clusters_var_x'] = list_string([cov[0, 0] for _, cov, _ in clusters])
+        points[f'{tool}_clusters_var_y'] = list_string([cov[1, 1] for _, cov, _ in clusters])
+        points[f'{tool}_clusters_var_x_y'] = list_string([cov[0, 1] for _, cov, _ in clusters])
+
+    boxes = np.asarray([drawing['box'] for drawing in drawings])
+    cluster_boxes = np.asarray([boxes[cluster_labels == c].mean(axis=0) for c in range(len(ids))]).reshape(-1, 5)
+
+    # the sigma of the cluster is the spread of the IoU distance of the members
+    sigmas = []
+    polygons = get_box_polygons(boxes)
+    for c in range(len(ids)):
+        members = cluster_labels == c
+        iou = get_box_iou(polygons[members], get_box_polygons(cluster_boxes[c])[0])
+        sigmas.append(np.sqrt(np.mean((1 - iou) ** 2)))
+
+    box = {}
+    for k, key in enumerate(BOX_KEYS):
+        box[f'tool2_rotateRectangle_{key}'] = list_string(boxes[:, k])
+        box[f'tool2_clusters_{key}'] = list_string(cluster_boxes[:, k])
+    box['tool2_cluster_labels'] = int_list_string(cluster_labels)
+    box['tool2_clusters_count'] = int_list_string([np.sum(cluster_labels == c) for c in range(len(ids))])
+    box['tool2_clusters_sigma'] = list_string(sigmas)
+
+    return points, box
+
+
+class RowWriter:
+    '''
+        CSV writer for the wide Zooniverse tables, where most of the columns
+        of a row are empty
+    '''
+
+    def __init__(self, file, columns):
+        self.writer = csv.writer(file)
+        self.writer.writerow(columns)
+        self.index = {column: i for i, column in enumerate(columns)}
+        self.empty = [''] * len(columns)
+
+    def writerow(self, values):
+        row = list(self.empty)
+        for column, value in values.items():
+            row[self.index[column]] = value
+        self.writer.writerow(row)
+
+
+def write_synthetic_data(path, nsubjects, nclassifications, seed=0, subjects_per_event=10, second_jet_fraction=0.3,
+                         detection=0.9, noise=0.05, scatter=8.):
+    '''
+        Write a synthetic Solar Jet Hunter export: the reduced and extracted Box the Jets
+        data, the Jet or Not and Box the Jets question reducer files, the subject metadata file
+        and the ground truth of the planted jets
+
+        Inputs
+        ------
+        path : str
+            Directory where the files are written (in the same layout as the repository,
+            see `FILES`)
+        nsubjects : int
+            Number of subjects
+        nclassifications : int
+            Number of classifications (volunteers) for each subject
+        seed : int
+            Seed for the random number generator
+        subjects_per_event : int
+            Number of subjects in each SOL event
+        second_jet_fraction : float
+            Fraction of the events with a second jet
+        detection : float
+            Probability that a volunteer draws a jet which is visible in the subject
+        noise : float
+            Probability that a volunteer draws a spurious jet
+        scatter : float
+            Scatter (in pixels) of the points and boxes drawn by the volunteers
+
+        Outputs
+        -------
+        files : dict
+            Paths of the written files (keys: 'points', 'box', 'box_question', 'point_extracts',
+            'box_extracts', 'question', 'metadata', 'ground_truth')
+    '''
+    rng = np.random.default_rng(seed)
+
+    files = {key: os.path.join(path, name) for key, name in FILES.items()}
+    for file in files.values():
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+
+    points_cols = [f'data.frame0.{task}_{tool}_{key}' for task in TASKS for tool in ['tool0', 'tool1']
+                   for key in ['points_x', 'points_y', 'cluster_labels', 'cluster_probabilities', 'clusters_count',
+                               'clusters_x', 'clusters_y', 'clusters_var_x', 'clusters_var_y', 'clusters_var_x_y']]
+    box_cols = [f'data.frame0.{task}_tool2_{key}' for task in TASKS
+                for key in [*[f'rotateRectangle_{key}' for key in BOX_KEYS], 'cluster_labels', 'clusters_count',
+                            *[f'clusters_{key}' for key in BOX_KEYS], 'clusters_sigma']]
+    point_extract_cols = [f'data.frame{frame}.{task}_{tool}_{key}' for task in TASKS for frame in range(15)
+                          for tool in ['tool0', 'tool1'] for key in 'xy']
+    box_extract_cols = [f'data.frame{frame}.{task}_tool2_{key}' for task in TASKS for frame in range(15)
+                        for key in BOX_KEYS]
+    reducer_base = ['subject_id', 'workflow_id', 'task', 'reducer']
+    extract_base = ['classification_id', 'user_name', 'user_id', 'workflow_id', 'task', 'created_at', 'subject_id',
+                    'extractor']
+    question_cols = [*reducer_base, 'data.no', 'data.yes']
+
+    metadata = []
+    truth = {'parameters': {'nsubjects': nsubjects, 'nclassifications': nclassifications, 'seed': seed,
+                            'subjects_per_event': subjects_per_event, 'second_jet_fraction': second_jet_fraction,
+                            'detection': detection, 'noise': noise, 'scatter': scatter},
+             'events': {}, 'jets': [], 'subjects': {}}
+    classification_id = 1
+
+    with open(files['points'], 'w', newline='') as points_file, open(files['box'], 'w', newline='') as box_file, \
+            open(files['point_extracts'], 'w', newline='') as point_extracts_file, \
+            open(files['box_extracts'], 'w', newline='') as box_extracts_file, \
+            open(files['question'], 'w', newline='') as question_file, \
+            open(files['box_question'], 'w', newline='') as box_question_file:
+        points_writer = RowWriter(points_file, [*reducer_base, *points_cols])
+        box_writer = RowWriter(box_file, [*reducer_base, *box_cols])
+        point_extracts_writer = RowWriter(point_extracts_file, [*extract_base, *point_extract_cols])
+        box_extracts_writer = RowWriter(box_extracts_file, [*extract_base, *box_extract_cols])
+        question_writer = csv.writer(question_file)
+        question_writer.writerow(question_cols)
+        box_question_writer = csv.writer(box_question_file)
+        box_question_writer.writerow(question_cols)
+
+        subject = 80000000
+        for event_index in range(int(np.ceil(nsubjects / subjects_per_event))):
+            nevent = min(subjects_per_event, nsubjects - event_index * subjects_per_event)
+            event = make_event(rng, event_index, nevent, second_jet_fraction)
+
+            jet_ids = list(range(len(truth['jets']), len(truth['jets']) + len(event['jets'])))
+            event_subjects = list(range(subject, subject + nevent))
+            truth['events'][event['name']] = {'subjects': event_subjects, 'jets': jet_ids}
+
+            for jet_id, jet in zip(jet_ids, event['jets']):
+                start_time = event['start'] + jet['first'] * SUBJECT_CADENCE + jet['start_frame'] * FRAME_CADENCE
+                end_time = event['start'] + jet['last'] * SUBJECT_CADENCE + jet['end_frame'] * FRAME_CADENCE
+                truth['jets'].append({'id': jet_id, 'event': event['name'],
+                                      'subjects': event_subjects[jet['first']:jet['last'] + 1],
+                                      'start_time': time_string(start_time), 'end_time': time_string(end_time),
+                                      'start': jet['base'].tolist(), 'end': jet['end'].tolist(),
+                                      'box': jet['box'].tolist()})
+
+            for i in range(nevent):
+                start_time = event['start'] + i * SUBJECT_CADENCE
+                metadata.append(get_metadata(subject, event, start_time))
+
+                # jets visible in this subject and the frames where they are visible
+                visible = []
+                for jet_id, jet in zip(jet_ids, event['jets']):
+                    if jet['first'] <= i <= jet['last']:
+                        frames = (jet['start_frame'] if i == jet['first'] else 0,
+                                  jet['end_frame'] if i == jet['last'] else 14)
+                        visible.append((jet_id, jet, frames))
+                truth['subjects'][str(subject)] = [{'jet': jet_id, 'start_frame': frames[0], 'end_frame': frames[1]}
+                                                   for jet_id, _, frames in visible]
+
+                # the Jet or Not answers
+                p_yes = 0.9 if len(visible) > 0 else 0.15
+                yes = int(rng.binomial(nclassifications, p_yes))
+                question_writer.writerow([subject, JET_OR_NOT_WORKFLOW, 'T0', 'question_reducer',
+                                          nclassifications - yes, yes])
+
+                # the drawings of each volunteer: the first jet goes in T1 and the second in T5
+                drawings = {task: [] for task in TASKS}
+                labels = {task: [] for task in TASKS}
+                for k in range(nclassifications):
+                    drawn = [(jet_id, jet, frames) for jet_id, jet, frames in visible if rng.uniform() < detection]
+                    drawn = [drawn[j] for j in rng.permutation(len(drawn))]
+                    if rng.uniform() < noise:
+                        drawn.append((-1, None, None))
+
+                    for task, (jet_id, jet, frames) in zip(TASKS, drawn):
+                        drawing = draw_jet(rng, jet, frames, scatter)
+                        drawings[task].append(drawing)
+                        labels[task].append(jet_id)
+
+                        base_row = {'classification_id': classification_id + k, 'user_name': f'volunteer{k}',
+                                    'user_id': k, 'workflow_id': BOX_THE_JETS_WORKFLOW, 'task': task,
+                                    'created_at': '2022-01-01 00:00:00 UTC', 'subject_id': subject}
+
+                        # the points/box are in the frame where they were drawn
+                        row = {**base_row, 'extractor': 'point_extractor_by_frame'}
+                        row[f'data.frame{drawing["start_frame"]}.{task}_tool0_x'] = list_string([drawing['start'][0]])
+                        row[f'data.frame{drawing["start_frame"]}.{task}_tool0_y'] = list_string([drawing['start'][1]])
+                        row[f'data.frame{drawing["end_frame"]}.{task}_tool1_x'] = list_string([drawing['end'][0]])
+                        row[f'data.frame{drawing["end_frame"]}.{task}_tool1_y'] = list_string([drawing['end'][1]])
+                        point_extracts_writer.writerow(row)
+
+                        row = {**base_row, 'extractor': 'shape_extractor_rotateRectangle'}
+                        for key, value in zip(BOX_KEYS, drawing['box']):
+                            row[f'data.frame{drawing["box_frame"]}.{task}_tool2_{key}'] = list_string([value])
+                        box_extracts_writer.writerow(row)
+
+                classification_id += nclassifications
+
+                for task in TASKS:
+                    points, box = reduce_task(drawings[task], labels[task])
+                    points_writer.writerow({'subject_id': subject, 'workflow_id': BOX_THE_JETS_WORKFLOW, 'task': task,
+                                            'reducer': 'point_reducer_hdbscan',
+                                            **{f'data.frame0.{task}_{key}': value for key, value in points.items()}})
+                    box_writer.writerow({'subject_id': subject, 'workflow_id': BOX_THE_JETS_WORKFLOW, 'task': task,
+                                         'reducer': 'shape_reducer_dbscan',
+                                         **{f'data.frame0.{task}_{key}': value for key, value in box.items()}})
+
+                # Box the Jets questions: is there a jet (T3), and is there a second jet (T4)
+                for task, count in [('T3', len(drawings['T1'])), ('T4', len(drawings['T5']))]:
+                    box_question_writer.writerow([subject, BOX_THE_JETS_WORKFLOW, task, 'question_reducer',
+                                                  nclassifications - count, count])
+
+                subject += 1
+
+    with open(files['metadata'], 'w') as outfile:
+        json.dump(metadata, outfile)
+
+    with open(files['ground_truth'], 'w') as outfile:
+        json.dump(truth, outfile)
+
+    return files
+
+
+def load_ground_truth(path):
+    '''
+        Load the planted jets written by `write_synthetic_data`
+
+        Inputs
+        ------
+        path : str
+            Path to `ground_truth.json` (or the directory of the synthetic export)
+
+        Outputs
+        -------
+        truth : dict
+            Dictionary with the generator 'parameters', the 'events' (SOL name -> subjects
+            and jet IDs), the 'jets' (list of start/end points, box, time range and subjects)
+            and the 'subjects' (subject ID -> list of jets and the frames where they are visible)
+    '''
+    if os.path.isdir(path):
+        path = os.path.join(path, FILES['ground_truth'])
+
+    with open(path, 'r') as infile:
+        truth = json.load(infile)
+
+    truth['subjects'] = {int(subject): jets for subject, jets in truth['subjects'].items()}
+    return truth
+
+
+def score_jets(aggregator, truth, subjects=None, iou_threshold=0.5):
+    '''
+        Compare the jets found by `Aggregator.filter_classifications` with the planted jets.
+        Each planted jet is matched to the found jet with the highest box IoU
+        (if it is above `iou_threshold`)
+
+        Inputs
+        ------
+        aggregator : `Aggregator`
+            Aggregator with the synthetic reductions
+        truth : dict
+            Ground truth (see `load_ground_truth`)
+        subjects : list
+            Subjects to check (default: all the subjects in the aggregator)
+        iou_threshold : float
+            Minimum IoU between the boxes of a found jet and a planted jet to count as a match
+
+        Outputs
+        -------
+        scores : dict
+            Number of 'matched', 'missed' and 'spurious' jets, 'precision' and 'recall', the mean
+            'iou' and 'start_distance' (in pixels) of the matched jets and the 'time' taken
+            by `filter_classifications`
+    '''
+    if subjects is None:
+        subjects = aggregator.get_subjects()
+
+    matched = missed = spurious = 0
+    ious = []
+    distances = []
+    elapsed = 0.
+    for subject in subjects:
+        planted = [truth['jets'][jet['jet']] for jet in truth['subjects'][int(subject)]]
+
+        start = time.perf_counter()
+        jets = aggregator.filter_classifications(subject)
+        elapsed += time.perf_counter() - start
+
+        if len(jets) == 0 or len(planted) == 0:
+            missed += len(planted)
+            spurious += len(jets)
+            continue
+
+        # IoU of each planted jet (rows) with each found jet (columns)
+        iou = get_box_iou(get_box_polygons([jet['box'] for jet in planted])[:, np.newaxis],
+                          np.asarray([jet.box for jet in jets])[np.newaxis, :])
+
+        used = set()
+        for p in np.argsort(-iou.max(axis=1)):
+            candidates = [j for j in np.argsort(-iou[p]) if j not in used and iou[p, j] >= iou_threshold]
+            if len(candidates) == 0:
+                missed += 1
+                continue
+            j = candidates[0]
+            used.add(j)
+            matched += 1
+            ious.append(iou[p, j])
+            distances.append(np.linalg.norm(np.asarray(jets[j].start) - planted[p]['start']))
+        spurious += len(jets) - len(used)
+
+    return {'matched': matched, 'missed': missed, 'spurious': spurious,
+            'precision': matched / max(matched + spurious, 1), 'recall': matched / max(matched + missed, 1),
+            'iou': np.mean(ious) if len(ious) > 0 else np.nan,
+            'start_distance': np.mean(distances) if len(distances) > 0 else np.nan,
+            'time': elapsed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic Solar Jet Hunter export with planted jets')
+    parser.add_argument('output', help='directory where the files are written')
+    parser.add_argument('--subjects', type=int, default=1000, help='number of subjects')
+    parser.add_argument('--classifications', type=int, default=15, help='number of classifications per subject')
+    parser.add_argument('--subjects-per-event', type=int, default=10, help='number of subjects in each SOL event')
+    parser.add_argument('--second-jet-fraction', type=float, default=0.3, help='fraction of events with a second jet')
+    parser.add_argument('--detection', type=float, default=0.9,
+                        help='probability that a volunteer draws a visible jet')
+    parser.add_argument('--noise', type=float, default=0.05, help='probability that a volunteer draws a spurious jet')
+    parser.add_argument('--scatter', type=float, default=8., help='scatter of the volunteer drawings (pixels)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the random number generator')
+    parser.add_argument('--score', type=int, default=0, metavar='N',
+                        help='run filter_classifications on the first N subjects and compare with the planted jets')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    files = write_synthetic_data(args.output, args.subjects, args.classifications, seed=args.seed,
+                                 subjects_per_event=args.subjects_per_event,
+                                 second_jet_fraction=args.second_jet_fraction, detection=args.detection,
+                                 noise=args.noise, scatter=args.scatter)
+    print(f"Wrote {args.subjects} subjects to {args.output} in {time.perf_counter() - start:.1f} s")
+
+    if args.score > 0:
+        from BoxTheJets.aggregation.workflow import Aggregator
+
+        aggregator = Aggregator(files['points'], files['box'])
+        aggregator.load_extractor_data(files['point_extracts'], files['box_extracts'])
+        truth = load_ground_truth(files['ground_truth'])
+
+        scores = score_jets(aggregator, truth, aggregator.get_subjects()[:args.score])
+        print(f"Matched {scores['matched']} planted jets, missed {scores['missed']}, "
+              f"found {scores['spurious']} spurious jets")
+        print(f"Precision: {scores['precision']:.3f}  Recall: {scores['recall']:.3f}  "
+              f"Mean IoU: {scores['iou']:.3f}  Mean start distance: {scores['start_distance']:.1f} px")
+        print(f"filter_classifications took {scores['time']:.2f} s")
@@ -0,0 +1,2 @@
+# modules shared by the aggregation packages of the BoxTheJets and JetOrNot
+# workflows: the Panoptes fetcher, the gif writer, the image helpers and the instrumentation
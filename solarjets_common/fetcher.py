@@ -0,0 +1,409 @@
+import os
+import json
+import time
+import queue
+import struct
+import hashlib
+import tempfile
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from skimage import io
+from .instrumentation import add_count, record_cache
+
+# Panoptes API used to get the subject data (what `panoptes_client.Subject(id).raw` returns)
+PANOPTES_API_URL = 'https://www.zooniverse.org/api'
+PANOPTES_API_HEADERS = {'Accept': 'application/vnd.api+json; version=1'}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# HTTP status codes of the errors which are retried (rate limiting and server errors)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# JPEG start of frame markers (which contain the image size). 0xC4, 0xC8 and 0xCC
+# are other segments in the same range
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class Fetcher:
+    '''
+        Run blocking network requests (Panoptes API calls, image downloads)
+        on a bounded thread pool, retrying requests that fail with a transient
+        error with an exponential backoff
+    '''
+
+    def __init__(self, max_workers=8, retries=3, backoff=1., timeout=30., cache_dir=None, api_url=PANOPTES_API_URL):
+        '''
+            Inputs
+            ------
+            max_workers : int
+                Maximum number of concurrent requests
+            retries : int
+                Number of times a failed request is retried before giving up
+            backoff : float
+                Wait time (in seconds) before the first retry. The wait doubles
+                for every subsequent retry
+            timeout : float
+                Timeout (in seconds) for each HTTP request (`get`, `get_header`
+                and `get_subject_metadata`)
+            cache_dir : str
+                Directory where the content downloaded through `get` is saved
+                and reused. Can be shared between processes. No caching if None
+            api_url : str
+                URL of the Panoptes API (e.g. a local server for testing)
+        '''
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+        self.api_url = api_url
+
+    def call(self, func, *args, **kwargs):
+        '''
+            Call `func(*args, **kwargs)`, retrying with an exponential backoff
+            if it raises a transient error (see `is_transient`). Other errors
+            (e.g. a 404 for a missing subject) and the error from the final
+            attempt are re-raised.
+        '''
+        for attempt in range(self.retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.retries or not is_transient(e):
+                    raise
+                time.sleep(self.backoff * 2**attempt)
+
+    def get(self, url, headers=None):
+        '''
+            Download the content at `url` (with retries and a timeout), or
+            read it from `cache_dir` if it was downloaded before
+
+            Inputs
+            ------
+            url : str
+                URL to fetch
+            headers : dict
+                Extra HTTP headers for the request
+
+            Outputs
+            -------
+            content : bytes
+                The response body
+        '''
+        def get_content():
+            response = requests.get(url, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+            add_count('requests')
+            add_count('bytes_fetched', len(response.content))
+            return response.content
+
+        if self.cache_dir is None:
+            return self.call(get_content)
+
+        cache_file = os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest())
+        try:
+            with open(cache_file, 'rb') as infile:
+                content = infile.read()
+            record_cache('fetcher', True)
+            return content
+        except FileNotFoundError:
+            record_cache('fetcher', False)
+
+        content = self.call(get_content)
+
+        # write to a temporary file first so that other processes
+        # reading the cache never see a partially written file
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as outfile:
+            outfile.write(content)
+        os.replace(outfile.name, cache_file)
+
+        return content
+
+    def get_header(self, url, nbytes):
+        '''
+            Download (at most) the first `nbytes` bytes of the content at `url`.
+            Uses an HTTP Range request, and stops reading the response early if
+            the server ignores the range and sends the full content
+
+            Inputs
+            ------
+            url : str
+                URL to fetch
+            nbytes : int
+                Number of bytes to read
+
+            Outputs
+            -------
+            content : bytes
+                The start of the response body
+        '''
+        def get_content():
+            with requests.get(url, headers={'Range': f'bytes=0-{nbytes - 1}'},
+                              timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                content = b''
+                for chunk in response.iter_content(chunk_size=nbytes):
+                    content += chunk
+                    if len(content) >= nbytes:
+                        break
+            add_count('requests')
+            add_count('bytes_fetched', len(content))
+            return content[:nbytes]
+
+        return self.call(get_content)
+
+    def imap(self, func, items, retry=True):
+        '''
+            Apply `func` to each item concurrently, with at most `max_workers` requests
+            in flight. Results are put on a queue by the workers and yielded in the
+            order that they complete
+
+            Inputs
+            ------
+            func : callable
+                Function to call on each item
+            items : list
+                List of items to process
+            retry : bool
+                Retry `func` on failure. Set to False if `func` already
+                retries its own requests (e.g. through `get`)
+
+            Outputs
+            -------
+            result : tuple
+                Generator of (item, result, error) tuples, where `error` is the
+                exception raised for that item (None on success)
+        '''
+        items = list(items)
+        results = queue.Queue()
+
+        def worker(item):
+            try:
+                if retry:
+                    results.put((item, self.call(func, item), None))
+                else:
+                    results.put((item, func(item), None))
+            except Exception as e:
+                results.put((item, None, e))
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for item in items:
+                pool.submit(worker, item)
+
+            for _ in range(len(items)):
+                yield results.get()
+        finally:
+            # stop the queued requests if the loop is interrupted
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def map(self, func, items, retry=True):
+        '''
+            Apply `func` to each item concurrently and wait for all the results
+
+            Inputs
+            ------
+            func : callable
+                Function to call on each item
+            items : list
+                List of items to process
+            retry : bool
+                Retry `func` on failure (see `imap`)
+
+            Outputs
+            -------
+            results : dict
+                Dictionary of item -> result for the successful items
+            errors : dict
+                Dictionary of item -> exception for the failed items
+        '''
+        results = {}
+        errors = {}
+        for item, result, error in self.imap(func, items, retry):
+            if error is None:
+                results[item] = result
+            else:
+                errors[item] = error
+
+        return results, errors
+
+
+def is_transient(error):
+    '''
+        Check if a request error is worth retrying: timeouts, connection
+        errors and rate limiting/server errors (see `RETRY_STATUS_CODES`)
+
+        Inputs
+        ------
+        error : Exception
+            The exception raised by the request
+
+        Outputs
+        -------
+        transient : bool
+            True if the request can be retried
+    '''
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRY_STATUS_CODES
+
+    return False
+
+
+# shared fetcher used when none is passed to the functions below
+default_fetcher = Fetcher()
+
+
+def get_subject_metadata(subject, fetcher=None):
+    '''
+        Get the raw subject data (metadata and image locations) from Panoptes,
+        with the timeout and retries of the fetcher. If the fetcher has a `cache_dir`,
+        the subject data is cached there along with the images, so it is only
+        requested once per subject (e.g. when rendering the 15 frames of a gif)
+
+        Inputs
+        ------
+        subject : int
+            Zooniverse subject ID
+        fetcher : `Fetcher`
+            Fetcher to use (default: `default_fetcher`)
+
+        Outputs
+        -------
+        raw : dict
+            Raw subject data from the Panoptes API
+    '''
+    if fetcher is None:
+        fetcher = default_fetcher
+
+    content = fetcher.get(f'{fetcher.api_url}/subjects/{int(subject)}', headers=PANOPTES_API_HEADERS)
+    return json.loads(content)['subjects'][0]
+
+
+def get_frame_url(raw, frame):
+    '''
+        Get the image URL for a given frame from the raw subject data
+
+        Inputs
+        ------
+        raw : dict
+            Raw subject data (see `get_subject_metadata`)
+        frame : int
+            Frame number (between 0-14)
+
+        Outputs
+        -------
+        url : str
+            URL of the PNG (or JPEG) image for the frame
+    '''
+    try:
+        return raw['locations'][frame]['image/png']
+    except KeyError:
+        return raw['locations'][frame]['image/jpeg']
+
+
+def fetch_subjects_metadata(subjects, fetcher=None):
+    '''
+        Get the raw subject data for a list of subjects concurrently
+
+        Inputs
+        ------
+        subjects : list
+            List of Zooniverse subject IDs
+        fetcher : `Fetcher`
+            Fetcher to use (default: `default_fetcher`)
+
+        Outputs
+        -------
+        raw : dict
+            Dictionary of subject ID -> raw subject data
+        errors : dict
+            Dictionary of subject ID -> exception for the subjects that could not be fetched
+    '''
+    if fetcher is None:
+        fetcher = default_fetcher
+
+    return fetcher.map(lambda subject: get_subject_metadata(subject, fetcher),
+                       [int(subject) for subject in subjects], retry=False)
+
+
+def parse_image_size(header):
+    '''
+        Get the image size from the first bytes of a PNG or JPEG file
+
+        Inputs
+        ------
+        header : bytes
+            Start of the image file
+
+        Outputs
+        -------
+        size : tuple
+            (width, height) of the image, or None if the format is not
+            recognized or the header does not contain the size
+    '''
+    # PNG: the IHDR chunk always comes first
+    if header[:8] == PNG_SIGNATURE:
+        if len(header) < 24 or header[12:16] != b'IHDR':
+            return None
+        return struct.unpack('>II', header[16:24])
+
+    # JPEG: walk through the segments until the start of frame
+    if header[:2] != b'\xff\xd8':
+        return None
+
+    i = 2
+    while i + 9 <= len(header):
+        if header[i] != 0xFF:
+            return None
+        marker = header[i + 1]
+        if marker == 0xFF:
+            # fill byte
+            i += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', header[i + 5:i + 9])
+            return width, height
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # markers without a length
+            i += 2
+            continue
+        i += 2 + struct.unpack('>H', header[i + 2:i + 4])[0]
+
+    return None
+
+
+def get_image_size(url, fetcher=None, probe_bytes=4096):
+    '''
+        Get the size of an image without downloading the full file. Only the
+        header is fetched and parsed, and the full image is downloaded and
+        decoded only if the size could not be found in the header
+
+        Inputs
+        ------
+        url : str
+            URL of the PNG or JPEG image
+        fetcher : `Fetcher`
+            Fetcher to use (default: `default_fetcher`)
+        probe_bytes : int
+            Number of bytes to fetch for the header
+
+        Outputs
+        -------
+        size : tuple
+            (width, height) of the image
+    '''
+    if fetcher is None:
+        fetcher = default_fetcher
+
+    size = parse_image_size(fetcher.get_header(url, probe_bytes))
+
+    if size is None:
+        ny, nx = io.imread(BytesIO(fetcher.get(url))).shape[:2]
+        size = (nx, ny)
+
+    return tuple(int(val) for val in size)
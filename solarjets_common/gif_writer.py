@@ -0,0 +1,190 @@
+import os
+import time
+import tqdm
+import matplotlib
+from io import BytesIO
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from matplotlib import animation
+from PIL import Image, GifImagePlugin
+from .fetcher import default_fetcher
+
+
+class GifStreamWriter(animation.PillowWriter):
+    '''
+        In-process GIF writer for `matplotlib.animation`. Unlike the
+        `PillowWriter`, which keeps every frame in memory until the animation
+        is finished, each frame is quantized and encoded to the output file as
+        soon as it is grabbed, so the memory use does not grow with the
+        number of frames
+
+        Usage
+        -----
+        ani.save(output, writer=GifStreamWriter(fps=5))
+    '''
+
+    def setup(self, fig, outfile, dpi=None):
+        super().setup(fig, outfile, dpi=dpi)
+        self._outfile = open(self.outfile, 'wb')
+        self._nframes = 0
+
+    def grab_frame(self, **savefig_kwargs):
+        buf = BytesIO()
+        self.fig.savefig(buf, **{**savefig_kwargs, 'format': 'rgba', 'dpi': self.dpi})
+        img = Image.frombuffer('RGBA', self.frame_size, buf.getbuffer(), 'raw', 'RGBA', 0, 1)
+
+        # each frame gets its own palette, so that the colors
+        # of different subjects do not need to share 256 colors
+        frame = img.convert('RGB').quantize(colors=256)
+        duration = int(1000 / self.fps)
+
+        if self._nframes == 0:
+            # the GIF header (with the looping info) is taken from the first frame
+            header, _ = GifImagePlugin.getheader(frame, info={'loop': 0, 'duration': duration})
+            self._outfile.writelines(header)
+
+        self._outfile.writelines(GifImagePlugin.getdata(frame, duration=duration, include_color_table=True))
+        self._nframes += 1
+
+    def finish(self):
+        # GIF trailer
+        self._outfile.write(b';')
+        self._outfile.close()
+
+
+def is_up_to_date(output, sources=()):
+    '''
+        Check whether `output` exists and is newer than all the `sources` files
+    '''
+    if not os.path.exists(output):
+        return False
+
+    mtime = os.path.getmtime(output)
+    return all(os.path.getmtime(source) <= mtime for source in sources)
+
+
+def init_render_worker(cache_dir):
+    '''
+        Set up a worker process for `render_gifs`: use the non-interactive
+        Agg backend and share the frame cache between the workers
+    '''
+    matplotlib.use('Agg')
+    default_fetcher.cache_dir = cache_dir
+
+
+def render_gif(func, item, output, kwargs):
+    '''
+        Call `func(item, output, **kwargs)` to create one gif, and return
+        the time taken. The gif is written to a temporary file which is moved
+        to `output` when it is complete, so that a failed or interrupted
+        render never leaves a partial gif that looks up to date
+    '''
+    start = time.perf_counter()
+
+    root, ext = os.path.splitext(output)
+    partial = f'{root}.part{ext}'
+    try:
+        func(item, partial, **kwargs)
+        os.replace(partial, output)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    return time.perf_counter() - start
+
+
+def render_gifs(func, items, outputs, processes=None, cache_dir='frame_cache', sources=(), overwrite=False, **kwargs):
+    '''
+        Create the gifs for a batch of items on a pool of worker processes
+
+        Inputs
+        ------
+        func : callable
+            Function which creates the gif for one item, called as
+            `func(item, output, **kwargs)`. Must be picklable (i.e. defined
+            at the module level)
+        items : list
+            List of items (e.g. `JetCluster` objects or subject IDs)
+        outputs : list
+            Name of the gif for each item
+        processes : int
+            Number of worker processes (default: number of CPUs).
+            Set to 1 to render in the main process. Each worker has its own
+            in-memory caches (e.g. the frame cache of `get_subject_image`), so
+            their memory use is multiplied by the number of processes
+        cache_dir : str
+            Directory for the downloaded frames and subject metadata, which is shared by the workers
+            (and between runs). No caching if None
+        sources : list
+            Files that the gifs are created from (e.g. the JetCluster JSON file).
+            Gifs which are newer than all the sources are not rendered again
+        overwrite : bool
+            Render all the gifs, even if they are up to date
+        kwargs : dict
+            Extra arguments passed to `func`
+
+        Outputs
+        -------
+        times : dict
+            Dictionary of output -> time taken (in seconds) for the rendered gifs
+        errors : dict
+            Dictionary of output -> exception for the gifs that failed
+        skipped : list
+            List of outputs that were already up to date
+    '''
+    jobs = []
+    skipped = []
+    for item, output in zip(items, outputs):
+        if not overwrite and is_up_to_date(output, sources):
+            skipped.append(output)
+        else:
+            jobs.append((item, output))
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(min(processes, len(jobs)), 1)
+
+    def run_jobs():
+        for item, output in jobs:
+            try:
+                yield output, render_gif(func, item, output, kwargs), None
+            except Exception as e:
+                yield output, None, e
+
+    def collect_jobs(futures):
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+    times = {}
+    errors = {}
+    with ExitStack() as stack:
+        if processes > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=processes, initializer=init_render_worker,
+                                                           initargs=(cache_dir,)))
+            results = collect_jobs({pool.submit(render_gif, func, item, output, kwargs): output
+                                    for item, output in jobs})
+        else:
+            # render in this process, using the cache for the duration of the batch
+            stack.callback(setattr, default_fetcher, 'cache_dir', default_fetcher.cache_dir)
+            default_fetcher.cache_dir = cache_dir
+            results = run_jobs()
+
+        r = tqdm.tqdm(results, total=len(jobs), desc='Rendering gifs')
+        for output, elapsed, error in r:
+            if error is None:
+                times[output] = elapsed
+            else:
+                errors[output] = error
+            r.set_postfix({'errors': len(errors)})
+
+    if len(skipped) > 0:
+        print(f"Skipped {len(skipped)} gifs which are up to date")
+    if len(errors) > 0:
+        print(f"Could not create {len(errors)} gifs:")
+        for output, error in errors.items():
+            print(f"    {output}: {error!r}")
+
+    return times, errors, skipped
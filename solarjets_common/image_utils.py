@@ -0,0 +1,44 @@
+import numpy as np
+from PIL import Image
+from skimage import transform, util
+
+
+def resize_image(img, shape, mode='fast'):
+    '''
+        Resize an image
+
+        Inputs
+        ------
+        img : numpy.ndarray
+            Image to resize
+        shape : tuple
+            Output (height, width)
+        mode : str
+            'fast' uses bilinear resampling with Pillow, and keeps 8-bit
+            images as uint8 (other images fall back to 'skimage'). 'skimage' uses
+            the anti-aliased `skimage.transform.resize`, which returns a float image
+
+        Outputs
+        -------
+        img : numpy.ndarray
+            Resized image
+    '''
+    if mode not in ['fast', 'skimage']:
+        raise ValueError(f"Unknown resize mode {mode}")
+
+    if mode == 'fast' and img.dtype == np.uint8 and (img.ndim == 2 or img.shape[2] in [3, 4]):
+        resized = Image.fromarray(img).resize((shape[1], shape[0]), Image.Resampling.BILINEAR, reducing_gap=2.)
+        return np.asarray(resized)
+
+    return transform.resize(img, shape)
+
+
+def to_rgb_uint8(img):
+    '''
+        Convert a grayscale, RGB or RGBA image of any dtype to an RGB uint8 image
+    '''
+    img = util.img_as_ubyte(img)
+    if img.ndim == 2:
+        return np.stack([img] * 3, axis=-1)
+
+    return img[:, :, :3]
@@ -0,0 +1,434 @@
+import os
+import sys
+import json
+import time
+import atexit
+import inspect
+import importlib
+import functools
+import threading
+import cProfile
+import pstats
+from io import StringIO
+from contextlib import contextmanager
+
+# methods of these classes and these functions (by module) are timed when
+# the instrumentation is enabled. Modules that are not in a package are skipped
+INSTRUMENTED_CLASSES = {
+    'workflow': ['Aggregator'],
+    'SOL_class': ['SOL', 'JetCluster'],
+    'meta_file_handler': ['MetaFile'],
+    'questionresult': ['QuestionResult'],
+    'frame_store': ['FrameStore'],
+    'fetcher': ['Fetcher'],
+}
+
+INSTRUMENTED_FUNCTIONS = {
+    'workflow': ['get_subject_image'],
+    'util': ['get_subject_image'],
+    'image_utils': ['resize_image'],
+    'image_handler': ['world_from_pixel', 'solar_conversion'],
+    'fetcher': ['get_image_size', 'fetch_subjects_metadata'],
+    'meta_file_handler': ['get_subject_metadata_lookup'],
+    'questionresult': ['find_jet_sequences'],
+}
+
+# Fetcher.call wraps every request made through get/get_header, so is not timed separately
+SKIPPED_METHODS = {'Fetcher.call', 'Fetcher.imap', 'Fetcher.map'}
+
+# environment variable to enable the instrumentation when the package is imported.
+# Set to a .json file name to save the statistics there when Python exits,
+# or to any other value to print the table
+ENVIRONMENT_VARIABLE = 'SOLARJETS_STATS'
+
+
+class Stats:
+    '''
+        Statistics collected by the instrumentation: the number of calls and
+        the cumulative and maximum wall time of each instrumented method, counters
+        (e.g. the number of bytes fetched over the network) and cache hits/misses.
+        Safe to update from several threads
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''
+            Clear all the statistics
+        '''
+        with self.lock:
+            # name -> [count, total time, max time]
+            self.calls = {}
+            self.counters = {}
+            # name -> [hits, misses]
+            self.caches = {}
+
+    def record_call(self, name, elapsed):
+        with self.lock:
+            call = self.calls.setdefault(name, [0, 0., 0.])
+            call[0] += 1
+            call[1] += elapsed
+            call[2] = max(call[2], elapsed)
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_cache(self, name, hit):
+        with self.lock:
+            cache = self.caches.setdefault(name, [0, 0])
+            cache[0 if hit else 1] += 1
+
+    def to_dict(self):
+        '''
+            Get the statistics as a JSON serializable dictionary
+
+            Outputs
+            -------
+            stats : dict
+                Dictionary with the 'calls' (name -> count, total, mean and max time
+                in seconds), the 'counters' (name -> value) and the 'caches'
+                (name -> hits, misses and hit rate)
+        '''
+        with self.lock:
+            calls = {name: {'count': count, 'total': total, 'mean': total / count, 'max': maxtime}
+                     for name, (count, total, maxtime) in self.calls.items()}
+            caches = {name: {'hits': hits, 'misses': misses, 'hit_rate': hits / max(hits + misses, 1)}
+                      for name, (hits, misses) in self.caches.items()}
+            return {'calls': calls, 'counters': dict(self.counters), 'caches': caches}
+
+    def save_json(self, filename):
+        '''
+            Save the statistics (see `to_dict`) to a JSON file
+        '''
+        with open(filename, 'w') as outfile:
+            json.dump(self.to_dict(), outfile, indent=2)
+
+    def format_table(self, sort='total', limit=None):
+        '''
+            Format the statistics as a text table
+
+            Inputs
+            ------
+            sort : str
+                Column used to sort the calls ('count', 'total', 'mean' or 'max')
+            limit : int
+                Only show the first `limit` calls (default: all)
+
+            Outputs
+            -------
+            table : str
+                The formatted table
+        '''
+        stats = self.to_dict()
+        calls = sorted(stats['calls'].items(), key=lambda item: item[1][sort], reverse=True)[:limit]
+
+        width = max([len(name) for name in [*stats['calls'], *stats['counters'], *stats['caches']]] + [8])
+        lines = [f"{'Method':<{width}} {'Calls':>9} {'Total (s)':>11} {'Mean (ms)':>11} {'Max (ms)':>11}"]
+        for name, call in calls:
+            lines.append(f"{name:<{width}} {call['count']:>9d} {call['total']:>11.3f} "
+                         f"{1000 * call['mean']:>11.3f} {1000 * call['max']:>11.3f}")
+
+        if len(stats['counters']) > 0:
+            lines.extend(['', f"{'Counter':<{width}} {'Value':>9}"])
+            for name, value in sorted(stats['counters'].items()):
+                lines.append(f"{name:<{width}} {value:>9d}")
+
+        if len(stats['caches']) > 0:
+            lines.extend(['', f"{'Cache':<{width}} {'Hits':>9} {'Misses':>11} {'Hit rate':>11}"])
+            for name, cache in sorted(stats['caches'].items()):
+                lines.append(f"{name:<{width}} {cache['hits']:>9d} {cache['misses']:>11d} {cache['hit_rate']:>11.1%}")
+
+        return '\n'.join(lines)
+
+    def print_table(self, sort='total', limit=None):
+        '''
+            Print the statistics as a table (see `format_table`)
+        '''
+        print(self.format_table(sort, limit))
+
+
+# shared statistics which are updated by the instrumented code
+run_stats = Stats()
+
+# (owner, attribute name, original value) of everything replaced by `enable_instrumentation`
+patched = []
+
+# packages whose modules are instrumented: the shared modules, and the
+# aggregation packages which are added by `register_package` when imported
+packages = [__name__.rsplit('.', 1)[0]]
+
+
+def add_count(name, value=1):
+    '''
+        Add `value` to the counter `name`, if the instrumentation is enabled
+    '''
+    if run_stats.enabled:
+        run_stats.add(name, value)
+
+
+def record_cache(name, hit):
+    '''
+        Record a hit (or a miss) of the cache `name`, if the instrumentation is enabled
+    '''
+    if run_stats.enabled:
+        run_stats.record_cache(name, hit)
+
+
+def timed(func, name):
+    '''
+        Wrap `func` so that its calls are recorded in `run_stats` as `name`
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            run_stats.record_call(name, time.perf_counter() - start)
+
+    return wrapper
+
+
+def register_package(name):
+    '''
+        Add a package (e.g. the `aggregation` package of a workflow) whose modules
+        are instrumented along with the shared modules. Called when the package is
+        imported, so the instrumentation is applied to it if it is already enabled
+
+        Inputs
+        ------
+        name : str
+            Name of the package
+    '''
+    if name in packages:
+        return
+
+    packages.append(name)
+    if run_stats.enabled:
+        disable_instrumentation()
+        enable_instrumentation(reset=False)
+
+
+def get_package_modules():
+    '''
+        Get the modules of the registered packages that contain instrumented code
+
+        Outputs
+        -------
+        packages : list
+            The registered packages
+        modules : list
+            (name, module) of the modules with instrumented code
+    '''
+    modules = []
+    for package in packages:
+        for name in {*INSTRUMENTED_CLASSES, *INSTRUMENTED_FUNCTIONS}:
+            try:
+                modules.append((name, importlib.import_module(f'{package}.{name}')))
+            except ModuleNotFoundError:
+                continue
+
+    return [sys.modules[package] for package in packages], modules
+
+
+def enable_instrumentation(reset=True):
+    '''
+        Enable the instrumentation: the methods of the instrumented classes
+        (`Aggregator`, `SOL`, `MetaFile`, `QuestionResult`, ...) and the image and
+        WCS helpers are wrapped to record their calls and timings, and the
+        fetcher and image caches record the bytes fetched and their hits/misses.
+        The statistics are collected in `run_stats`
+
+        Inputs
+        ------
+        reset : bool
+            Clear the statistics collected so far
+    '''
+    if reset:
+        run_stats.reset()
+
+    if run_stats.enabled:
+        return
+
+    owners, modules = get_package_modules()
+    owners.extend(module for _, module in modules)
+
+    for module_name, module in modules:
+        for class_name in INSTRUMENTED_CLASSES.get(module_name, []):
+            cls = getattr(module, class_name)
+            for name, value in list(vars(cls).items()):
+                qualname = f'{class_name}.{name}'
+                # the constructors are timed since they read the data files
+                if (name.startswith('_') and name != '__init__') or qualname in SKIPPED_METHODS:
+                    continue
+
+                if isinstance(value, (classmethod, staticmethod)):
+                    func = value.__func__
+                    wrapper = type(value)(timed(func, qualname))
+                elif inspect.isfunction(value):
+                    func = value
+                    wrapper = timed(func, qualname)
+                else:
+                    continue
+
+                # generators return immediately, so their time is not meaningful
+                if inspect.isgeneratorfunction(func):
+                    continue
+
+                patched.append((cls, name, value))
+                setattr(cls, name, wrapper)
+
+    for module_name, module in modules:
+        for function_name in INSTRUMENTED_FUNCTIONS.get(module_name, []):
+            func = getattr(module, function_name)
+            wrapper = timed(func, f'{module_name}.{function_name}')
+
+            # the function is also imported by name in other modules,
+            # so replace every reference to it
+            for owner in owners:
+                if getattr(owner, function_name, None) is func:
+                    patched.append((owner, function_name, func))
+                    setattr(owner, function_name, wrapper)
+
+    run_stats.enabled = True
+
+
+def disable_instrumentation():
+    '''
+        Disable the instrumentation and restore the original methods and functions.
+        The statistics collected so far are kept in `run_stats`
+    '''
+    run_stats.enabled = False
+    while len(patched) > 0:
+        owner, name, value = patched.pop()
+        setattr(owner, name, value)
+
+
+@contextmanager
+def instrumented(reset=True):
+    '''
+        Context manager which enables the instrumentation for a block of code
+
+        Usage
+        -----
+        with instrumented() as run_stats:
+            sol.filter_jet_clusters(SOL_event)
+        run_stats.print_table()
+    '''
+    enable_instrumentation(reset)
+    try:
+        yield run_stats
+    finally:
+        disable_instrumentation()
+
+
+def profile_call(func, *args, engine='cprofile', output=None, limit=30, **kwargs):
+    '''
+        Run `func(*args, **kwargs)` under a profiler
+
+        Inputs
+        ------
+        func : callable
+            Function to profile
+        engine : str
+            'cprofile' (the built-in deterministic profiler) or 'pyinstrument'
+            (statistical profiler, needs the `pyinstrument` package)
+        output : str
+            File to save the profile to (a `.prof` file for cProfile, which can be read
+            with `pstats` or snakeviz, and a `.html` or text file for pyinstrument).
+            If None, the profile is printed
+        limit : int
+            Number of functions to print for cProfile
+        args, kwargs :
+            Arguments passed to `func`
+
+        Outputs
+        -------
+        result :
+            The value returned by `func`
+    '''
+    if engine == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            result = profiler.runcall(func, *args, **kwargs)
+        finally:
+            if output is not None:
+                profiler.dump_stats(output)
+            else:
+                text = StringIO()
+                pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(limit)
+                print(text.getvalue())
+    elif engine == 'pyinstrument':
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            if output is None:
+                print(profiler.output_text(unicode=True, color=False))
+            elif output.endswith('.html'):
+                profiler.write_html(output)
+            else:
+                with open(output, 'w') as outfile:
+                    outfile.write(profiler.output_text(unicode=True, color=False))
+    else:
+        raise ValueError(f"Unknown profiler engine {engine}")
+
+    return result
+
+
+def profile_subject(aggregator, subject, engine='cprofile', output=None, limit=30):
+    '''
+        Profile the aggregation of a single subject (`Aggregator.filter_classifications`).
+        See `profile_call` for the arguments
+
+        Outputs
+        -------
+        jets : list
+            List of `Jet` objects found in the subject
+    '''
+    return profile_call(aggregator.filter_classifications, subject, engine=engine, output=output, limit=limit)
+
+
+def profile_sol_event(sol, SOL_event, engine='cprofile', output=None, limit=30, **kwargs):
+    '''
+        Profile the clustering of the jets of a single SOL event (`SOL.filter_jet_clusters`).
+        Extra keyword arguments are passed to `filter_jet_clusters`. See `profile_call`
+        for the other arguments
+
+        Outputs
+        -------
+        result : tuple
+            The output of `SOL.filter_jet_clusters`
+    '''
+    return profile_call(sol.filter_jet_clusters, SOL_event, engine=engine, output=output, limit=limit, **kwargs)
+
+
+def report_at_exit(output):
+    '''
+        Save (to a .json file) or print the statistics when Python exits
+    '''
+    if output.endswith('.json'):
+        run_stats.save_json(output)
+    else:
+        run_stats.print_table()
+
+
+def enable_from_environment():
+    '''
+        Enable the instrumentation if the `SOLARJETS_STATS` environment variable is set,
+        and report the statistics when Python exits. Called when the package is imported
+    '''
+    output = os.environ.get(ENVIRONMENT_VARIABLE, '')
+    if output in ['', '0'] or run_stats.enabled:
+        return
+
+    enable_instrumentation()
+    atexit.register(report_at_exit, output)
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+
+# the aggregation packages are imported from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''
+        Serves the routes of the server: path -> (status, headers, body, delay).
+        A route given as a list is served in turn for successive requests
+        (the last one is repeated)
+    '''
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            route = server.routes.get(self.path, (404, {}, b'', 0))
+            if isinstance(route, list):
+                route = route.pop(0) if len(route) > 1 else route[0]
+
+        status, headers, body, delay = route
+        try:
+            time.sleep(delay)
+            self.send_response(status)
+            for key, value in {'Content-Length': str(len(body)), **headers}.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.routes = {}
+    server.requests = []
+    server.active = 0
+    server.max_active = 0
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,173 @@
+import json
+import time
+import struct
+from io import BytesIO
+import pytest
+import requests
+from PIL import Image
+from solarjets_common.fetcher import Fetcher, get_subject_metadata, fetch_subjects_metadata, get_image_size
+from JetOrNot.aggregation.util import get_subject_image
+
+
+def count_requests(server, path):
+    return len([request for request, _ in server.requests if request == path])
+
+
+def png_header(width, height):
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', width, height) + b'\x08\x02\x00\x00\x00'
+
+
+def test_get(server):
+    server.routes['/image.png'] = (200, {}, b'content', 0)
+    fetcher = Fetcher(backoff=0.01)
+
+    assert fetcher.get(f'{server.url}/image.png') == b'content'
+
+
+def test_get_retries(server):
+    server.routes['/image.png'] = [(500, {}, b'', 0), (503, {}, b'', 0), (200, {}, b'content', 0)]
+    fetcher = Fetcher(retries=2, backoff=0.01)
+
+    assert fetcher.get(f'{server.url}/image.png') == b'content'
+    assert count_requests(server, '/image.png') == 3
+
+
+def test_get_gives_up(server):
+    server.routes['/image.png'] = (500, {}, b'', 0)
+    fetcher = Fetcher(retries=2, backoff=0.01)
+
+    with pytest.raises(requests.HTTPError):
+        fetcher.get(f'{server.url}/image.png')
+    assert count_requests(server, '/image.png') == 3
+
+
+@pytest.mark.parametrize('status', [404, 403])
+def test_get_not_retried(server, status):
+    # client errors are permanent, so they are raised without waiting for a retry
+    server.routes['/image.png'] = (status, {}, b'', 0)
+    fetcher = Fetcher(retries=3, backoff=1.)
+
+    start = time.perf_counter()
+    with pytest.raises(requests.HTTPError):
+        fetcher.get(f'{server.url}/image.png')
+    assert time.perf_counter() - start < 0.5
+    assert count_requests(server, '/image.png') == 1
+
+
+def test_get_rate_limited(server):
+    server.routes['/image.png'] = [(429, {}, b'', 0), (200, {}, b'content', 0)]
+    fetcher = Fetcher(retries=1, backoff=0.01)
+
+    assert fetcher.get(f'{server.url}/image.png') == b'content'
+    assert count_requests(server, '/image.png') == 2
+
+
+def test_call_not_retried():
+    # errors which are not from a request (e.g. a bug in the function) are raised immediately
+    calls = []
+
+    def func():
+        calls.append(1)
+        raise KeyError('subjects')
+
+    with pytest.raises(KeyError):
+        Fetcher(retries=3, backoff=1.).call(func)
+    assert len(calls) == 1
+
+
+def test_get_timeout(server):
+    server.routes['/image.png'] = [(200, {}, b'slow', 2), (200, {}, b'content', 0)]
+    fetcher = Fetcher(retries=1, backoff=0.01, timeout=0.2)
+
+    start = time.perf_counter()
+    assert fetcher.get(f'{server.url}/image.png') == b'content'
+    assert time.perf_counter() - start < 1.5
+    assert count_requests(server, '/image.png') == 2
+
+
+def test_get_cache(server, tmp_path):
+    server.routes['/image.png'] = (200, {}, b'content', 0)
+    fetcher = Fetcher(backoff=0.01, cache_dir=str(tmp_path))
+
+    assert fetcher.get(f'{server.url}/image.png') == b'content'
+    assert Fetcher(cache_dir=str(tmp_path)).get(f'{server.url}/image.png') == b'content'
+    assert count_requests(server, '/image.png') == 1
+
+
+@pytest.mark.parametrize('status', [206, 200])
+def test_get_header(server, status):
+    # the server either honours the Range request or sends the full content
+    body = png_header(1920, 1440) + b'\x00' * 100000
+    server.routes['/image.png'] = (status, {}, body[:64] if status == 206 else body, 0)
+    fetcher = Fetcher(backoff=0.01)
+
+    assert fetcher.get_header(f'{server.url}/image.png', 64) == body[:64]
+    assert dict(server.requests[0][1])['Range'] == 'bytes=0-63'
+    assert get_image_size(f'{server.url}/image.png', fetcher) == (1920, 1440)
+
+
+def test_get_subject_metadata(server):
+    raw = {'id': '12345', 'metadata': {'#width': 1920}, 'locations': [{'image/png': f'{server.url}/0.png'}]}
+    server.routes['/api/subjects/12345'] = [(502, {}, b'', 0), (200, {}, json.dumps({'subjects': [raw]}).encode(), 0)]
+    fetcher = Fetcher(backoff=0.01, api_url=f'{server.url}/api')
+
+    assert get_subject_metadata(12345, fetcher) == raw
+    assert count_requests(server, '/api/subjects/12345') == 2
+    assert 'application/vnd.api+json' in server.requests[0][1]['Accept']
+
+
+def test_get_subject_metadata_timeout(server):
+    server.routes['/api/subjects/12345'] = (200, {}, b'{}', 2)
+    fetcher = Fetcher(retries=1, backoff=0.01, timeout=0.2, api_url=f'{server.url}/api')
+
+    with pytest.raises(requests.Timeout):
+        get_subject_metadata(12345, fetcher)
+    assert count_requests(server, '/api/subjects/12345') == 2
+
+
+def test_fetch_subjects_metadata(server):
+    subjects = list(range(20))
+    for subject in subjects:
+        body = json.dumps({'subjects': [{'id': str(subject)}]}).encode()
+        server.routes[f'/api/subjects/{subject}'] = (200, {}, body, 0.05) if subject != 13 else (404, {}, b'', 0)
+    fetcher = Fetcher(max_workers=4, retries=1, backoff=0.01, api_url=f'{server.url}/api')
+
+    raw, errors = fetch_subjects_metadata(subjects, fetcher)
+
+    assert sorted(raw) == [subject for subject in subjects if subject != 13]
+    assert all(raw[subject]['id'] == str(subject) for subject in raw)
+    assert list(errors) == [13] and isinstance(errors[13], requests.HTTPError)
+    # the missing subject is not retried, and at most max_workers requests run at once
+    assert count_requests(server, '/api/subjects/13') == 1
+    assert 1 < server.max_active <= 4
+
+
+def test_imap_results_queue(server):
+    for item in range(8):
+        server.routes[f'/{item}'] = (200, {}, str(item).encode(), 0.05 * (8 - item))
+    fetcher = Fetcher(max_workers=8, backoff=0.01)
+
+    results = list(fetcher.imap(lambda item: fetcher.get(f'{server.url}/{item}'), range(8), retry=False))
+
+    # the results come out as soon as they are ready, so the fastest requests first
+    assert [item for item, _, _ in results][:2] == [7, 6]
+    assert all(content == str(item).encode() and error is None for item, content, error in results)
+
+
+def test_subject_metadata_cache(server, tmp_path):
+    # the subject data is cached with the images, so rendering all the frames
+    # of a subject only requests it once, and not at all with a warm cache
+    raw = {'id': '12345', 'metadata': {}, 'locations': [{'image/png': f'{server.url}/{frame}.png'} for frame in range(15)]}
+    server.routes['/api/subjects/12345'] = (200, {}, json.dumps({'subjects': [raw]}).encode(), 0)
+    image = BytesIO()
+    Image.new('RGB', (1920, 1440)).save(image, format='PNG')
+    for frame in range(15):
+        server.routes[f'/{frame}.png'] = (200, {}, image.getvalue(), 0)
+
+    for _ in range(2):
+        fetcher = Fetcher(backoff=0.01, cache_dir=str(tmp_path), api_url=f'{server.url}/api')
+        for frame in range(15):
+            assert get_subject_image(12345, frame, fetcher).shape == (1440, 1920, 3)
+
+    assert count_requests(server, '/api/subjects/12345') == 1
+    assert all(count_requests(server, f'/{frame}.png') == 1 for frame in range(15))
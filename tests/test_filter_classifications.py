@@ -0,0 +1,25 @@
+import os
+import sys
+from BoxTheJets.aggregation.workflow import Aggregator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from synthetic import write_synthetic_data, load_ground_truth  # noqa: E402
+
+
+def test_filter_classifications_without_jets(tmp_path):
+    # the subjects without planted jets only have a few spurious boxes,
+    # which do not form a cluster, so no jet is found in them
+    files = write_synthetic_data(str(tmp_path), 100, 15, noise=0.2)
+    aggregator = Aggregator(files['points'], files['box'])
+    aggregator.load_extractor_data(files['point_extracts'], files['box_extracts'])
+    truth = load_ground_truth(files['ground_truth'])
+
+    empty = [subject for subject in aggregator.get_subjects() if len(truth['subjects'][int(subject)]) == 0]
+    assert len(empty) > 0
+    assert any(len(aggregator.get_box_data(subject, 'T1')[0]['x']) > 0 for subject in empty)
+
+    for subject in aggregator.get_subjects():
+        jets = aggregator.filter_classifications(subject)
+        if subject in empty:
+            assert jets == []
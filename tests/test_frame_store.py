@@ -0,0 +1,149 @@
+import os
+import json
+from io import BytesIO
+import numpy as np
+import pytest
+import requests
+from PIL import Image
+from BoxTheJets.aggregation import workflow
+from solarjets_common.fetcher import Fetcher
+from BoxTheJets.aggregation.frame_store import FrameStore
+
+
+@pytest.mark.parametrize('mode, size', [('RGBA', (200, 150)), ('L', (200, 150)), ('RGB', (192, 144))])
+def test_get_subject_image_with_store(server, tmp_path, monkeypatch, mode, size):
+    # the frames are the same RGB uint8 images whether they come from the store or not
+    rng = np.random.default_rng(0)
+    locations = []
+    for frame in range(15):
+        image = BytesIO()
+        pixels = rng.integers(0, 256, (size[1], size[0], len(mode)), dtype=np.uint8)
+        Image.fromarray(pixels.squeeze(), mode=mode).save(image, format='PNG')
+        server.routes[f'/{frame}.png'] = (200, {}, image.getvalue(), 0)
+        locations.append({'image/png': f'{server.url}/{frame}.png'})
+
+    raw = {'id': '12345', 'metadata': {'#width': '192', '#height': '144'}, 'locations': locations}
+    server.routes['/api/subjects/12345'] = (200, {}, json.dumps({'subjects': [raw]}).encode(), 0)
+
+    fetcher = Fetcher(backoff=0.01, api_url=f'{server.url}/api')
+    store = FrameStore(str(tmp_path))
+    monkeypatch.setattr(workflow, 'frame_cache', type(workflow.frame_cache)())
+
+    fetched = [workflow.get_subject_image(12345, frame, fetcher, store=store) for frame in range(15)]
+    store.add_subject(12345, fetcher)
+    stored = [workflow.get_subject_image(12345, frame, fetcher, store=store) for frame in range(15)]
+
+    for img_fetched, img_stored in zip(fetched, stored):
+        assert isinstance(img_stored, np.memmap)
+        assert img_fetched.dtype == img_stored.dtype == np.uint8
+        assert img_fetched.shape == img_stored.shape == (144, 192, 3)
+        assert np.array_equal(img_fetched, img_stored)
+
+
+def add_subjects(server, subjects, size=(64, 48)):
+    image = BytesIO()
+    Image.new('RGB', size).save(image, format='PNG')
+    for subject in subjects:
+        locations = []
+        for frame in range(15):
+            server.routes[f'/{subject}/{frame}.png'] = (200, {}, image.getvalue(), 0)
+            locations.append({'image/png': f'{server.url}/{subject}/{frame}.png'})
+        raw = {'id': str(subject), 'metadata': {'#width': str(size[0]), '#height': str(size[1])}, 'locations': locations}
+        server.routes[f'/api/subjects/{subject}'] = (200, {}, json.dumps({'subjects': [raw]}).encode(), 0)
+
+
+def count_requests(server, path):
+    return len([request for request, _ in server.requests if request == path])
+
+
+def test_frame_store_bounded(server, tmp_path):
+    # only the last max_open subjects are kept memory-mapped
+    add_subjects(server, range(4))
+    fetcher = Fetcher(backoff=0.01, api_url=f'{server.url}/api')
+    store = FrameStore(str(tmp_path), max_open=2)
+    store.populate(range(4), fetcher)
+
+    for subject in [0, 1, 0, 2, 3, 0]:
+        assert store.get_subject_frames(subject, fetch=False).shape == (15, 48, 64, 3)
+        assert len(store.frames) <= 2
+        assert next(reversed(store.frames)) == subject
+
+    assert list(store.frames) == [3, 0]
+
+
+def test_get_subject_image_without_store(server, tmp_path, monkeypatch):
+    # without a store, the frames are fetched even if there is a frame store in the working directory
+    add_subjects(server, [1])
+    fetcher = Fetcher(backoff=0.01, api_url=f'{server.url}/api')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(workflow, 'frame_cache', type(workflow.frame_cache)())
+    FrameStore('frame_store').add_subject(1, fetcher)
+    server.requests.clear()
+
+    img = workflow.get_subject_image(1, 7, fetcher)
+
+    assert not isinstance(img, np.memmap) and img.shape == (48, 64, 3)
+    assert count_requests(server, '/1/7.png') == 1
+
+
+def test_prefetch_subjects_in_memory(server, tmp_path, monkeypatch):
+    # only the requested frames are fetched (once per subject) into the
+    # frame cache, and nothing is written to disk
+    add_subjects(server, [1, 2, 3])
+    fetcher = Fetcher(backoff=0.01, api_url=f'{server.url}/api')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(workflow, 'frame_cache', type(workflow.frame_cache)())
+
+    results = list(workflow.prefetch_subjects([1, 2, 1, 3, 2], [7], nprefetch=2, fetcher=fetcher))
+
+    assert [subject for subject, _, _ in results] == [1, 2, 3]
+    assert all(error is None and len(images) == 1 and images[0].shape == (48, 64, 3) for _, images, error in results)
+    for subject in [1, 2, 3]:
+        assert count_requests(server, f'/api/subjects/{subject}') == 1
+        assert [count_requests(server, f'/{subject}/{frame}.png') for frame in range(15)] == [0] * 7 + [1] + [0] * 7
+        assert workflow.get_subject_image(subject, 7, fetcher) is results[[1, 2, 3].index(subject)][1][0]
+    assert len(server.requests) == 6
+    assert os.listdir(tmp_path) == []
+
+
+def test_prefetch_subjects_bounded(server, monkeypatch):
+    # the subjects fetched ahead always fit in the frame cache
+    add_subjects(server, range(10))
+    fetcher = Fetcher(backoff=0.01, api_url=f'{server.url}/api')
+    monkeypatch.setattr(workflow, 'frame_cache', type(workflow.frame_cache)())
+    # room for 32 of the 64x48 frames
+    monkeypatch.setattr(workflow, 'FRAME_CACHE_BYTES', 32 * 48 * 64 * 3)
+
+    for subject, images, error in workflow.prefetch_subjects(range(10), range(15), nprefetch=8, fetcher=fetcher):
+        assert sum(img.nbytes for img in workflow.frame_cache.values()) <= workflow.FRAME_CACHE_BYTES
+        assert all(workflow.get_subject_image(subject, frame, fetcher) is images[frame] for frame in range(15))
+
+    assert all(count_requests(server, f'/{subject}/{frame}.png') == 1 for subject in range(10) for frame in range(15))
+
+
+def test_prefetch_subjects_error(server, monkeypatch):
+    # a subject that cannot be fetched is returned with its error, and does not stop the others
+    add_subjects(server, [1, 3])
+    fetcher = Fetcher(retries=0, backoff=0.01, api_url=f'{server.url}/api')
+    monkeypatch.setattr(workflow, 'frame_cache', type(workflow.frame_cache)())
+
+    results = list(workflow.prefetch_subjects([1, 2, 3], [0], fetcher=fetcher))
+
+    assert [subject for subject, _, _ in results] == [1, 2, 3]
+    assert results[0][2] is None and results[2][2] is None
+    assert results[1][1] is None and isinstance(results[1][2], requests.HTTPError)
+
+
+def test_prefetch_subjects_with_store(server, tmp_path):
+    # with a store, all the frames are saved to disk and read from there
+    add_subjects(server, [1, 2])
+    fetcher = Fetcher(backoff=0.01, api_url=f'{server.url}/api')
+    store = FrameStore(str(tmp_path))
+
+    results = list(workflow.prefetch_subjects([1, 2], [0, 7], store=store, fetcher=fetcher))
+
+    assert sorted(os.listdir(tmp_path)) == ['1.npy', '2.npy']
+    for subject, images, error in results:
+        assert error is None and all(isinstance(img, np.memmap) for img in images)
+        assert all(count_requests(server, f'/{subject}/{frame}.png') == 1 for frame in range(15))
+        assert np.array_equal(workflow.get_subject_image(subject, 7, fetcher, store=store), images[1])
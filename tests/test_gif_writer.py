@@ -0,0 +1,113 @@
+import os
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+import numpy as np
+from PIL import Image, ImageSequence
+from solarjets_common.gif_writer import GifStreamWriter, is_up_to_date, render_gifs
+
+matplotlib.use('Agg')
+
+
+def write_gif(item, output, fps=5):
+    '''
+        Write a gif with `item` frames, each filled with a different color
+    '''
+    fig, ax = plt.subplots(1, 1, figsize=(2, 1.5), dpi=50)
+    img = ax.imshow(np.zeros((4, 4, 3)), vmin=0, vmax=1)
+
+    def animate(i):
+        img.set_data(np.full((4, 4, 3), [i / item, 1 - i / item, 0.5]))
+        return [img]
+
+    ani = animation.FuncAnimation(fig, animate, frames=item, blit=True, cache_frame_data=False)
+    ani.save(output, writer=GifStreamWriter(fps=fps))
+    plt.close(fig)
+
+
+def fail(item, output):
+    with open(output, 'w') as outfile:
+        outfile.write('partial')
+    raise RuntimeError(f'could not render {item}')
+
+
+def test_gif_stream_writer(tmp_path):
+    write_gif(6, str(tmp_path / 'test.gif'), fps=4)
+
+    with Image.open(tmp_path / 'test.gif') as gif:
+        assert gif.format == 'GIF'
+        assert gif.n_frames == 6
+        assert gif.size == (100, 75)
+        assert gif.info['loop'] == 0
+
+        frames = []
+        for frame in ImageSequence.Iterator(gif):
+            assert frame.info['duration'] == 250
+            frames.append(np.asarray(frame.convert('RGB')))
+
+    # each frame has its own colors
+    assert len({frame[37, 50].tobytes() for frame in frames}) == 6
+
+
+def set_mtime(path, mtime):
+    os.utime(path, (mtime, mtime))
+
+
+def test_is_up_to_date(tmp_path):
+    source = str(tmp_path / 'clusters.json')
+    output = str(tmp_path / 'jet.gif')
+    for path in [source, output]:
+        with open(path, 'w') as outfile:
+            outfile.write('')
+
+    assert not is_up_to_date(str(tmp_path / 'missing.gif'), [source])
+    assert is_up_to_date(output)
+
+    set_mtime(source, 1000)
+    set_mtime(output, 2000)
+    assert is_up_to_date(output, [source])
+
+    set_mtime(source, 3000)
+    assert not is_up_to_date(output, [source])
+
+
+def test_render_gifs(tmp_path):
+    # the gifs newer than the source are skipped and the stale or
+    # missing ones are rendered again
+    source = str(tmp_path / 'clusters.json')
+    with open(source, 'w') as outfile:
+        outfile.write('')
+    set_mtime(source, 2000)
+
+    outputs = [str(tmp_path / f'{i}.gif') for i in range(3)]
+    for output, mtime in zip(outputs[:2], [3000, 1000]):
+        with open(output, 'w') as outfile:
+            outfile.write('old')
+        set_mtime(output, mtime)
+
+    times, errors, skipped = render_gifs(write_gif, [2, 3, 4], outputs, processes=1, cache_dir=None, sources=[source])
+
+    assert skipped == [outputs[0]]
+    assert sorted(times) == outputs[1:] and len(errors) == 0
+    with open(outputs[0]) as infile:
+        assert infile.read() == 'old'
+    for output, nframes in zip(outputs[1:], [3, 4]):
+        with Image.open(output) as gif:
+            assert gif.n_frames == nframes
+
+    # everything is rendered with overwrite
+    times, errors, skipped = render_gifs(write_gif, [2, 3, 4], outputs, processes=2, cache_dir=None,
+                                         sources=[source], overwrite=True)
+    assert sorted(times) == outputs and len(skipped) == 0
+    with Image.open(outputs[0]) as gif:
+        assert gif.n_frames == 2
+
+
+def test_render_gifs_error(tmp_path):
+    # a failed render leaves neither the output nor its partial file behind
+    output = str(tmp_path / 'jet.gif')
+
+    times, errors, skipped = render_gifs(fail, [1], [output], processes=1, cache_dir=None)
+
+    assert len(times) == 0 and isinstance(errors[output], RuntimeError)
+    assert os.listdir(tmp_path) == []
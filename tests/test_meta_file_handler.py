@@ -0,0 +1,120 @@
+import json
+import datetime
+import importlib
+import numpy as np
+import pytest
+from astropy.table import Table
+from dateutil.parser import parse
+
+# the metadata handling code is the same in both workflows
+PACKAGES = ['BoxTheJets.aggregation.meta_file_handler', 'JetOrNot.aggregation.meta_file_handler']
+
+FILENAMES = [
+    'ssw_cutout_20110101_000007_aia_304_.png',
+    'ssw_cutout_20121231_235959_aia_304_0001.png',
+    'ssw_cutout_20120229_120000_aia_304_.png',
+    # not the standard prefix, so the name is split on the underscores instead
+    'cutout_x_20140105_101010_aia_304_.png',
+]
+
+MALFORMED = [
+    'ssw_cutout_20110230_000000_aia_304_.png',
+    'ssw_cutout_20110101_250000_aia_304_.png',
+    'ssw_cutout_2011010_000007_aia_304_.png',
+    'ssw_cutout_20110101_0000_aia_304_.png',
+    'ssw_cutout_2011O101_000007_aia_304_.png',
+    'image.png',
+    '',
+]
+
+
+@pytest.fixture(params=PACKAGES)
+def meta_file_handler(request):
+    return importlib.import_module(request.param)
+
+
+def test_convert_fileNames_to_datetime64(meta_file_handler):
+    # the same times as parsing the date and time parts of each name with dateutil
+    times = meta_file_handler.convert_fileNames_to_datetime64(FILENAMES)
+
+    assert times.dtype == np.dtype('datetime64[s]')
+    for name, time in zip(FILENAMES, times):
+        date, time_of_day = name.split('_')[2:4]
+        assert time.astype(datetime.datetime) == parse(f'{date}T{time_of_day}')
+        assert meta_file_handler.convert_fileName_to_datetime(name) == parse(f'{date}T{time_of_day}')
+
+
+def test_convert_fileNames_to_datetime64_malformed(meta_file_handler):
+    # invalid names give NaT, without affecting the valid names around them
+    times = meta_file_handler.convert_fileNames_to_datetime64([FILENAMES[0], *MALFORMED, FILENAMES[1]])
+
+    assert np.all(np.isnat(times[1:-1]))
+    assert times[0] == np.datetime64('2011-01-01T00:00:07')
+    assert times[-1] == np.datetime64('2012-12-31T23:59:59')
+    assert all(meta_file_handler.convert_fileName_to_datetime(name) == '' for name in MALFORMED)
+
+
+def test_convert_fileNames_to_datetime64_empty(meta_file_handler):
+    for names in [[], np.array([], dtype=str)]:
+        times = meta_file_handler.convert_fileNames_to_datetime64(names)
+        assert times.dtype == np.dtype('datetime64[s]') and len(times) == 0
+
+
+def test_strings_to_datetime64(meta_file_handler):
+    strings = ['2011-01-01 00:00:07', '2012-02-29 23:59:59.500000', '']
+    times = meta_file_handler.strings_to_datetime64(strings)
+    assert times.dtype == np.dtype('datetime64[us]')
+    assert times[0].astype(datetime.datetime) == datetime.datetime(2011, 1, 1, 0, 0, 7)
+    assert times[1].astype(datetime.datetime) == datetime.datetime.fromisoformat(strings[1])
+    assert np.isnat(times[2])
+
+    # an invalid string only gives NaT for that entry
+    times = meta_file_handler.strings_to_datetime64(['2011-01-01 00:00:07', 'not a date'])
+    assert times[0] == np.datetime64('2011-01-01T00:00:07') and np.isnat(times[1])
+
+    assert len(meta_file_handler.strings_to_datetime64([])) == 0
+
+
+def subjects_export(rng, subjects):
+    '''
+        Zooniverse subjects export with the metadata of each subject, where some
+        subjects are missing keys, repeated (the last row is used) or missing
+    '''
+    keys = ['#sol_standard', '#width', '#height', '#naxis1', '#naxis2', '#cunit1', '#cunit2', '#crval1', '#crval2',
+            '#cdelt1', '#cdelt2', '#crpix1', '#crpix2', '#crota2', '#im_ll_x', '#im_ll_y', '#im_ur_x', '#im_ur_y']
+    rows = []
+    for subject in subjects:
+        start = datetime.datetime(2011, 1, 1) + datetime.timedelta(seconds=int(rng.integers(0, 10**8)))
+        metadata = {key: str(round(float(rng.uniform(0, 2000)), 2)) for key in keys}
+        metadata['#sol_standard'] = f'SOL{start:%Y-%m-%dT%H:%M:%S}L000C000'
+        metadata['#file_name_0'] = f'ssw_cutout_{start:%Y%m%d_%H%M%S}_aia_304_.png'
+        metadata['#file_name_14'] = f'ssw_cutout_{start + datetime.timedelta(minutes=12):%Y%m%d_%H%M%S}_aia_304_.png'
+        if subject % 7 == 0:
+            del metadata['#crota2']
+        if subject % 11 == 0:
+            rows.append((subject, json.dumps({**metadata, '#width': '1'})))
+        if subject % 13 != 0:
+            rows.append((subject, json.dumps(metadata)))
+
+    return Table(rows=rows, names=['subject_id', 'metadata'])
+
+
+def test_create_metadata_jsonfile_processes(meta_file_handler, tmp_path):
+    # the metafile is the same whether the subjects are parsed in worker processes or not,
+    # and has the same entries as parsing each subject with `create_subjectinfo`
+    rng = np.random.default_rng(41)
+    subjects = np.arange(1, 40)
+    subjectsdata = subjects_export(rng, subjects)
+
+    meta_file_handler.create_metadata_jsonfile(str(tmp_path / 'serial.json'), subjects, subjectsdata, processes=1)
+    meta_file_handler.create_metadata_jsonfile(str(tmp_path / 'parallel.json'), subjects, subjectsdata,
+                                               processes=3, chunk_size=4)
+
+    with open(tmp_path / 'serial.json') as infile:
+        serial = infile.read()
+    with open(tmp_path / 'parallel.json') as infile:
+        assert infile.read() == serial
+
+    expected = [{'subjectId': int(subject), 'data': meta_file_handler.create_subjectinfo(subject, subjectsdata)}
+                for subject in subjects]
+    assert json.loads(serial) == expected
@@ -0,0 +1,109 @@
+import os
+import sys
+import csv
+import numpy as np
+import requests
+from astropy.table import Table, MaskedColumn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BoxTheJets'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BoxTheJets', 'scripts'))
+
+import normalize_subject_size  # noqa: E402
+from normalize_subject_size import rescale_extracts, read_checkpoint  # noqa: E402
+from aggregation.workflow import parse_list_column  # noqa: E402
+
+
+def scale_table(scales):
+    '''
+        Table of the scales of each frame of the subjects (subject -> scale)
+    '''
+    table = Table({'subject_id': list(scales)})
+    for frame in range(15):
+        table[f'frame_{frame}_scale'] = [scale for scale in scales.values()]
+    return table
+
+
+def test_rescale_extracts_invalid_entry():
+    # an invalid entry sends the column through the row-by-row path,
+    # which has to write plain floats, like the bulk path
+    data = Table({'subject_id': [1, 2, 1, 3], 'task': ['T1', 'T1', 'T1', 'T1']})
+    data['data.frame0.T1_tool0_x'] = MaskedColumn(['[5.0, 10.0]', 'None', '[2, 4.5]', '[8.0]'],
+                                                  mask=[False, False, False, False])
+    data['data.frame1.T1_tool0_x'] = MaskedColumn(['[5.0, 10.0]', '', '[2, 4.5]', ''],
+                                                  mask=[False, True, False, True])
+
+    data_sc = rescale_extracts(data, scale_table({1: 0.5, 2: 2.}), ['tool0'], ['x'])
+
+    assert list(data_sc['data.frame0.T1_tool0_x']) == ['[10.0, 20.0]', 'None', '[4.0, 9.0]', '[8.0]']
+
+    # the valid rows can be read back by the aggregation
+    values, offsets = parse_list_column(data_sc['data.frame0.T1_tool0_x'][[0, 2, 3]])
+    assert values.dtype == np.float64
+    assert values.tolist() == [10., 20., 4., 9., 8.]
+    assert offsets.tolist() == [0, 2, 4, 5]
+
+    # and the columns parsed in bulk give the same strings
+    assert list(data_sc['data.frame1.T1_tool0_x'][[0, 2]]) == ['[10.0, 20.0]', '[4.0, 9.0]']
+
+
+def test_get_scales_set_resume(tmp_path, monkeypatch):
+    # a checkpoint left by a killed run: two complete rows, a malformed
+    # row and a last row which was cut off in the middle
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('extracts')
+    os.makedirs('configs')
+    subjects = [101, 102, 103, 104, 105, 106]
+    Table({'subject_id': subjects + [101]}).write('extracts/point_extractor_by_frame_box_the_jets.csv')
+
+    names = ['subject_id', *[f'frame_{i}_scale' for i in range(15)]]
+    checkpoint = 'configs/subject_scales_checkpoint.csv'
+    with open(checkpoint, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(names)
+        writer.writerow([101, *[1.] * 15])
+        writer.writerow([103, *[0.5] * 15])
+        writer.writerow([104, 'not a number', *[1.] * 14])
+        outfile.write('105,1.0,1.0')
+
+    fetched = []
+
+    def get_subject_scale(subject, fetcher=None):
+        fetched.append(subject)
+        if subject == 106:
+            raise requests.HTTPError('404 Client Error: Not Found')
+        return [subject, *[2.] * 15]
+
+    monkeypatch.setattr(normalize_subject_size, 'get_subject_scale', get_subject_scale)
+
+    table, failed = normalize_subject_size.get_scales_set(max_workers=2, checkpoint=checkpoint)
+
+    # only the subjects missing from the checkpoint are fetched, and the
+    # subject which is not found is not retried
+    assert sorted(fetched) == [102, 104, 105, 106]
+    assert list(failed) == [106]
+    assert list(table['subject_id']) == [101, 102, 103, 104, 105]
+    assert list(table['frame_0_scale']) == [1., 2., 0.5, 2., 2.]
+
+    # the new rows are appended after the partial row, which is skipped
+    rows = read_checkpoint(checkpoint, len(names))
+    assert sorted(rows) == [101, 102, 103, 104, 105]
+    assert rows[105] == [105, *[2.] * 15]
+    with open(checkpoint, newline='') as infile:
+        lines = list(csv.reader(infile))
+    assert lines[4] == ['105', '1.0', '1.0']
+    assert all(len(line) == len(names) for line in lines[5:]) and len(lines) == 8
+
+    # the next run only retries the failed subject, and saves the table once it succeeds
+    fetched.clear()
+
+    def get_subject_scale(subject, fetcher=None):
+        fetched.append(subject)
+        return [subject, *[3.] * 15]
+
+    monkeypatch.setattr(normalize_subject_size, 'get_subject_scale', get_subject_scale)
+
+    table, failed = normalize_subject_size.get_scales_set(max_workers=2, checkpoint=checkpoint)
+
+    assert fetched == [106] and len(failed) == 0
+    assert list(table['subject_id']) == subjects
+    assert os.path.exists('configs/subject_scales.csv') and not os.path.exists(checkpoint)
@@ -0,0 +1,182 @@
+import os
+import csv
+import datetime
+import importlib
+import numpy as np
+import pytest
+from astropy.table import Table
+
+# the question reducer code is the same in both workflows
+PACKAGES = ['BoxTheJets.aggregation.questionresult', 'JetOrNot.aggregation.questionresult']
+
+
+def count_jets_loop(A, t):
+    '''
+        Reference implementation: the original `QuestionResult.count_jets` loop
+    '''
+    L = ''
+    start = ''
+    end = ''
+    tel = 0
+    prev = 'n'
+    switch = 0
+    for i in range(len(A)):
+        f1 = '0'
+        f2 = '0'
+        a = A[i]
+        if prev != a:
+            if a == 'y':
+                tel += 1
+                start += str(t[i]) + ' '
+                s = i
+            else:
+                end += str(t[i]) + ' '
+                if np.abs(t[i] - t[s]) < datetime.timedelta(minutes=6):
+                    f1 = '1'
+            switch += 1
+            prev = a
+        else:
+            switch = 0
+
+        if switch > 1:
+            f2 = '1'
+            switch = 0
+        if f1 + f2 != '00':
+            L = L + ' ' + f1 + f2 + ' ' + str(t[i])
+
+    return tel, L, start, end
+
+
+def csv_SOL_loop(question_result, SOL, obs_time, Ans, agreement, task, filenames, end_time):
+    '''
+        Reference implementation: the original `QuestionResult.csv_SOL` loop (with
+        `count_jets_loop`), which expects the rows of each SOL event to be contiguous
+    '''
+    open('subjects_{}.csv'.format(task), 'w')
+    start_i = 0
+    f = open('SOL_{}_stats.csv'.format(task), 'w')
+    writer = csv.writer(f)
+    writer.writerow(['#SOL-event', 'subjects in event', 'filename0', 'times subjects', 'number of jet clusters',
+                     'start event', 'end event', 'Flagged jets'])
+    while start_i < len(SOL):
+        I = SOL == SOL[start_i]
+        C, N, start, end = count_jets_loop(Ans[I], obs_time[I])
+        S = np.array(question_result.data['subject_id'][I], dtype=str)
+        S2 = ' '.join(S)
+        T = obs_time[I]
+        T2 = ' '.join(np.asarray(T, dtype=str))
+        F = filenames[I]
+        F2 = ' '.join(np.asarray(F, dtype=str))
+        E = end_time[I]
+        A = Ans[I]
+        Ag = agreement[I]
+        sol_event = SOL[I]
+        with open('subjects_{}.csv'.format(task), 'a') as csvfile:
+            np.savetxt(csvfile, np.column_stack((S, T, E, A, Ag, F, sol_event)), delimiter=",", newline='\n', fmt='%s')
+        writer.writerow([SOL[start_i], S2, F2, T2, C, start, end, N])
+        start_i = np.max(np.where(I == True)) + 1  # noqa: E712
+    f.close()
+
+
+def random_answers(rng, n):
+    '''
+        Random answers (with runs of 'y' and 'n' of varying length) and increasing
+        subject times, as datetime objects like `QuestionResult.obs_time` returns
+    '''
+    p_yes = rng.uniform(0.1, 0.9)
+    A = np.where(rng.uniform(size=n) < p_yes, 'y', 'n')
+    steps = rng.choice([1, 2, 3, 5, 6, 7, 12], size=n) * 60 + rng.integers(0, 60, n)
+    t0 = datetime.datetime(2012, 1, 1) + datetime.timedelta(days=int(rng.integers(0, 3000)))
+    t = np.array([t0 + datetime.timedelta(seconds=int(step)) for step in np.cumsum(steps)], dtype=object)
+    return A, t
+
+
+@pytest.fixture(params=PACKAGES)
+def questionresult(request):
+    return importlib.import_module(request.param)
+
+
+def test_count_jets_matches_loop(questionresult):
+    rng = np.random.default_rng(34)
+    data = Table({'subject_id': [1], 'data.yes': [1], 'data.no': [0]})
+    question_result = questionresult.QuestionResult(data)
+
+    for _ in range(2000):
+        A, t = random_answers(rng, int(rng.integers(0, 40)))
+        assert question_result.count_jets(A, t) == count_jets_loop(A, t)
+
+
+def test_find_jet_sequences_groups(questionresult):
+    # all the groups at once give the same result as the loop on each group,
+    # including when the rows of a group are not contiguous
+    rng = np.random.default_rng(340)
+
+    for _ in range(200):
+        A, t = random_answers(rng, int(rng.integers(1, 200)))
+        groups = np.sort(rng.integers(0, 5, len(A)))
+        if rng.uniform() < 0.5:
+            groups = rng.permutation(groups)
+
+        sequences, flags = questionresult.find_jet_sequences(A, t, groups)
+
+        for g, group in enumerate(np.unique(groups)):
+            mask = groups == group
+            tel, L, start, end = questionresult.format_jet_sequences(sequences[sequences['group'] == g],
+                                                                   flags[flags['group'] == g], t)
+            assert (tel, L, start, end) == count_jets_loop(A[mask], t[mask])
+            assert sequences['length'][sequences['group'] == g].sum() == np.sum(A[mask] == 'y')
+
+
+def random_events(rng, nevents):
+    '''
+        Random subjects of `nevents` SOL events, with the rows of each event
+        contiguous and in time order, but the events in a random order
+    '''
+    SOL, obs_time, Ans = [], [], []
+    names = [f'SOL2012-{month:02d}-{day:02d}T00:00:00L{lon:03d}C{lat:03d}'
+             for month, day, lon, lat in rng.integers([1, 1, 0, 0], [13, 29, 360, 180], (nevents, 4))]
+    for name in names:
+        A, t = random_answers(rng, int(rng.integers(1, 30)))
+        SOL.extend([name] * len(A))
+        obs_time.extend(t)
+        Ans.extend(A)
+
+    n = len(SOL)
+    obs_time = np.array(obs_time, dtype=object)
+    end_time = np.array([t + datetime.timedelta(minutes=5) for t in obs_time], dtype=object)
+    filenames = np.array([f'ssw_cutout_{t:%Y%m%d_%H%M%S}_aia_304_.png' for t in obs_time])
+    agreement = np.round(rng.uniform(0.5, 1, n), 3)
+    return np.array(SOL), obs_time, np.array(Ans), agreement, filenames, end_time
+
+
+@pytest.mark.parametrize('interleaved', [False, True])
+def test_csv_SOL_matches_loop(questionresult, tmp_path, monkeypatch, interleaved):
+    # the events are not sorted by name, and (if interleaved) their rows are shuffled.
+    # The result is the same as the loop on the rows grouped by event, in the
+    # order of their first appearance
+    rng = np.random.default_rng(33)
+    for i in range(20):
+        SOL, obs_time, Ans, agreement, filenames, end_time = random_events(rng, int(rng.integers(1, 8)))
+        subjects = np.arange(80000000, 80000000 + len(SOL))
+        grouped = np.arange(len(SOL))
+        order = rng.permutation(len(SOL)) if interleaved else grouped
+        if interleaved:
+            first = {name: np.flatnonzero(SOL[order] == name).min() for name in np.unique(SOL)}
+            grouped = order[np.argsort([first[name] for name in SOL[order]], kind='stable')]
+
+        for path, rows in [('functions', order), ('loop', grouped)]:
+            os.makedirs(tmp_path / f'{path}{i}')
+            monkeypatch.chdir(tmp_path / f'{path}{i}')
+            data = Table({'subject_id': subjects[rows], 'data.yes': [1] * len(rows), 'data.no': [0] * len(rows)})
+            question_result = questionresult.QuestionResult(data)
+            args = (SOL[rows], obs_time[rows], Ans[rows], agreement[rows])
+            if path == 'loop':
+                csv_SOL_loop(question_result, *args, 'Jet', filenames[rows], end_time[rows])
+            else:
+                question_result.csv_SOL(*args, None, None, 'Jet', filenames[rows], end_time[rows])
+
+        for name in ['subjects_Jet.csv', 'SOL_Jet_stats.csv']:
+            with open(tmp_path / f'loop{i}' / name) as infile:
+                expected = infile.read()
+            with open(tmp_path / f'functions{i}' / name) as infile:
+                assert infile.read() == expected
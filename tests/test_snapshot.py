@@ -0,0 +1,91 @@
+import os
+import sys
+import numpy as np
+import pytest
+from astropy.table import MaskedColumn
+from BoxTheJets.aggregation.workflow import Aggregator, parse_list_column
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from synthetic import write_synthetic_data  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    return write_synthetic_data(str(tmp_path_factory.mktemp('data')), 40, 15, noise=0.2)
+
+
+def load_aggregator(dataset):
+    aggregator = Aggregator(dataset['points'], dataset['box'])
+    aggregator.load_extractor_data(dataset['point_extracts'], dataset['box_extracts'])
+    return aggregator
+
+
+def assert_data_equal(data, expected):
+    assert data.keys() == expected.keys()
+    for key in expected:
+        assert data[key].dtype == expected[key].dtype, key
+        assert np.array_equal(data[key], expected[key]), key
+
+
+@pytest.mark.parametrize('checksum', [False, True])
+def test_snapshot_matches_csv(dataset, tmp_path, checksum):
+    aggregator = load_aggregator(dataset)
+    aggregator.save_snapshot(str(tmp_path / 'snapshot'), checksum=checksum)
+    snapshot = Aggregator.from_snapshot(str(tmp_path / 'snapshot'))
+
+    assert len(snapshot.box_parsed) > 0 and len(snapshot.points_parsed) > 0
+    assert np.array_equal(snapshot.get_subjects(), aggregator.get_subjects())
+
+    for subject in aggregator.get_subjects():
+        for task in ['T1', 'T5']:
+            for method in ['get_box_data', 'get_points_data']:
+                for data, expected in zip(getattr(snapshot, method)(subject, task),
+                                          getattr(aggregator, method)(subject, task)):
+                    assert_data_equal(data, expected)
+
+        jets = snapshot.filter_classifications(subject)
+        expected = aggregator.filter_classifications(subject)
+        assert len(jets) == len(expected)
+        for jet, jet_expected in zip(jets, expected):
+            assert np.array_equal(jet.start, jet_expected.start)
+            assert np.array_equal(jet.end, jet_expected.end)
+            assert jet.box.equals(jet_expected.box)
+            assert jet.box_extracts == jet_expected.box_extracts
+            assert jet.start_extracts == jet_expected.start_extracts
+            assert jet.end_extracts == jet_expected.end_extracts
+
+
+def test_parse_list_column_empty():
+    # empty lists are float arrays, like `np.asarray([])` for the CSV data
+    columns = [np.array(['[]', '[]']), np.array(['[]', '[]'], dtype=object),
+               MaskedColumn(['[1]', '[2]'], mask=[True, True])]
+    for column in columns:
+        values, offsets = parse_list_column(column)
+        assert values.dtype == np.float64 and len(values) == 0
+        assert offsets.tolist() == [0] * (len(column) + 1)
+
+
+@pytest.mark.parametrize('checksum', [False, True])
+def test_snapshot_stale(dataset, tmp_path, checksum):
+    # copy the reduced files, so that they can be changed after the snapshot is saved
+    files = dict(dataset)
+    for key in ['points', 'box', 'point_extracts', 'box_extracts']:
+        files[key] = str(tmp_path / os.path.basename(dataset[key]))
+        with open(dataset[key], 'rb') as infile, open(files[key], 'wb') as outfile:
+            outfile.write(infile.read())
+
+    load_aggregator(files).save_snapshot(str(tmp_path / 'snapshot'), checksum=checksum)
+    Aggregator.from_snapshot(str(tmp_path / 'snapshot'))
+
+    with open(files['box'], 'a') as outfile:
+        outfile.write('\n')
+    with pytest.raises(ValueError, match='out of date'):
+        Aggregator.from_snapshot(str(tmp_path / 'snapshot'))
+
+    # the stale snapshot can still be loaded without the check
+    Aggregator.from_snapshot(str(tmp_path / 'snapshot'), validate=False)
+
+    os.remove(files['points'])
+    with pytest.raises(ValueError, match='not found'):
+        Aggregator.from_snapshot(str(tmp_path / 'snapshot'))
@@ -0,0 +1,126 @@
+import os
+import sys
+import ast
+import shutil
+import numpy as np
+import pytest
+from astropy.io import ascii
+from astropy.table import Table, MaskedColumn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'BoxTheJets', 'scripts'))
+
+from squash_frames import squash_extracts  # noqa: E402
+
+
+def squash_script(file, empty_value):
+    '''
+        Reference implementation: the original squash_frames.py script, for the point
+        (empty_value='N/A') or the shape (empty_value='None') extractor file
+    '''
+    data = ascii.read(file, delimiter=',')
+
+    # fixing FixedWidth errors
+    for col in data.itercols():
+        data.replace_column(col.name, col.astype('object'))
+
+    colnames = data.colnames
+    # get the col names for each variable in frame0
+    col0 = sorted([i for i in colnames if 'frame0' in i])
+
+    for k, col0k in enumerate(col0):
+        for j in range(1, 15):
+            coltype = col0k.replace('frame0', 'frame%d' % j)
+            data[coltype].fill_value = empty_value
+            if empty_value == 'N/A':
+                mask = np.asarray(data[coltype][:].filled()) != 'N/A'
+                data[col0[k]][mask] = data[coltype][mask]
+                data[coltype][mask] = ''
+            else:
+                mask = np.asarray(data[coltype][:].filled()) == 'None'
+                data[col0[k]][~mask] = data[coltype][~mask]
+                data[coltype][~mask] = ''
+
+    # get the col names for each variable in frame0 in T1
+    col0 = sorted([i for i in colnames if 'frame0.T1' in i])
+
+    data_merged = data.copy()
+
+    for k, col0k in enumerate(col0):
+        colT5 = col0k.replace('T1', 'T5')
+        data_merged[colT5].fill_value = 'N/A'
+
+        # find the rows where there is data
+        mask = np.where(np.asarray(data_merged[colT5][:].filled()) != 'N/A')[0]
+
+        for row in mask:
+            classification_id = data_merged['classification_id'][row]
+            row_T1 = np.where((data_merged['classification_id'][:] == classification_id) & (data_merged['task'][:] == 'T1'))[0][0]
+            try:
+                dataT1 = ast.literal_eval(data_merged[col0k][row_T1])
+            except ValueError:
+                dataT1 = []
+
+            dataT5 = ast.literal_eval(data_merged[colT5][row])
+
+            # combine the T5 info with T1
+            outdata = []
+            outdata.extend(dataT1)
+            outdata.extend(dataT5)
+
+            data_merged[col0[k]][row_T1] = str(outdata)
+
+            # and delete the other row
+            data_merged[colT5][row] = ''
+
+    ascii.write(data, file.replace('.csv', '_squashed.csv'), overwrite=True, delimiter=',')
+    ascii.write(data_merged, file.replace('.csv', '_squashed_merged.csv'), overwrite=True, delimiter=',')
+
+
+def write_extracts(file, keys, nclassifications, seed=0):
+    '''
+        Write a random extractor file: every classification has a T1 row and some have
+        a T5 row, with the extracts in random frames. Some columns are empty in every row
+    '''
+    rng = np.random.default_rng(seed)
+
+    classification_ids = np.repeat(np.arange(1000, 1000 + nclassifications), 2)
+    tasks = np.tile(['T1', 'T5'], nclassifications)
+    keep = (tasks == 'T1') | (rng.uniform(size=len(tasks)) < 0.4)
+    order = rng.permutation(np.flatnonzero(keep))
+
+    table = Table({'classification_id': classification_ids[order], 'task': tasks[order],
+                   'subject_id': 80000000 + classification_ids[order] % 7})
+    for task in ['T1', 'T5']:
+        for frame in range(15):
+            for key in keys:
+                name = f'data.frame{frame}.{task}_{key}'
+                values = [str([round(float(val), 2) for val in rng.uniform(0, 1000, rng.integers(1, 3))])
+                          for _ in range(len(table))]
+                drawn = (table['task'] == task) & (rng.uniform(size=len(table)) < 0.15)
+                if frame in [3, 11]:
+                    drawn[:] = False
+                table[name] = MaskedColumn(values, mask=~drawn)
+
+    ascii.write(table, file, delimiter=',', overwrite=True)
+
+
+@pytest.mark.parametrize('keys, empty_value', [
+    (['tool0_x', 'tool0_y', 'tool1_x', 'tool1_y'], 'N/A'),
+    (['tool2_x', 'tool2_y', 'tool2_width', 'tool2_height', 'tool2_angle'], 'None'),
+])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_squash_extracts_matches_script(tmp_path, keys, empty_value, seed):
+    os.makedirs(tmp_path / 'script')
+    os.makedirs(tmp_path / 'functions')
+
+    write_extracts(str(tmp_path / 'script' / 'extracts.csv'), keys, 60, seed)
+    shutil.copy(tmp_path / 'script' / 'extracts.csv', tmp_path / 'functions' / 'extracts.csv')
+
+    squash_script(str(tmp_path / 'script' / 'extracts.csv'), empty_value)
+    squash_extracts(str(tmp_path / 'functions' / 'extracts.csv'), empty_value)
+
+    for suffix in ['_squashed.csv', '_squashed_merged.csv']:
+        with open(tmp_path / 'script' / f'extracts{suffix}') as infile:
+            expected = infile.read()
+        with open(tmp_path / 'functions' / f'extracts{suffix}') as infile:
+            assert infile.read() == expected